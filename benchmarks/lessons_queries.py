@@ -0,0 +1,260 @@
+"""Latency of the routers/botapi/lessons.py queries before and after the
+hot lookup indexes (migration 4f2a9c1d7b3e)
+
+The target database is dropped and filled with a synthetic timetable, then
+every lesson getter is timed on the schema downgraded to the revision base
+and again after `upgrade head`. config.py is imported, so the usual DATABASE_*
+and JWT_SECRET variables have to be set; --url decides where the data goes.
+
+    python -m benchmarks.lessons_queries --url sqlite+aiosqlite:///bench.db
+    python -m benchmarks.lessons_queries --url mariadb+aiomysql://u:p@host/bench
+"""
+
+import argparse
+import asyncio
+import random
+from pathlib import Path
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from alembic import command
+from alembic.config import Config
+from extra.timetable_snapshot import TIMETABLE_SNAPSHOTS
+from models import database
+from routers.botapi import lessons
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+ROOT_DIR = Path(__file__).parent.parent
+DAYS = range(1, 7)
+LESSONS_PER_DAY = 7
+DATA_VERSION_COLUMN = (
+    "ALTER TABLE school ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0"
+)
+
+
+async def seed(engine, schools: int, teachers: int, subclasses: int):
+    async with engine.begin() as connection:
+        await connection.run_sync(database.Base.metadata.drop_all)
+        await connection.run_sync(database.Base.metadata.create_all)
+
+    rng = random.Random(0)
+    rows: Dict[str, List[Dict]] = {
+        "school": [],
+        "corpus": [],
+        "cabinet": [],
+        "teacher": [],
+        "subclass": [],
+        "lesson_number": [],
+        "lesson": [],
+        "lesson_subclass_association": [],
+    }
+    for school_id in range(1, schools + 1):
+        rows["school"].append({"id": school_id, "name": f"School number {school_id}"})
+        rows["corpus"].append(
+            {
+                "id": school_id,
+                "name": "Main",
+                "address": "Main street 1",
+                "school_id": school_id,
+            }
+        )
+        offset = (school_id - 1) * subclasses
+        for index in range(1, subclasses + 1):
+            rows["cabinet"].append(
+                {
+                    "id": offset + index,
+                    "floor": index % 4,
+                    "name": str(index),
+                    "corpus_id": school_id,
+                    "school_id": school_id,
+                }
+            )
+            rows["subclass"].append(
+                {
+                    "id": offset + index,
+                    "educational_level": 1 + index % 11,
+                    "identificator": chr(ord("A") + index // 11),
+                    "additional_identificator": "",
+                    "school_id": school_id,
+                }
+            )
+        for index in range(1, teachers + 1):
+            rows["teacher"].append(
+                {
+                    "id": (school_id - 1) * teachers + index,
+                    "name": f"Teacher {index}",
+                    "school_id": school_id,
+                }
+            )
+        for number in range(1, LESSONS_PER_DAY + 1):
+            rows["lesson_number"].append(
+                {
+                    "id": (school_id - 1) * LESSONS_PER_DAY + number,
+                    "number": number,
+                    "time_start": f"{7 + number:02}:00",
+                    "time_end": f"{7 + number:02}:45",
+                    "school_id": school_id,
+                }
+            )
+        for subclass in range(offset + 1, offset + subclasses + 1):
+            for day in DAYS:
+                for number in range(1, LESSONS_PER_DAY + 1):
+                    lesson_id = len(rows["lesson"]) + 1
+                    rows["lesson"].append(
+                        {
+                            "id": lesson_id,
+                            "day_of_week": day,
+                            "subject": "Subject",
+                            "lesson_number_id": (school_id - 1) * LESSONS_PER_DAY
+                            + number,
+                            "teacher_id": (school_id - 1) * teachers
+                            + rng.randint(1, teachers),
+                            "corpus_id": school_id,
+                            "cabinet_id": offset + rng.randint(1, subclasses),
+                            "school_id": school_id,
+                        }
+                    )
+                    rows["lesson_subclass_association"].append(
+                        {"lesson_id": lesson_id, "subclass_id": subclass}
+                    )
+
+    async with engine.begin() as connection:
+        for table, values in rows.items():
+            await connection.execute(
+                insert(database.Base.metadata.tables[table]), values
+            )
+    return len(rows["lesson"])
+
+
+async def migrate(engine, revision: str):
+    alembic_config = Config(str(ROOT_DIR / "alembic.ini"))
+    alembic_config.set_main_option("script_location", str(ROOT_DIR / "migrations"))
+
+    def run(connection):
+        alembic_config.attributes["connection"] = connection
+        if revision == "base":
+            command.stamp(alembic_config, "head")
+            command.downgrade(alembic_config, "base")
+        else:
+            command.upgrade(alembic_config, revision)
+
+    async with engine.begin() as connection:
+        await connection.run_sync(run)
+
+
+def requests(schools: int, teachers: int, subclasses: int, count: int):
+    rng = random.Random(1)
+    queries: Dict[str, List[Callable]] = {}
+    for _ in range(count):
+        school = rng.randint(1, schools)
+        teacher = (school - 1) * teachers + rng.randint(1, teachers)
+        subclass = (school - 1) * subclasses + rng.randint(1, subclasses)
+        day = rng.choice(DAYS)
+        for owner, kwargs in (
+            ("teacher", {"teacher_id": teacher, "subclass_id": None}),
+            ("subclass", {"teacher_id": None, "subclass_id": subclass}),
+        ):
+            queries.setdefault(f"/day by {owner}", []).append(
+                lambda session, kwargs=kwargs, school=school, day=day: (
+                    lessons.get_lesson_for_day(
+                        school_id=school, day_of_week=day, session=session, **kwargs
+                    )
+                )
+            )
+            queries.setdefault(f"/range by {owner}", []).append(
+                lambda session, kwargs=kwargs, school=school: (
+                    lessons.get_lesson_for_range(
+                        school_id=school,
+                        start_index=1,
+                        end_index=6,
+                        session=session,
+                        **kwargs,
+                    )
+                )
+            )
+    for _ in range(count):
+        school = rng.randint(1, schools)
+        subclass = (school - 1) * subclasses + rng.randint(1, subclasses)
+        day = rng.choice(DAYS)
+        number = rng.randint(1, LESSONS_PER_DAY)
+        queries.setdefault("/certain by subclass", []).append(
+            lambda session, school=school, subclass=subclass, day=day, number=number: (
+                lessons.get_certain_lesson(
+                    school_id=school,
+                    lesson_number=number,
+                    day_of_week=day,
+                    teacher_id=None,
+                    subclass_id=subclass,
+                    session=session,
+                )
+            )
+        )
+    return queries
+
+
+async def measure(session_factory, queries: Dict[str, List[Callable]]):
+    results: Dict[str, List[float]] = {}
+    for name, calls in queries.items():
+        timings = results.setdefault(name, [])
+        for call in calls:
+            async with session_factory() as session:
+                start = perf_counter()
+                await call(session)
+                timings.append((perf_counter() - start) * 1000)
+    return results
+
+
+def report(before: Dict[str, List[float]], after: Dict[str, List[float]]):
+    print(
+        f"{'query':<24}{'before p50':>12}{'after p50':>12}"
+        f"{'before p95':>12}{'after p95':>12}{'speedup':>10}"
+    )
+    for name in before:
+        before_p50, after_p50 = median(before[name]), median(after[name])
+        before_p95 = quantiles(before[name], n=20)[-1]
+        after_p95 = quantiles(after[name], n=20)[-1]
+        print(
+            f"{name:<24}{before_p50:>10.2f}ms{after_p50:>10.2f}ms"
+            f"{before_p95:>10.2f}ms{after_p95:>10.2f}ms"
+            f"{before_p50 / after_p50:>9.1f}x"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", required=True, help="database to drop and fill")
+    parser.add_argument("--schools", type=int, default=20)
+    parser.add_argument("--teachers", type=int, default=60)
+    parser.add_argument("--subclasses", type=int, default=40)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+    # time the SQL behind the getters, not the in-memory snapshot
+    TIMETABLE_SNAPSHOTS.ttl = 0
+
+    engine = create_async_engine(args.url)
+    session_factory = sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    total = await seed(engine, args.schools, args.teachers, args.subclasses)
+    print(f"Seeded {total} lessons in {args.schools} schools")
+    queries = requests(args.schools, args.teachers, args.subclasses, args.requests)
+
+    await migrate(engine, "base")
+    # the getters label responses with the school version of 8c3e5b2a91d4
+    async with engine.begin() as connection:
+        await connection.execute(text(DATA_VERSION_COLUMN))
+    before = await measure(session_factory, queries)
+    async with engine.begin() as connection:
+        await connection.execute(text("ALTER TABLE school DROP COLUMN data_version"))
+    await migrate(engine, "head")
+    after = await measure(session_factory, queries)
+    await engine.dispose()
+
+    report(before, after)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,167 @@
+"""Latency of /api/info/schools/distance with the LIKE '%name%' query it used
+to run and with the name index of extra/ngram_index.py
+
+The target database is dropped and filled with synthetic school names, then
+the same queries (prefixes, city names and misspelled full names) are timed
+both ways. "found" counts the queries that returned the school whose name they
+were made from. config.py is imported, so the usual DATABASE_* and JWT_SECRET
+variables have to be set.
+
+    python -m benchmarks.school_search --url sqlite+aiosqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import random
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+from config import MAX_LEVENSHTEIN_RESULTS
+from extra.ngram_index import SCHOOL_NAMES, NgramIndex
+from models import database
+from models.bot import info, item
+from routers.botapi.info import get_schools_by_levenshtein
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+KINDS = ["School No", "Lyceum No", "Gymnasium No", "Boarding school No"]
+CITIES = ["Moscow", "Kazan", "Tver", "Samara", "Omsk", "Perm", "Ufa", "Tula"]
+
+# kind, searched text, name of the school looked for
+Query = Tuple[str, str, str]
+
+
+def school_names(rng: random.Random, count: int) -> List[str]:
+    cities = CITIES + [f"Town {index}" for index in range(count // 100)]
+    names = set()
+    while len(names) < count:
+        names.add(f"{rng.choice(KINDS)} {rng.randint(1, 3000)} of {rng.choice(cities)}")
+    return sorted(names)
+
+
+def misspell(rng: random.Random, name: str) -> str:
+    position = rng.randrange(len(name))
+    return name[:position] + name[position + 1 :]
+
+
+async def seed(engine, schools: int) -> List[str]:
+    async with engine.begin() as connection:
+        await connection.run_sync(database.Base.metadata.drop_all)
+        await connection.run_sync(database.Base.metadata.create_all)
+
+    names = school_names(random.Random(0), schools)
+    async with engine.begin() as connection:
+        await connection.execute(
+            insert(database.School), [{"name": name} for name in names]
+        )
+    return names
+
+
+async def like_scan(name: str, session: AsyncSession):
+    """The endpoint before the index"""
+    schools = (
+        await session.scalars(
+            select(database.School)
+            .filter(database.School.name.contains(name))
+            .limit(MAX_LEVENSHTEIN_RESULTS)
+        )
+    ).all()
+    return info.Schools(data=[item.School.from_orm(school) for school in schools])
+
+
+def queries(names: List[str], count: int) -> List[Query]:
+    rng = random.Random(1)
+    result = []
+    for _ in range(count):
+        name = rng.choice(names)
+        result.append(("prefix", name[: rng.randint(1, len(name))], name))
+        result.append(("city", name.split(" of ")[-1], name))
+        result.append(("misspelling", misspell(rng, name), name))
+    return result
+
+
+async def measure(
+    session_factory, search: Callable, queries: List[Query]
+) -> Tuple[Dict[str, List[float]], Dict[str, int]]:
+    """Timings and the amount of queries that found the school by kind"""
+    timings: Dict[str, List[float]] = {}
+    found: Dict[str, int] = {}
+    for kind, text, name in queries:
+        async with session_factory() as session:
+            start = perf_counter()
+            schools = await search(name=text, session=session)
+            timings.setdefault(kind, []).append((perf_counter() - start) * 1000)
+        found[kind] = found.get(kind, 0) + any(
+            school.name == name for school in schools.data
+        )
+    return timings, found
+
+
+def measure_index(queries: List[Query], index: NgramIndex) -> Dict[str, List[float]]:
+    """Timings of the index lookup alone, without the query loading rows"""
+    timings: Dict[str, List[float]] = {}
+    for kind, text, _ in queries:
+        start = perf_counter()
+        index.search(text, MAX_LEVENSHTEIN_RESULTS, 50)
+        timings.setdefault(kind, []).append((perf_counter() - start) * 1000)
+    return timings
+
+
+def report(
+    before: Dict[str, List[float]],
+    after: Dict[str, List[float]],
+    lookup: Dict[str, List[float]],
+    found_before: Dict[str, int],
+    found_after: Dict[str, int],
+):
+    print(
+        f"{'query':<14}{'LIKE p50':>12}{'index p50':>12}{'LIKE p95':>12}"
+        f"{'index p95':>12}{'lookup p50':>11}{'p95':>11}{'LIKE found':>12}{'index found':>12}"
+    )
+    for name in before:
+        print(
+            f"{name:<14}{median(before[name]):>10.2f}ms"
+            f"{median(after[name]):>10.2f}ms"
+            f"{quantiles(before[name], n=20)[-1]:>10.2f}ms"
+            f"{quantiles(after[name], n=20)[-1]:>10.2f}ms"
+            f"{median(lookup[name]):>9.3f}ms{quantiles(lookup[name], n=20)[-1]:>9.3f}ms"
+            f"{found_before[name]:>8}/{len(before[name])}"
+            f"{found_after[name]:>8}/{len(after[name])}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", required=True, help="database to drop and fill")
+    parser.add_argument("--schools", type=int, default=30000)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+
+    engine = create_async_engine(args.url)
+    session_factory = sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    names = await seed(engine, args.schools)
+    print(f"Seeded {len(names)} schools")
+    searches = queries(names, args.requests)
+
+    before, found_before = await measure(session_factory, like_scan, searches)
+    async with session_factory() as session:
+        start = perf_counter()
+        index = await SCHOOL_NAMES.get(session)
+        print(f"Built the index in {(perf_counter() - start) * 1000:.0f}ms")
+    after, found_after = await measure(
+        session_factory, get_schools_by_levenshtein, searches
+    )
+    # a copy, prefix lookups of the endpoint run are memorized by the index
+    lookup = measure_index(searches, NgramIndex(index.names.items()))
+    await engine.dispose()
+
+    report(before, after, lookup, found_before, found_after)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
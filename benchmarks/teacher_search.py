@@ -0,0 +1,183 @@
+"""Latency of /api/info/teachers/distance with a full scan of the school's
+teachers and with the trigram index of extra/ngram_index.py
+
+The target database is dropped and filled with schools of synthetic teacher
+names, then the same queries (prefixes, substrings and misspellings of
+existing names) are timed both ways. "found" counts the queries that returned
+the teacher whose name they were made from. config.py is imported, so the usual
+DATABASE_* and JWT_SECRET variables have to be set.
+
+    python -m benchmarks.teacher_search --url sqlite+aiosqlite:///bench.db
+"""
+
+import argparse
+import asyncio
+import random
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple
+
+import Levenshtein  # pyright: reportMissingTypeStubs=false
+import valid_db_requests as db_validated
+from config import MAX_LEVENSHTEIN_RESULTS
+from extra.ngram_index import TEACHER_NAMES
+from models import database
+from models.bot import info, item
+from routers.botapi.info import get_teacher_by_levenshtein
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+SYLLABLES = ["ka", "ro", "mi", "va", "le", "no", "sha", "ti", "gor", "lin", "ev", "ov"]
+INITIALS = "ABVGDEIKLMNOPRST"
+
+
+def teacher_name(rng: random.Random) -> str:
+    surname = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return f"{surname.capitalize()} {rng.choice(INITIALS)}. {rng.choice(INITIALS)}."
+
+
+def misspell(rng: random.Random, name: str) -> str:
+    position = rng.randrange(len(name))
+    return name[:position] + rng.choice("aeiou") + name[position + 1 :]
+
+
+async def seed(engine, schools: int, teachers: int) -> Dict[int, List[str]]:
+    async with engine.begin() as connection:
+        await connection.run_sync(database.Base.metadata.drop_all)
+        await connection.run_sync(database.Base.metadata.create_all)
+
+    rng = random.Random(0)
+    names: Dict[int, List[str]] = {}
+    rows = []
+    for school_id in range(1, schools + 1):
+        names[school_id] = list({teacher_name(rng) for _ in range(teachers)})
+        rows += [{"name": name, "school_id": school_id} for name in names[school_id]]
+    async with engine.begin() as connection:
+        await connection.execute(
+            insert(database.School),
+            [{"id": id, "name": f"School number {id}"} for id in names],
+        )
+        await connection.execute(insert(database.Teacher), rows)
+    return names
+
+
+async def full_scan(school_id: int, name: str, session: AsyncSession):
+    """The endpoint before the index: every teacher of the school is loaded
+    and ranked"""
+    school = await db_validated.get_school_by_id(session, school_id)
+    name = name.lower()
+    teachers = list(
+        (
+            await session.scalars(
+                select(database.Teacher)
+                .filter_by(school_id=school.id)
+                .options(*db_validated.TEACHER_OPTIONS)
+            )
+        ).all()
+    )
+    teachers.sort(
+        key=lambda teacher: (
+            name not in teacher.name.lower(),
+            teacher.name.lower().find(name)
+            if teacher.name.lower().find(name) != -1
+            else len(teacher.name) + 1,
+            Levenshtein.distance(teacher.name.lower(), name),
+        )
+    )
+    teachers = teachers[:MAX_LEVENSHTEIN_RESULTS]
+    return info.Teachers(data=[item.Teacher.from_orm(teacher) for teacher in teachers])
+
+
+# kind, school id, searched text, name of the teacher looked for
+Query = Tuple[str, int, str, str]
+
+
+def queries(names: Dict[int, List[str]], count: int) -> List[Query]:
+    rng = random.Random(1)
+    result = []
+    for _ in range(count):
+        school_id = rng.choice(list(names))
+        name = rng.choice(names[school_id])
+        surname = name.split()[0]
+        prefix = surname[: rng.randint(2, len(surname))]
+        start = rng.randrange(len(surname) - 2)
+        result.append(("prefix", school_id, prefix, name))
+        result.append(("substring", school_id, surname[start : start + 3], name))
+        result.append(("misspelling", school_id, misspell(rng, surname), name))
+    return result
+
+
+async def measure(
+    session_factory, search: Callable, queries: List[Query]
+) -> Tuple[Dict[str, List[float]], Dict[str, int]]:
+    """Timings and the amount of queries that found the teacher by kind"""
+    timings: Dict[str, List[float]] = {}
+    found: Dict[str, int] = {}
+    for kind, school_id, text, name in queries:
+        async with session_factory() as session:
+            start = perf_counter()
+            teachers = await search(school_id=school_id, name=text, session=session)
+            timings.setdefault(kind, []).append((perf_counter() - start) * 1000)
+        found[kind] = found.get(kind, 0) + any(
+            teacher.name == name for teacher in teachers.data
+        )
+    return timings, found
+
+
+def report(
+    before: Dict[str, List[float]],
+    after: Dict[str, List[float]],
+    found_before: Dict[str, int],
+    found_after: Dict[str, int],
+):
+    print(
+        f"{'query':<16}{'scan p50':>12}{'index p50':>12}"
+        f"{'scan p95':>12}{'index p95':>12}{'speedup':>10}"
+        f"{'scan found':>12}{'index found':>12}"
+    )
+    for name in before:
+        before_p50, after_p50 = median(before[name]), median(after[name])
+        before_p95 = quantiles(before[name], n=20)[-1]
+        after_p95 = quantiles(after[name], n=20)[-1]
+        print(
+            f"{name:<16}{before_p50:>10.2f}ms{after_p50:>10.2f}ms"
+            f"{before_p95:>10.2f}ms{after_p95:>10.2f}ms"
+            f"{before_p50 / after_p50:>9.1f}x"
+            f"{found_before[name]:>8}/{len(before[name])}"
+            f"{found_after[name]:>8}/{len(after[name])}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", required=True, help="database to drop and fill")
+    parser.add_argument("--schools", type=int, default=3)
+    parser.add_argument("--teachers", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+
+    engine = create_async_engine(args.url)
+    session_factory = sessionmaker(
+        bind=engine, class_=AsyncSession, expire_on_commit=False
+    )
+    names = await seed(engine, args.schools, args.teachers)
+    print(f"Seeded {sum(map(len, names.values()))} teachers in {args.schools} schools")
+    searches = queries(names, args.requests)
+
+    before, found_before = await measure(session_factory, full_scan, searches)
+    # the first search of a school builds its index, time the warm ones
+    for school_id in names:
+        async with session_factory() as session:
+            await TEACHER_NAMES.get(session, school_id)
+    after, found_after = await measure(
+        session_factory, get_teacher_by_levenshtein, searches
+    )
+    await engine.dispose()
+
+    report(before, after, found_before, found_after)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,116 @@
+"""Posting announcement chunks with a client session per post and with the
+pooled TRANSMITTER client of extra/transmitter.py
+
+A local stand-in transmitter accepts the posts and counts the TCP connections
+they came through. The same chunks are posted one by one with a new session
+each, the way send_to_transmitter used to, then one by one and in parallel
+through the keep-alive pool. config.py is imported, so the usual DATABASE_*
+and JWT_SECRET variables have to be set.
+
+    python -m benchmarks.transmitter_client --posts 500
+"""
+
+import argparse
+import asyncio
+from statistics import median, quantiles
+from time import perf_counter
+from typing import Awaitable, Callable, List, Set, Tuple
+
+import aiohttp
+from aiohttp import web
+from extra.transmitter import TELEGRAM_PATH, Transmitter
+
+Post = Callable[[str, List[int], bool], Awaitable[None]]
+
+
+async def stand_in() -> Tuple[web.AppRunner, str, Set[Tuple[str, int]]]:
+    """Running transmitter stand-in, its URL and client addresses of the
+    connections it was posted through"""
+    connections: Set[Tuple[str, int]] = set()
+
+    async def redirect(request: web.Request) -> web.Response:
+        connections.add(request.transport.get_extra_info("peername"))
+        await request.json()
+        return web.json_response({})
+
+    app = web.Application()
+    app.router.add_post(TELEGRAM_PATH, redirect)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", connections
+
+
+def session_per_post(url: str) -> Post:
+    async def post(text: str, telegram_ids: List[int], silent: bool):
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                url + TELEGRAM_PATH,
+                json={"text": text, "telegram_ids": telegram_ids, "silent": silent},
+            ) as response:
+                assert response.status == 200
+
+    return post
+
+
+async def measure(
+    post: Post, chunks: List[List[int]], parallel: int
+) -> Tuple[List[float], float]:
+    """Latencies of the posts and the time all of them took in ms, the posts
+    are made in batches of `parallel` as the dispatcher makes them"""
+    timings: List[float] = []
+
+    async def timed(chunk: List[int]):
+        start = perf_counter()
+        await post("https://telegra.ph/benchmark", chunk, False)
+        timings.append((perf_counter() - start) * 1000)
+
+    start = perf_counter()
+    for first in range(0, len(chunks), parallel):
+        await asyncio.gather(*map(timed, chunks[first : first + parallel]))
+    return timings, (perf_counter() - start) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--chunk", type=int, default=500, help="telegram ids a post")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--parallel", type=int, default=4)
+    args = parser.parse_args()
+
+    runner, url, connections = await stand_in()
+    chunks = [
+        list(range(start, start + args.chunk))
+        for start in range(0, args.posts * args.chunk, args.chunk)
+    ]
+    transmitter = Transmitter(url, args.connections, 30, 5, args.parallel)
+    transmitter.start()
+    # the first post of the pool connects, time the warm ones
+    await transmitter.post("warm up", [], False)
+
+    print(
+        f"{'client':<24}{'p50':>10}{'p95':>10}{'total':>12}{'posts/s':>10}"
+        f"{'connections':>13}"
+    )
+    for name, post, parallel in (
+        ("session per post", session_per_post(url), 1),
+        ("pooled", transmitter.post, 1),
+        (f"pooled, {args.parallel} at a time", transmitter.post, args.parallel),
+    ):
+        connections.clear()
+        timings, total = await measure(post, chunks, parallel)
+        print(
+            f"{name:<24}{median(timings):>8.2f}ms"
+            f"{quantiles(timings, n=20)[-1]:>8.2f}ms{total:>10.1f}ms"
+            f"{len(chunks) / total * 1000:>10.0f}{len(connections):>13}"
+        )
+
+    await transmitter.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
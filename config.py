@@ -1,16 +1,18 @@
-from contextlib import contextmanager
 from enum import Enum, auto
 from os import getenv as config
 from pathlib import Path
-from typing import Callable, ContextManager
+from typing import Callable
 
-import sqlalchemy
 from extra.custom_logger import CustomizeLogger
-from fastapi import HTTPException
-from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
-from sqlalchemy.orm.session import Session
-from sqlalchemy.sql import select, text
+from extra.database_pool import (
+    MonitoredQueuePool,
+    PrimarySession,
+    ReplicaRouter,
+    reset_after_fork,
+)
+from fastapi import HTTPException, Request
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
 from pydantic import BaseModel as PydanticBaseModel
 
 
@@ -34,18 +36,36 @@ API_ROLE_MANAGEMENT_PREFIX = "/rolemanagement"
 API_ID_GETTER_PREFIX = "/idgetter"
 API_ANNOUNCEMENTS_PREFIX = "/announcements"
 API_STATISTICS_PREFIX = "/stats"
+API_MONITOR_PREFIX = "/monitor"
+API_TIMETABLE_PREFIX = "/timetable"
 
 API_AUTH_PREFIX = "/auth"
 API_SERVICE_AUTH_PREFIX = "/service"
 
 MAX_LEVENSHTEIN_RESULTS = 5
+# names sharing the most trigrams with a query that are ranked by edit distance
+LEVENSHTEIN_CANDIDATES = 50
 MAX_HISTORY_RESULTS = 10
+# days of statistics history returned by default and at most
+STATISTICS_HISTORY_DAYS = 30
+MAX_STATISTICS_HISTORY_DAYS = 366
+# schools whose roles changed are recounted in the background this long after
+# the first commit, so a burst of registrations is counted once
+STATS_ROLLUP_DELAY_SECONDS = 1.0
+# identical statements executed this many times in one request are logged as N+1
+N_PLUS_ONE_THRESHOLD = 3
 
 API_HOST = "api"
 API_PORT = 8009
 
 TRANSMITTER_HOST = "transmitter"
 TRANSMITTER_PORT = 8998
+# keep-alive connections of a worker to the transmitter, seconds a post may
+# take and posts of announcement chunks a worker makes at a time
+TRANSMITTER_CONNECTIONS = int(config("TRANSMITTER_CONNECTIONS", "8"))
+TRANSMITTER_TIMEOUT = float(config("TRANSMITTER_TIMEOUT", "30"))
+TRANSMITTER_CONNECT_TIMEOUT = float(config("TRANSMITTER_CONNECT_TIMEOUT", "5"))
+TRANSMITTER_PARALLEL_POSTS = int(config("TRANSMITTER_PARALLEL_POSTS", "4"))
 
 DATABASE_USER = config("DATABASE_USER")
 DATABASE_PASSWORD = config("DATABASE_PASSWORD")
@@ -55,7 +75,21 @@ DATABASE_NAME = config("DATABASE_NAME")
 WEBSITE_HOST = config("WEBSITE_HOST")
 WEBSITE_PORT = config("WEBSITE_PORT")
 DATABASE_ENGINE = "mariadb"
-DATABASE_CONNECTOR = "mariadbconnector"
+DATABASE_CONNECTOR = "aiomysql"
+DATABASE_CONNECT_TIMEOUT = int(config("DATABASE_CONNECT_TIMEOUT", "10"))
+DATABASE_POOL_SIZE = int(config("DATABASE_POOL_SIZE", "10"))
+DATABASE_MAX_OVERFLOW = int(config("DATABASE_MAX_OVERFLOW", "10"))
+DATABASE_POOL_TIMEOUT = int(config("DATABASE_POOL_TIMEOUT", "30"))
+# MariaDB drops idle connections after wait_timeout (8 hours by default)
+DATABASE_POOL_RECYCLE = int(config("DATABASE_POOL_RECYCLE", "1800"))
+DATABASE_POOL_PRE_PING = config("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+# comma separated SQLAlchemy URLs of read replicas, used by read-only bot routes
+DATABASE_REPLICA_URLS = [
+    url.strip() for url in config("DATABASE_REPLICA_URLS", "").split(",") if url.strip()
+]
+# reads stay on the primary this long after a commit (replication lag budget)
+DATABASE_REPLICA_PIN_SECONDS = float(config("DATABASE_REPLICA_PIN_SECONDS", "5"))
+DATABASE_REPLICA_RETRY_SECONDS = float(config("DATABASE_REPLICA_RETRY_SECONDS", "30"))
 
 JWT_SECRET = config("JWT_SECRET")
 JWT_ALGORITHM = "HS256"
@@ -71,6 +105,51 @@ DEFAULT_LOGGER = CustomizeLogger.make_logger(LOGGER_CONFIG)
 
 BASIC_STATUS_MAX_CHILDREN = 1
 
+LOOP_MONITOR_ENABLED = config("LOOP_MONITOR_ENABLED", "false").lower() == "true"
+LOOP_MONITOR_THRESHOLD = float(config("LOOP_MONITOR_THRESHOLD", "0.1"))
+LOOP_MONITOR_INTERVAL = 0.02
+
+# seconds a worker serves its in-memory copy of a school timetable, commits in
+# the same worker drop it at once, other workers notice within this time
+TIMETABLE_SNAPSHOT_TTL = float(config("TIMETABLE_SNAPSHOT_TTL", "30"))
+# reference rows (school, teacher, cabinet...) looked up by id, per worker
+ENTITY_CACHE_SIZE = int(config("ENTITY_CACHE_SIZE", "10000"))
+ENTITY_CACHE_TTL = float(config("ENTITY_CACHE_TTL", "60"))
+# school versions are checked this often, rows of schools other workers changed
+# are dropped then
+ENTITY_CACHE_POLL_SECONDS = float(config("ENTITY_CACHE_POLL_SECONDS", "2"))
+# seconds a worker searches its in-memory index of teacher names of a school,
+# teachers created or renamed by other workers show up within this time
+TEACHER_SEARCH_TTL = float(config("TEACHER_SEARCH_TTL", "60"))
+# the same for the index of all school names
+SCHOOL_SEARCH_TTL = float(config("SCHOOL_SEARCH_TTL", "60"))
+# responses of /api/info and /api/lesson/get shared by all workers: a redis://
+# URL, memory:// for a cache local to the worker, empty to turn it off
+RESPONSE_CACHE_URL = config("RESPONSE_CACHE_URL", "")
+RESPONSE_CACHE_TTL = int(config("RESPONSE_CACHE_TTL", "300"))
+# a miss is computed by one worker, the others wait up to this long for it
+RESPONSE_CACHE_LOCK_SECONDS = float(config("RESPONSE_CACHE_LOCK_SECONDS", "5"))
+
+# token of the Telegraph account announcements are published with, an account
+# is made on the first publish of a worker if empty
+TELEGRAPH_TOKEN = config("TELEGRAPH_TOKEN", "")
+# URLs of published pages a worker keeps by hash of their title and text
+TELEGRAPH_PAGE_CACHE_SIZE = int(config("TELEGRAPH_PAGE_CACHE_SIZE", "1024"))
+# telegram ids posted to the transmitter at once, deliveries a worker runs at a
+# time and queued deliveries it accepts before answering 503
+ANNOUNCEMENT_CHUNK_SIZE = int(config("ANNOUNCEMENT_CHUNK_SIZE", "500"))
+ANNOUNCEMENT_CONCURRENCY = int(config("ANNOUNCEMENT_CONCURRENCY", "2"))
+ANNOUNCEMENT_QUEUE_SIZE = int(config("ANNOUNCEMENT_QUEUE_SIZE", "100"))
+# attempts of a chunk that failed to connect or got a 5xx, the pause between
+# them doubles from the first one
+ANNOUNCEMENT_RETRIES = 3
+ANNOUNCEMENT_RETRY_SECONDS = 1.0
+# queued deliveries left by other or restarted workers are looked for this often
+ANNOUNCEMENT_SWEEP_SECONDS = 30.0
+# a SENDING delivery saving no batch for this long is taken as abandoned by a
+# crashed worker and queued again, it has to be longer than a batch may take
+ANNOUNCEMENT_STALE_SECONDS = float(config("ANNOUNCEMENT_STALE_SECONDS", "600"))
+
 __connect_address__ = (
     "{engine}+{connector}://{user}:{password}@{host}:{port}/{name}".format(
         engine=DATABASE_ENGINE,
@@ -83,11 +162,49 @@ __connect_address__ = (
     )
 )
 
-ENGINE = create_engine(__connect_address__, connect_args={"connect_timeout": 400})
+
+def make_engine(url: str) -> AsyncEngine:
+    engine = create_async_engine(
+        url,
+        poolclass=MonitoredQueuePool,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        pool_recycle=DATABASE_POOL_RECYCLE,
+        pool_pre_ping=DATABASE_POOL_PRE_PING,
+        connect_args={"connect_timeout": DATABASE_CONNECT_TIMEOUT}
+        if url.startswith(DATABASE_ENGINE)
+        else {},
+    )
+    reset_after_fork(engine)
+    return engine
+
+
+ENGINE = make_engine(__connect_address__)
 DEFAULT_LOGGER.debug(f"Connecting to database with {__connect_address__}")
-SESSION_FACTORY: Callable[..., ContextManager[Session]] = scoped_session(
-    sessionmaker(bind=ENGINE, autocommit=False, autoflush=False)
+REPLICA_ENGINES = [make_engine(url) for url in DATABASE_REPLICA_URLS]
+DEFAULT_LOGGER.debug(f"Using {len(REPLICA_ENGINES)} read replicas")
+# expire_on_commit=False: attributes can not be lazily refreshed after commit
+# in async mode, handlers serialize objects after commit
+SESSION_FACTORY: Callable[..., AsyncSession] = sessionmaker(
+    bind=ENGINE,
+    class_=AsyncSession,
+    sync_session_class=PrimarySession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
+READ_SESSION_FACTORY: Callable[..., AsyncSession] = sessionmaker(
+    class_=AsyncSession, autocommit=False, autoflush=False, expire_on_commit=False
 )
+REPLICA_ROUTER = ReplicaRouter(
+    ENGINE,
+    REPLICA_ENGINES,
+    READ_SESSION_FACTORY,
+    DATABASE_REPLICA_PIN_SECONDS,
+    DATABASE_REPLICA_RETRY_SECONDS,
+)
+REPLICA_ROUTER.pin_on_commit(PrimarySession)
 
 
 class Access(Enum):
@@ -97,26 +214,43 @@ class Access(Enum):
     Website = 2
 
 
-def get_session():
-    session: Session = SESSION_FACTORY()
+def request_caller(request: Request) -> str:
+    """Who a request came from, for read-your-writes pinning. The token tells
+    services apart, callers without one are told apart by address"""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return authorization
+    return request.client.host if request.client else ""
+
+
+async def get_session(request: Request):
+    session: AsyncSession = SESSION_FACTORY()
+    session.sync_session.info["caller"] = request_caller(request)
+    try:
+        yield session
+    except HTTPException as error:
+        raise error from error
+    except Exception as error:
+        DEFAULT_LOGGER.error(error)
+        await session.rollback()
+        raise HTTPException(status_code=500, detail="SQL Error")
+    finally:
+        await session.close()
+
+
+async def get_read_session(request: Request):
+    """Session for read-only routes, served by a replica when one is up"""
+    session: AsyncSession = await REPLICA_ROUTER.read_session(request_caller(request))
     try:
-        for _ in range(10):
-            try:
-                session.execute(select(text("1")))
-            except sqlalchemy.exc.InterfaceError as error:  # type: ignore
-                session: Session = SESSION_FACTORY()
-                continue
-            else:
-                yield session
-                break
+        yield session
     except HTTPException as error:
         raise error from error
     except Exception as error:
         DEFAULT_LOGGER.error(error)
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail="SQL Error")
     finally:
-        session.close()
+        await session.close()
 
 
 class BaseModel(PydanticBaseModel):
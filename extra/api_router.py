@@ -2,7 +2,12 @@ from time import time
 
 import ujson
 from config import DEFAULT_LOGGER as logger
-from fastapi import Request, Response
+from extra.loop_monitor import LOOP_MONITOR
+from extra.query_counter import count_queries
+from extra.response_cache import RESPONSE_CACHE
+from extra.school_versions import BODY_VERSIONS, SCHOOL_VERSIONS
+from fastapi import Depends, Request, Response
+from fastapi.dependencies.utils import get_parameterless_sub_dependant
 from fastapi.routing import APIRoute
 
 
@@ -12,13 +17,19 @@ class LoggingRouter(APIRoute):
 
         async def custom_route_handler(request: Request) -> Response:
             request_id = id(request)
+            # read before the handler, so multipart forms are cached for logging
+            body = await request.body()
             start = time()
-            response: Response = await original_route_handler(request)
+            with count_queries() as queries:
+                with LOOP_MONITOR.track(request.method, self.path):
+                    response: Response = await original_route_handler(request)
+            await RESPONSE_CACHE.flush()
             duration = time() - start
+            response.headers.update(queries.headers())
             logger.info(
                 f"REQ: {request_id} "
                 f'MTD: "{request.method}" '
-                f"BDY: {(await request.body()) if (await request.body()) else {}} "
+                f"BDY: {body if body else {}} "
                 f"HST: {request.client.host} "
                 f"HDR: {dict(request.headers)} "
             )
@@ -26,10 +37,161 @@ class LoggingRouter(APIRoute):
                 f"RES: {request_id} "
                 f'STC: "{response.status_code}" '
                 f"TMN: {round(duration, 4)}s "
-                f"BDY: {ujson.loads(response.body)} "
+                f"BDY: {ujson.loads(response.body) if response.body else {}} "
                 f"HDR: {dict(response.headers)} "
             )
+            logger.info(
+                f"QRY: {request_id} "
+                f"CNT: {queries.count} "
+                f"TMN: {round(queries.duration, 4)}s "
+            )
+            for statement, count in queries.repeated():
+                logger.warning(
+                    f"QRY: {request_id} "
+                    f'RPT: {count}x "{statement}" '
+                    f'PTH: "{self.path}" '
+                )
 
             return response
 
         return custom_route_handler
+
+
+def cached(endpoint):
+    """Serve a GET route of a CachedRouter from RESPONSE_CACHE"""
+    endpoint.cache_response = True
+    return endpoint
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison, W/ prefixes are ignored
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    tags = {tag[2:] if tag.startswith("W/") else tag for tag in tags}
+    return etag in tags or "*" in tags
+
+
+def not_modified(request: Request, response: Response) -> bool:
+    etag = response.headers.get("ETag")
+    if_none_match = request.headers.get("if-none-match")
+    return bool(etag and if_none_match and etag_matches(if_none_match, etag))
+
+
+class Answer(Exception):
+    """Raised by a dependency added with `answer_early` to respond with
+    `response` instead of running the endpoint"""
+
+    def __init__(self, response: Response):
+        self.response = response
+
+
+class AnsweringRoute(APIRoute):
+    def get_route_handler(self):
+        original_route_handler = super().get_route_handler()
+
+        async def answering_route_handler(request: Request) -> Response:
+            try:
+                return await original_route_handler(request)
+            except Answer as answer:
+                return answer.response
+
+        return answering_route_handler
+
+    def answer_early(self, dependency):
+        # after the dependencies of the route and its router, so an answer is
+        # only given to callers they let through, before the endpoint's ones
+        self.dependant.dependencies.insert(
+            len(self.dependencies),
+            get_parameterless_sub_dependant(
+                depends=Depends(dependency), path=self.path_format
+            ),
+        )
+
+
+class ResponseCacheRoute(AnsweringRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        if getattr(endpoint, "cache_response", False):
+            self.answer_early(self.cached_response)
+
+    async def cached_response(self, request: Request):
+        if not RESPONSE_CACHE.enabled or request.method != "GET":
+            return
+        response, miss = await RESPONSE_CACHE.lookup(self.path, request)
+        if response is None:
+            request.state.response_cache_miss = miss
+            return
+        # the stored ETag is the version of the stored body
+        if not_modified(request, response):
+            response = Response(
+                status_code=304,
+                headers={"ETag": response.headers["ETag"], "X-Cache": "HIT"},
+            )
+        raise Answer(response)
+
+    def get_route_handler(self):
+        original_route_handler = super().get_route_handler()
+        if not getattr(self.endpoint, "cache_response", False):
+            return original_route_handler
+
+        async def cached_route_handler(request: Request) -> Response:
+            try:
+                response = await original_route_handler(request)
+            except BaseException:
+                await RESPONSE_CACHE.release(
+                    getattr(request.state, "response_cache_miss", None)
+                )
+                raise
+            await RESPONSE_CACHE.store(
+                getattr(request.state, "response_cache_miss", None), response
+            )
+            return response
+
+        return cached_route_handler
+
+
+class VersionedRoute(AnsweringRoute):
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        if getattr(endpoint, "cache_response", False):
+            self.answer_early(self.not_modified_version)
+
+    async def not_modified_version(self, request: Request):
+        school_id = request.query_params.get("school_id", "")
+        if_none_match = request.headers.get("if-none-match")
+        if request.method != "GET" or not school_id.isdigit() or not if_none_match:
+            return
+        version = await SCHOOL_VERSIONS.get(int(school_id))
+        etag = f'"{school_id}.{version}"'
+        if version is not None and etag_matches(if_none_match, etag):
+            raise Answer(Response(status_code=304, headers={"ETag": etag}))
+
+    def get_route_handler(self):
+        original_route_handler = super().get_route_handler()
+        if not getattr(self.endpoint, "cache_response", False):
+            return original_route_handler
+
+        async def versioned_route_handler(request: Request) -> Response:
+            school_id = request.query_params.get("school_id", "")
+            if request.method != "GET" or not school_id.isdigit():
+                return await original_route_handler(request)
+            # the endpoint reports the version its body was read at
+            token = BODY_VERSIONS.set({})
+            try:
+                response = await original_route_handler(request)
+                version = BODY_VERSIONS.get().get(int(school_id))
+            finally:
+                BODY_VERSIONS.reset(token)
+            if response.status_code == 200 and version is not None:
+                response.headers["ETag"] = f'"{school_id}.{version}"'
+            return response
+
+        return versioned_route_handler
+
+
+class CachedRouter(LoggingRouter, ResponseCacheRoute, VersionedRoute):
+    """LoggingRouter for read-only routes. Routes marked with `cached` are
+    served from RESPONSE_CACHE, hits are logged like any other response.
+    Responses of the ones scoped by a school_id carry an ETag of the school
+    version their body was read at, an If-None-Match with the current version
+    is answered with 304. Neither is answered before the dependencies of the
+    router, their auth included, let the caller through"""
@@ -18,6 +18,7 @@ from models import database
 from passlib.context import CryptContext
 from config import BaseModel
 from pydantic import EmailStr
+from sqlalchemy.future import select
 
 # do not user logging middlewhere here
 router = APIRouter(prefix=API_PREFIX + API_AUTH_PREFIX)
@@ -51,8 +52,10 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def authenticate_user(session, email: str, password: str):
-    user = session.query(database.HarvestUser).filter_by(email=email).first()
+async def authenticate_user(session, email: str, password: str):
+    user = await session.scalar(
+        select(database.HarvestUser).filter_by(email=email).limit(1)
+    )
     if not user:
         return None
     if not verify_password(password, user.password):
@@ -78,7 +81,7 @@ def create_refresh_token(data: dict):
     return encoded_jwt
 
 
-def get_harvest_user(
+async def get_harvest_user(
     token: str = Depends(OAUTH2_AUTH_SCHEME), session=Depends(get_session)
 ):
     credentials_exception = HTTPException(
@@ -95,7 +98,9 @@ def get_harvest_user(
     except JWTError:
         raise credentials_exception
 
-    user = session.query(database.HarvestUser).filter_by(uuid=uuid).first()
+    user = await session.scalar(
+        select(database.HarvestUser).filter_by(uuid=uuid).limit(1)
+    )
     if user is None:
         raise credentials_exception
     if not user.activated:
@@ -112,8 +117,8 @@ async def signup_user(form_data: UserSchema = Body(None), session=Depends(get_se
     access_token = create_access_token({"sub": user_uuid, "type": "user"})
     refresh_token = create_refresh_token({"sub": user_uuid})
 
-    candidate = (
-        session.query(database.HarvestUser).filter_by(email=form_data.email).first()
+    candidate = await session.scalar(
+        select(database.HarvestUser).filter_by(email=form_data.email).limit(1)
     )
 
     if candidate is not None:
@@ -138,7 +143,7 @@ async def signup_user(form_data: UserSchema = Body(None), session=Depends(get_se
     )
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
     return {
         "access_token": access_token,
@@ -153,7 +158,7 @@ async def login_user(
     session=Depends(get_session),
 ):
     # username == email
-    user = authenticate_user(session, form_data.username, form_data.password)
+    user = await authenticate_user(session, form_data.username, form_data.password)
 
     if not user:
         raise HTTPException(
@@ -167,7 +172,7 @@ async def login_user(
     user.refresh_token = create_refresh_token(data={"sub": user.uuid})
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
     return {
         "access_token": user.access_token,
@@ -184,7 +189,7 @@ async def logout_user(
     user.logged_in = False
 
     session.add(user)
-    session.commit()
+    await session.commit()
 
     return {"uuid": user.uuid}
 
@@ -196,7 +201,7 @@ async def refresh_token_user(
 ):
     user.access_token = create_access_token(data={"sub": user.uuid})
     session.add(user)
-    session.commit()
+    await session.commit()
 
     return {
         "access_token": user.access_token,
@@ -0,0 +1,215 @@
+import os
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import ORMExecuteState, Session, SessionTransaction
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+# pins of callers that went quiet are dropped once there are this many
+MAX_PINNED_CALLERS = 4096
+
+
+class MonitoredQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that counts callers waiting for a connection"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = Lock()
+        self._waiting = 0
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._timeouts = 0
+
+    def _do_get(self):
+        with self._stats_lock:
+            self._waiting += 1
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+        finally:
+            waited = perf_counter() - start
+            with self._stats_lock:
+                self._waiting -= 1
+                self._waits += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": self.overflow(),
+                "waiting": self._waiting,
+                "checkouts": self._waits,
+                "wait_mean": round(self._wait_total / self._waits, 6)
+                if self._waits
+                else 0.0,
+                "wait_max": round(self._wait_max, 4),
+                "timeouts": self._timeouts,
+            }
+
+
+def reset_after_fork(engine: AsyncEngine):
+    """Give a forked worker its own pool
+
+    Connections inherited from the parent share sockets with it, so they are
+    dropped without being closed and the child starts with an empty pool.
+    """
+
+    def rebuild_pool():
+        engine.sync_engine.pool = engine.sync_engine.pool.recreate()
+
+    os.register_at_fork(after_in_child=rebuild_pool)
+
+
+def pool_stats(engine: AsyncEngine) -> Dict[str, Any]:
+    pool = engine.sync_engine.pool
+    stats = pool.stats() if isinstance(pool, MonitoredQueuePool) else {}
+    stats["pid"] = os.getpid()
+    stats["status"] = pool.status()
+    return stats
+
+
+class PrimarySession(Session):
+    """Sync session class behind sessions bound to the primary
+
+    ReplicaRouter listens to its commits to pin reads to the primary.
+    """
+
+
+class ReplicaRouter:
+    """Send read-only sessions to replicas and everything else to the primary
+
+    Reads are spread round-robin over replicas. After a commit that wrote
+    something, reads of the same caller go to the primary for `pin_seconds` so
+    it sees its own writes despite replication lag, other callers keep reading
+    from replicas. A caller is whatever key the session was opened with, see
+    `caller` in session.info. A replica that can not be connected to is
+    skipped for `retry_seconds`; with no replica left reads fall back to the
+    primary.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: List[AsyncEngine],
+        session_factory: Callable[..., AsyncSession],
+        pin_seconds: float,
+        retry_seconds: float,
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.session_factory = session_factory
+        self.pin_seconds = pin_seconds
+        self.retry_seconds = retry_seconds
+        self._next = 0
+        self._pinned_until: Dict[str, float] = {}
+        self._down_until: Dict[AsyncEngine, float] = {}
+        self._reads: Dict[AsyncEngine, int] = {engine: 0 for engine in replicas}
+        self._reads[primary] = 0
+
+    def pin_on_commit(self, session_class: Type[Session]):
+        event.listen(session_class, "after_flush", self._mark_write)
+        event.listen(session_class, "do_orm_execute", self._mark_statement)
+        event.listen(session_class, "after_commit", self._pin_after_commit)
+        event.listen(session_class, "after_transaction_end", self._clear_write)
+
+    def pin(self, caller: str):
+        now = monotonic()
+        if len(self._pinned_until) >= MAX_PINNED_CALLERS:
+            self._pinned_until = {
+                key: until for key, until in self._pinned_until.items() if until > now
+            }
+        self._pinned_until[caller] = now + self.pin_seconds
+
+    def pinned(self, caller: Optional[str]) -> bool:
+        return monotonic() < self._pinned_until.get(caller, 0.0)
+
+    def mark_down(self, engine: AsyncEngine, error: Exception):
+        logger.warning(
+            f"Replica {engine.url.host} is unavailable for {self.retry_seconds}s: {error}"
+        )
+        self._down_until[engine] = monotonic() + self.retry_seconds
+
+    async def read_session(self, caller: Optional[str] = None) -> AsyncSession:
+        for engine in self._read_candidates(caller):
+            session = self.session_factory(bind=engine)
+            if engine is not self.primary:
+                try:
+                    await session.connection()
+                except (DBAPIError, OSError) as error:
+                    await session.close()
+                    self.mark_down(engine, error)
+                    continue
+                # rows read here may be behind the primary, see EntityCache
+                session.sync_session.info["replica"] = True
+            self._reads[engine] += 1
+            return session
+        raise RuntimeError("Primary is always a read candidate")
+
+    def stats(self) -> Dict[str, Any]:
+        now = monotonic()
+        return {
+            "pinned_callers": sum(until > now for until in self._pinned_until.values()),
+            "primary": {"reads": self._reads[self.primary]},
+            "replicas": [
+                {
+                    "host": engine.url.host or engine.url.database,
+                    "reads": self._reads[engine],
+                    "down_for": round(
+                        max(self._down_until.get(engine, 0.0) - now, 0.0), 3
+                    ),
+                }
+                for engine in self.replicas
+            ],
+        }
+
+    def _read_candidates(self, caller: Optional[str]) -> List[AsyncEngine]:
+        if self.pinned(caller) or not self.replicas:
+            return [self.primary]
+        now = monotonic()
+        start = self._next
+        self._next = (self._next + 1) % len(self.replicas)
+        rotated = self.replicas[start:] + self.replicas[:start]
+        candidates = [
+            engine for engine in rotated if self._down_until.get(engine, 0.0) <= now
+        ]
+        candidates.append(self.primary)
+        return candidates
+
+    @staticmethod
+    def _mark_write(session: Session, flush_context):
+        if session.new or session.dirty or session.deleted:
+            session.info["has_writes"] = True
+
+    @staticmethod
+    def _mark_statement(orm_execute_state: ORMExecuteState):
+        # bulk INSERT ... SELECT, UPDATE and DELETE statements flush nothing
+        state = orm_execute_state
+        if state.is_insert or state.is_update or state.is_delete:
+            state.session.info["has_writes"] = True
+
+    def _pin_after_commit(self, session: Session):
+        # background writes have no caller, nobody waits to read them
+        caller = session.info.get("caller")
+        if session.info.get("has_writes", False) and caller is not None:
+            self.pin(caller)
+
+    @staticmethod
+    def _clear_write(session: Session, transaction: SessionTransaction):
+        if transaction.parent is None:
+            session.info.pop("has_writes", None)
@@ -0,0 +1,57 @@
+from functools import lru_cache
+from typing import Iterator, Tuple, Type
+
+from pydantic import BaseModel
+from pydantic.fields import ModelField
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.interfaces import LoaderOption
+
+MAX_DEPTH = 5
+
+
+def _field_models(field: ModelField) -> Iterator[Type[BaseModel]]:
+    """Pydantic models a field can hold, Union members included"""
+    if field.sub_fields:
+        for sub_field in field.sub_fields:
+            yield from _field_models(sub_field)
+    elif isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+        yield field.type_
+
+
+def _plan(entity: type, model: Type[BaseModel], depth: int) -> Tuple[LoaderOption, ...]:
+    if depth == MAX_DEPTH:
+        return ()
+    relationships = inspect(entity).relationships
+    options = []
+    for field in model.__fields__.values():
+        # from_orm reads the alias first and falls back to the field name
+        name = field.alias if field.alias in relationships else field.name
+        relationship = relationships.get(name)
+        if relationship is None or relationship.lazy == "dynamic":
+            continue
+        attribute = getattr(entity, name)
+        target = relationship.mapper.class_
+        loader = (
+            selectinload(attribute) if relationship.uselist else joinedload(attribute)
+        )
+        nested = tuple(
+            option
+            for sub_model in dict.fromkeys(_field_models(field))
+            for option in _plan(target, sub_model, depth + 1)
+        )
+        options.append(loader.options(*nested) if nested else loader)
+    return tuple(options)
+
+
+@lru_cache(maxsize=None)
+def load_options(entity: type, model: Type[BaseModel]) -> Tuple[LoaderOption, ...]:
+    """Loader options for everything `model.from_orm` walks through on `entity`
+
+    Collections are loaded with selectinload, many-to-one relationships with
+    joinedload, so serializing any number of rows costs a constant amount of
+    queries. Dynamic relationships can not be eager loaded and are skipped.
+
+        select(database.Lesson).options(*load_options(database.Lesson, item.Lesson))
+    """
+    return _plan(entity, model, 0)
@@ -0,0 +1,231 @@
+import asyncio
+from collections import OrderedDict
+from itertools import chain
+from time import monotonic
+from typing import Any, Callable, Collection, Dict, Optional, Set, Tuple, Type, TypeVar
+
+from config import DEFAULT_LOGGER as logger
+from config import (
+    ENTITY_CACHE_POLL_SECONDS,
+    ENTITY_CACHE_SIZE,
+    ENTITY_CACHE_TTL,
+    SESSION_FACTORY,
+)
+from extra.database_pool import PrimarySession
+from models import database
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+
+Entity = TypeVar("Entity")
+
+school = database.School.__table__
+
+CACHED_ENTITIES = (
+    database.School,
+    database.Corpus,
+    database.Cabinet,
+    database.Teacher,
+    database.Subclass,
+    database.Lesson_number,
+)
+
+
+class EntityCache:
+    """LRU cache with a TTL of column values of rows looked up by id
+
+    Only columns are kept, a hit is merged into the asking session without a
+    query, so the caller gets an ordinary persistent instance; a row the
+    session already has is returned as is. Only rows read from the primary
+    are kept, a replica may still have a row the cache was just told to drop,
+    and so are not rows read before an invalidation of the worker. Rows
+    changed or deleted by a PrimarySession commit are dropped at once. A task
+    of the worker compares school versions every `poll_seconds` and drops the
+    rows of schools other workers changed, with the response cache channel
+    (see main.py) they are dropped right after the commit.
+    """
+
+    def __init__(self, size: int, ttl: float, poll_seconds: float):
+        self.size = size
+        self.ttl = ttl
+        self.poll_seconds = poll_seconds
+        self.session_factory: Callable[..., AsyncSession] = SESSION_FACTORY
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bumped by every invalidation, see put
+        self.generation = 0
+        self._entries: "OrderedDict[Tuple[type, int], Tuple[float, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self._versions: Optional[Dict[int, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0 and self.ttl > 0
+
+    async def get(
+        self, session: AsyncSession, entity: Type[Entity], uid: int
+    ) -> Optional[Entity]:
+        present = session.identity_map.get(identity_key(entity, uid))
+        if present is not None:
+            # loaded or changed by the session, never older than the cache
+            return present
+        key = (entity, uid)
+        cached = self._entries.get(key)
+        if cached is None or monotonic() - cached[0] >= self.ttl:
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        instance = entity(**cached[1])
+        make_transient_to_detached(instance)
+        return await session.merge(instance, load=False)
+
+    def put(self, instance: Any, generation: Optional[int] = None):
+        """Keep the columns of a row read while `generation` was current"""
+        if not self.enabled or not isinstance(instance, CACHED_ENTITIES):
+            return
+        if generation is not None and generation != self.generation:
+            # read before a commit dropped it, the row may be the old one
+            return
+        state = inspect(instance)
+        if state.modified:
+            # changes of the current transaction may still be rolled back
+            return
+        if state.session is not None and state.session.info.get("replica"):
+            return
+        columns = {}
+        for attribute in state.mapper.column_attrs:
+            if attribute.deferred:
+                continue
+            if attribute.key not in state.dict:
+                # expired or deferred, better not to cache half a row
+                return
+            columns[attribute.key] = state.dict[attribute.key]
+        self._entries[(type(instance), state.identity[0])] = (monotonic(), columns)
+        self._entries.move_to_end((type(instance), state.identity[0]))
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, entity: type, uid: int):
+        self.generation += 1
+        self._entries.pop((entity, uid), None)
+
+    def invalidate_scopes(
+        self, school_ids: Collection[int], corpus_ids: Collection[int]
+    ):
+        """Drop the rows of the schools and of the corpuses"""
+        self.generation += 1
+        # cabinets may have only a corpus, the corpuses of the schools go too
+        corpus_ids = set(corpus_ids)
+        corpus_ids.update(
+            uid
+            for (entity, uid), (_, columns) in self._entries.items()
+            if entity is database.Corpus and columns.get("school_id") in school_ids
+        )
+        for key, (_, columns) in list(self._entries.items()):
+            entity, uid = key
+            if entity is database.School:
+                school_id, corpus_id = uid, None
+            elif entity is database.Corpus:
+                school_id, corpus_id = columns.get("school_id"), uid
+            else:
+                school_id, corpus_id = columns.get("school_id"), columns.get(
+                    "corpus_id"
+                )
+            if school_id in school_ids or corpus_id in corpus_ids:
+                del self._entries[key]
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    async def poll(self):
+        """Drop the rows of the schools whose version changed since the last
+        poll, the first one only takes note of the versions"""
+        async with self.session_factory() as session:
+            rows = await session.execute(select(school.c.id, school.c.data_version))
+            versions = dict(rows.all())
+            changed: Set[int] = set()
+            if self._versions is not None:
+                changed = {
+                    uid
+                    for uid in chain(versions, self._versions)
+                    if versions.get(uid) != self._versions.get(uid)
+                }
+            corpus_ids: Set[int] = set()
+            if changed:
+                corpus_ids.update(
+                    await session.scalars(
+                        select(database.Corpus.id).filter(
+                            database.Corpus.school_id.in_(changed)
+                        )
+                    )
+                )
+        self._versions = versions
+        if changed:
+            self.invalidate_scopes(changed, corpus_ids)
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.poll()
+            except Exception as error:
+                logger.warning(f"Can not check versions of cached schools: {error!r}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._versions = None
+
+    def stats(self) -> Dict[str, Any]:
+        requests = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else None,
+            "evictions": self.evictions,
+        }
+
+    def invalidate_on_commit(self, session_class):
+        @event.listens_for(session_class, "after_flush")
+        def collect(session, flush_context):
+            changed = session.info.setdefault("entity_cache_changed", set())
+            for instance in chain(session.dirty, session.deleted):
+                if isinstance(instance, CACHED_ENTITIES):
+                    changed.add((type(instance), inspect(instance).identity[0]))
+
+        @event.listens_for(session_class, "after_commit")
+        def invalidate(session):
+            for entity, uid in session.info.get("entity_cache_changed", ()):
+                self.invalidate(entity, uid)
+
+        @event.listens_for(session_class, "after_transaction_end")
+        def forget(session, transaction):
+            if transaction.parent is None:
+                session.info.pop("entity_cache_changed", None)
+
+
+ENTITY_CACHE = EntityCache(
+    ENTITY_CACHE_SIZE, ENTITY_CACHE_TTL, ENTITY_CACHE_POLL_SECONDS
+)
+ENTITY_CACHE.invalidate_on_commit(PrimarySession)
@@ -0,0 +1,217 @@
+import asyncio
+import sys
+import threading
+import traceback
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+
+from config import DEFAULT_LOGGER as logger
+from config import LOOP_MONITOR_INTERVAL, LOOP_MONITOR_THRESHOLD
+
+UNKNOWN_ROUTE = "<loop>"
+MAX_STACK_DEPTH = 20
+MAX_STACKS_PER_ROUTE = 5
+
+
+class RouteStats:
+    def __init__(self):
+        self.stalls = 0
+        self.blocked_total = 0.0
+        self.blocked_max = 0.0
+        self.stacks: Dict[Tuple[str, ...], List[float]] = {}
+
+    def add(self, duration: float, stack: Optional[Tuple[str, ...]]):
+        self.stalls += 1
+        self.blocked_total += duration
+        self.blocked_max = max(self.blocked_max, duration)
+        if stack is not None:
+            count, blocked = self.stacks.get(stack, (0, 0.0))
+            self.stacks[stack] = [count + 1, blocked + duration]
+
+    def as_dict(self) -> Dict[str, Any]:
+        stacks = sorted(self.stacks.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "stalls": self.stalls,
+            "blocked_total": round(self.blocked_total, 4),
+            "blocked_max": round(self.blocked_max, 4),
+            "stacks": [
+                {"count": count, "blocked": round(blocked, 4), "stack": list(stack)}
+                for stack, (count, blocked) in stacks[:MAX_STACKS_PER_ROUTE]
+            ],
+        }
+
+
+class LoopMonitor:
+    """Watchdog that measures event loop lag and attributes stalls to routes
+
+    A heartbeat coroutine sleeps for `interval` seconds on the loop and
+    measures how late it wakes up. A daemon thread watches the heartbeat and,
+    once it is older than `threshold`, samples the loop thread's call stack
+    and the request task that is currently running. When the heartbeat
+    finally wakes up the stall is recorded against that route.
+    """
+
+    def __init__(self, threshold: float, interval: float):
+        self.threshold = threshold
+        self.interval = interval
+        self.running = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._tasks: "WeakKeyDictionary[asyncio.Task, str]" = WeakKeyDictionary()
+        self._endpoints: Dict[Tuple[str, str], str] = {}
+        self._beat = 0.0
+        self._sample: Optional[Tuple[float, str, Tuple[str, ...]]] = None
+        self._lag_samples = 0
+        self._lag_total = 0.0
+        self._lag_max = 0.0
+        self._routes: Dict[str, RouteStats] = {}
+
+    def start(self, routes: Iterable[Any] = ()):
+        if self.running:
+            return
+        for route in routes:
+            endpoint = getattr(route, "endpoint", None)
+            code = getattr(endpoint, "__code__", None)
+            if code is not None:
+                self._endpoints[(code.co_filename, code.co_name)] = self._route_name(
+                    getattr(route, "methods", None), route.path
+                )
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopped.clear()
+        self._heartbeat_task = self._loop.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(
+            target=self._watch, name="loop-monitor", daemon=True
+        )
+        self._watchdog.start()
+        self.running = True
+        logger.info(
+            f"Loop monitor started with threshold {self.threshold}s and interval {self.interval}s"
+        )
+
+    async def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._stopped.set()
+        self._heartbeat_task.cancel()
+        try:
+            await self._heartbeat_task
+        except asyncio.CancelledError:
+            pass
+        self._watchdog.join(timeout=1)
+        logger.info("Loop monitor stopped")
+
+    @contextmanager
+    def track(self, method: str, path: str):
+        if not self.running:
+            yield
+            return
+        task = asyncio.current_task()
+        self._tasks[task] = self._route_name([method], path)
+        try:
+            yield
+        finally:
+            self._tasks.pop(task, None)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            routes = sorted(
+                self._routes.items(),
+                key=lambda item: item[1].blocked_total,
+                reverse=True,
+            )
+            return {
+                "enabled": self.running,
+                "threshold": self.threshold,
+                "lag": {
+                    "samples": self._lag_samples,
+                    "mean": round(self._lag_total / self._lag_samples, 6)
+                    if self._lag_samples
+                    else 0.0,
+                    "max": round(self._lag_max, 4),
+                },
+                "routes": {route: stats.as_dict() for route, stats in routes},
+            }
+
+    def log_summary(self):
+        summary = self.summary()
+        logger.info(
+            f"Loop lag: {summary['lag']['samples']} samples, mean {summary['lag']['mean']}s, max {summary['lag']['max']}s"
+        )
+        for route, stats in summary["routes"].items():
+            logger.warning(
+                f"Route {route} blocked the loop {stats['stalls']} times "
+                f"for {stats['blocked_total']}s (max {stats['blocked_max']}s)"
+            )
+
+    @staticmethod
+    def _route_name(methods: Optional[Iterable[str]], path: str) -> str:
+        if not methods:
+            return path
+        return f"{','.join(sorted(methods))} {path}"
+
+    async def _heartbeat(self):
+        while True:
+            start = perf_counter()
+            self._beat = start
+            await asyncio.sleep(self.interval)
+            lag = max(perf_counter() - start - self.interval, 0.0)
+            self._record(start, lag)
+
+    def _record(self, beat: float, lag: float):
+        sample = self._sample
+        with self._lock:
+            self._lag_samples += 1
+            self._lag_total += lag
+            self._lag_max = max(self._lag_max, lag)
+            if lag < self.threshold:
+                return
+            if sample is not None and sample[0] == beat:
+                route, stack = sample[1], sample[2]
+            else:
+                route, stack = UNKNOWN_ROUTE, None
+            self._routes.setdefault(route, RouteStats()).add(lag, stack)
+        logger.warning(f"Route {route} blocked the event loop for {round(lag, 4)}s")
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            sample = self._sample
+            if perf_counter() - beat < self.threshold:
+                continue
+            if sample is not None and sample[0] == beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            self._sample = (
+                beat,
+                self._resolve_route(stack),
+                tuple(
+                    f"{entry.filename}:{entry.lineno} in {entry.name}"
+                    for entry in stack[-MAX_STACK_DEPTH:]
+                ),
+            )
+
+    def _resolve_route(self, stack: traceback.StackSummary) -> str:
+        task = asyncio.current_task(self._loop)
+        route = self._tasks.get(task) if task is not None else None
+        if route is not None:
+            return route
+        # Routes that do not use LoggingRouter are found by their endpoint
+        for entry in reversed(stack):
+            route = self._endpoints.get((entry.filename, entry.name))
+            if route is not None:
+                return route
+        return UNKNOWN_ROUTE
+
+
+LOOP_MONITOR = LoopMonitor(LOOP_MONITOR_THRESHOLD, LOOP_MONITOR_INTERVAL)
@@ -0,0 +1,232 @@
+from asyncio import Lock
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import nsmallest
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import Levenshtein  # pyright: reportMissingTypeStubs=false
+from config import DEFAULT_LOGGER as logger
+from config import SCHOOL_SEARCH_TTL, TEACHER_SEARCH_TTL
+from models import database
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+N = 3
+# trigrams of a query shared by more names than this are not counted
+SIMILAR_POSTINGS = 2000
+LAST_CHARACTER = chr(0x10FFFF)
+# memorized prefix lookups of an index
+MAX_PREFIXES = 4096
+
+
+def ngrams(name: str) -> Set[str]:
+    # padded, so the start and the end of a name make grams of their own
+    padded = f"{' ' * (N - 1)}{name} "
+    return {padded[i : i + N] for i in range(len(padded) - N + 1)}
+
+
+def rank(name: str, query: str) -> Tuple[bool, int, int]:
+    """Substring matches first, earlier ones first, then by edit distance"""
+    index = name.find(query)
+    return index == -1, max(index, 0), Levenshtein.distance(name, query)
+
+
+class NgramIndex:
+    """Lowercased names by id, ids by character trigram of the name and names
+    in alphabetical order for prefix lookups"""
+
+    def __init__(self, names: Iterable[Tuple[int, str]] = ()):
+        self.names: Dict[int, str] = {}
+        self.grams: Dict[str, Set[int]] = {}
+        for uid, name in names:
+            self._add(uid, name.lower())
+        self.ordered: List[Tuple[str, int]] = sorted(
+            (name, uid) for uid, name in self.names.items()
+        )
+        # (prefix, limit) -> shortest names starting with it, short prefixes
+        # match a large part of the names and are asked for over and over
+        self._prefixes: Dict[Tuple[str, int], List[int]] = {}
+
+    def _add(self, uid: int, name: str):
+        self.names[uid] = name
+        for gram in ngrams(name):
+            self.grams.setdefault(gram, set()).add(uid)
+
+    def _forget_prefixes(self, name: str):
+        for key in [key for key in self._prefixes if name.startswith(key[0])]:
+            del self._prefixes[key]
+
+    def put(self, uid: int, name: str):
+        self.remove(uid)
+        name = name.lower()
+        self._add(uid, name)
+        insort(self.ordered, (name, uid))
+        self._forget_prefixes(name)
+
+    def remove(self, uid: int):
+        name = self.names.pop(uid, None)
+        if name is None:
+            return
+        del self.ordered[bisect_left(self.ordered, (name, uid))]
+        self._forget_prefixes(name)
+        for gram in ngrams(name):
+            ids = self.grams[gram]
+            ids.discard(uid)
+            if not ids:
+                del self.grams[gram]
+
+    def starting(self, query: str) -> List[Tuple[str, int]]:
+        """(name, id) of names starting with `query`"""
+        start = bisect_left(self.ordered, (query,))
+        end = bisect_left(self.ordered, (query + LAST_CHARACTER,), start)
+        return self.ordered[start:end]
+
+    def shortest_starting(self, query: str, limit: int) -> List[int]:
+        """Ids of up to `limit` shortest names starting with `query`, what
+        rank orders them by as the edit distance is the length difference"""
+        key = (query, limit)
+        if key not in self._prefixes:
+            if len(self._prefixes) >= MAX_PREFIXES:
+                self._prefixes.clear()
+            self._prefixes[key] = [
+                uid
+                for _, uid in nsmallest(
+                    limit, ((len(name), uid) for name, uid in self.starting(query))
+                )
+            ]
+        return self._prefixes[key]
+
+    def containing(self, query: str) -> Set[int]:
+        """Ids of names `query` is a substring of"""
+        if len(query) < N:
+            # a part of some trigram of every name it is a substring of, there
+            # are far fewer distinct trigrams than names
+            ids = set()
+            for gram, gram_ids in self.grams.items():
+                if query in gram:
+                    ids |= gram_ids
+            return {uid for uid in ids if query in self.names[uid]}
+        grams = sorted(
+            (
+                self.grams.get(query[i : i + N], set())
+                for i in range(len(query) - N + 1)
+            ),
+            key=len,
+        )
+        ids = set(grams[0])
+        for gram in grams[1:]:
+            if not ids:
+                break
+            ids &= gram
+        return {uid for uid in ids if query in self.names[uid]}
+
+    def similar(self, query: str, limit: int) -> List[int]:
+        """Up to `limit` ids sharing the most trigrams with `query`
+
+        Trigrams are counted rarest first and common ones are skipped once
+        SIMILAR_POSTINGS ids were counted, they tell little apart anyway.
+        """
+        shared: Counter = Counter()
+        counted = 0
+        for ids in sorted(
+            (self.grams.get(gram, set()) for gram in ngrams(query)), key=len
+        ):
+            if counted and counted + len(ids) > SIMILAR_POSTINGS:
+                break
+            shared.update(ids)
+            counted += len(ids)
+        return [uid for uid, _ in shared.most_common(limit)]
+
+    def search(self, query: str, limit: int, candidates: int) -> List[int]:
+        """Ids of the `limit` names closest to `query`
+
+        Prefix and substring matches rank first and are found exactly, the
+        rest of the result comes from the `candidates` names sharing the most
+        trigrams with the query. A query shorter than a trigram shares none
+        with a name, only prefix and substring matches are found then.
+        """
+        query = query.lower()
+        names = self.names
+        ids = self.shortest_starting(query, limit)
+        if len(ids) == limit:
+            return ids
+        ids = self.containing(query)
+        if len(ids) >= limit or len(query) < N:
+            # the edit distance is the length difference as for prefixes
+            return nsmallest(
+                limit,
+                ids,
+                key=lambda uid: (names[uid].find(query), len(names[uid]), uid),
+            )
+        # never more than `candidates` names are compared with the query
+        ids.update(self.similar(query, candidates))
+        return nsmallest(limit, ids, key=lambda uid: (rank(names[uid], query), uid))
+
+
+class NameIndexes:
+    """NgramIndex over names of `entity` rows of a worker, one per value of
+    the `scope` column or a single one if `scope` is None
+
+    An index is built on the first search, kept up to date by `put` from the
+    routers changing the names in this worker and rebuilt after `ttl` seconds
+    to pick up changes made by other workers.
+    """
+
+    def __init__(self, entity: type, ttl: float, scope: Optional[str] = "school_id"):
+        self.entity = entity
+        self.ttl = ttl
+        self.scope = scope
+        self.builds = 0
+        self._indexes: Dict[Optional[int], Tuple[float, NgramIndex]] = {}
+        self._locks: Dict[Optional[int], Lock] = {}
+        # bumped by every change, a build that raced one is not stored
+        self._generation = 0
+
+    def _cached(self, scope_id: Optional[int]) -> Optional[NgramIndex]:
+        cached = self._indexes.get(scope_id)
+        if cached is None or monotonic() - cached[0] >= self.ttl:
+            return None
+        return cached[1]
+
+    async def get(
+        self, session: AsyncSession, scope_id: Optional[int] = None
+    ) -> NgramIndex:
+        index = self._cached(scope_id)
+        if index is not None:
+            return index
+        async with self._locks.setdefault(scope_id, Lock()):
+            index = self._cached(scope_id)
+            if index is not None:
+                return index
+            generation = self._generation
+            query = select(self.entity.id, self.entity.name)
+            if self.scope is not None:
+                query = query.filter_by(**{self.scope: scope_id})
+            index = NgramIndex((await session.execute(query)).all())
+            self.builds += 1
+            logger.debug(
+                f"Built name index of {self.entity.__tablename__} rows with {self.scope}={scope_id}"
+            )
+            if generation == self._generation:
+                self._indexes[scope_id] = (monotonic(), index)
+            return index
+
+    def put(self, scope_id: Optional[int], uid: int, name: str):
+        """Index a created or renamed row, call after the commit"""
+        self._generation += 1
+        cached = self._indexes.get(scope_id)
+        if cached is not None:
+            cached[1].put(uid, name)
+
+    def invalidate(self, scope_id: Optional[int] = None):
+        """Drop the index of a scope, every index if `scope_id` is None"""
+        self._generation += 1
+        if scope_id is None:
+            self._indexes.clear()
+        else:
+            self._indexes.pop(scope_id, None)
+
+
+TEACHER_NAMES = NameIndexes(database.Teacher, TEACHER_SEARCH_TTL)
+SCHOOL_NAMES = NameIndexes(database.School, SCHOOL_SEARCH_TTL, scope=None)
@@ -0,0 +1,110 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple
+
+from config import N_PLUS_ONE_THRESHOLD
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# "IN (?, ?, ?)" of selectin loads differs only by the amount of parameters
+_PARAMETER_LIST = re.compile(r"\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,?)+\)")
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+
+    def add(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        statement = " ".join(statement.split())
+        self.statements[_PARAMETER_LIST.sub("(...)", statement)] += 1
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statements executed at least `threshold` times, likely N+1 loads"""
+        return [
+            (statement, count)
+            for statement, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "X-DB-Queries": str(self.count),
+            "X-DB-Time": f"{self.duration * 1000:.2f}",
+            "X-DB-Repeated": str(len(self.repeated())),
+        }
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar(
+    "query_stats", default=None
+)
+
+
+# a connection executes one statement at a time, the start of a statement that
+# failed is overwritten by the next one instead of piling up
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start")
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(statement, perf_counter() - start)
+
+
+@contextmanager
+def count_queries():
+    """Collect statements executed by the current task into a QueryStats"""
+    stats = QueryStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(budget: int):
+    """Fail if the wrapped code executes more than `budget` statements
+
+    For tests that await handlers directly:
+
+        with query_budget(4):
+            await lessons.get_lesson_for_day(..., session=session)
+    """
+    with count_queries() as stats:
+        yield stats
+    if stats.count > budget:
+        repeated = "".join(
+            f"\n  {count}x {statement}" for statement, count in stats.repeated()
+        )
+        raise QueryBudgetExceeded(
+            f"{stats.count} statements executed, budget is {budget}{repeated}"
+        )
+
+
+def assert_query_budget(response, budget: int):
+    """Fail if a response of a LoggingRouter route reports more than `budget`
+    statements
+
+        assert_query_budget(client.get("/api/lesson/get/day", ...), 4)
+    """
+    count = int(response.headers["X-DB-Queries"])
+    if count > budget:
+        raise QueryBudgetExceeded(
+            f"{count} statements executed, budget is {budget}, "
+            f"{response.headers['X-DB-Repeated']} of them repeated (see QRY log)"
+        )
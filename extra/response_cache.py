@@ -0,0 +1,414 @@
+import asyncio
+from itertools import chain
+from time import monotonic
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+from config import DEFAULT_LOGGER as logger
+from config import (
+    RESPONSE_CACHE_LOCK_SECONDS,
+    RESPONSE_CACHE_TTL,
+    RESPONSE_CACHE_URL,
+)
+from extra.database_pool import PrimarySession
+from fastapi import Request, Response
+from models import database
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+
+PREFIX = "skedule"
+CHANNEL = f"{PREFIX}:invalidate"
+GLOBAL_TAG = f"{PREFIX}:tag:global"
+# query parameters a cached response is scoped by
+SCOPES = {"school_id": "school", "corpus_id": "corpus"}
+# a commit touching any of these drops the responses of the row's school
+CACHED_ENTITIES = (
+    database.School,
+    database.Corpus,
+    database.Cabinet,
+    database.Teacher,
+    database.Subclass,
+    database.Lesson_number,
+    database.Lesson,
+    database.Tag,
+)
+POLL_INTERVAL = 0.05
+# key, tags and whether the lock of the key is held
+Miss = Tuple[str, List[str], bool]
+
+
+def scope_tag(scope: str, uid) -> str:
+    return f"{PREFIX}:tag:{scope}:{uid}"
+
+
+def pack(body: bytes, etag: Optional[str]) -> bytes:
+    """Entry of a response, the ETag is kept on the first line"""
+    return (etag or "").encode() + b"\n" + body
+
+
+def unpack(entry: bytes) -> Tuple[bytes, Optional[str]]:
+    etag, _, body = entry.partition(b"\n")
+    return body, etag.decode() or None
+
+
+def generation_key(tag: str) -> str:
+    # never expires, an entry of an old generation must not become current
+    return f"{tag}:generation"
+
+
+def scope_ids(scope: str, tags: Iterable[str]) -> Set[int]:
+    """Ids of `scope` the tags are about"""
+    prefix = scope_tag(scope, "")
+    return {
+        int(tag[len(prefix) :])
+        for tag in tags
+        if tag.startswith(prefix) and tag[len(prefix) :].isdigit()
+    }
+
+
+class MemoryBackend:
+    """Stand-in for RedisBackend inside one process, for a single worker and
+    for tests"""
+
+    errors: Tuple[type, ...] = ()
+
+    def __init__(self):
+        self._values: Dict[str, Tuple[float, bytes]] = {}
+        self._tags: Dict[str, Set[str]] = {}
+        self._generations: Dict[str, int] = {}
+
+    async def generations(self, tags: List[str]) -> List[int]:
+        return [self._generations.get(tag, 0) for tag in tags]
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self._values.get(key)
+        if value is None or value[0] < monotonic():
+            self._values.pop(key, None)
+            return None
+        return value[1]
+
+    async def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str]):
+        self._values[key] = (monotonic() + ttl, value)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+    async def add(self, key: str, ttl: float) -> bool:
+        if await self.get(key) is not None:
+            return False
+        self._values[key] = (monotonic() + ttl, b"")
+        return True
+
+    async def delete(self, key: str):
+        self._values.pop(key, None)
+
+    async def invalidate(self, tags: Iterable[str]):
+        for tag in tags:
+            self._generations[tag] = self._generations.get(tag, 0) + 1
+            for key in self._tags.pop(tag, ()):
+                self._values.pop(key, None)
+
+    async def publish(self, tags: Iterable[str]):
+        pass
+
+    async def listen(self, callback: Callable[[Set[str]], None]):
+        pass
+
+    async def close(self):
+        pass
+
+
+class RedisBackend:
+    """Entries are plain keys, a tag is a set of the keys scoped by it and a
+    counter of its invalidations. Invalidations are published, so workers can
+    drop their local caches"""
+
+    def __init__(self, redis):
+        from redis.exceptions import RedisError
+
+        self.redis = redis
+        self.errors: Tuple[type, ...] = (RedisError, OSError, asyncio.TimeoutError)
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        # aioredis lives on as redis.asyncio, aioredis 2.0 itself fails to
+        # import on Python 3.11
+        from redis.asyncio import from_url
+
+        return cls(from_url(url))
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.redis.get(key)
+
+    async def generations(self, tags: List[str]) -> List[int]:
+        counters = await self.redis.mget([generation_key(tag) for tag in tags])
+        return [int(counter or 0) for counter in counters]
+
+    async def set(self, key: str, value: bytes, ttl: float, tags: Iterable[str]):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(key, value, ex=int(ttl))
+            for tag in tags:
+                pipe.sadd(tag, key)
+                pipe.expire(tag, int(ttl))
+            await pipe.execute()
+
+    async def add(self, key: str, ttl: float) -> bool:
+        return bool(await self.redis.set(key, b"", px=int(ttl * 1000), nx=True))
+
+    async def delete(self, key: str):
+        await self.redis.delete(key)
+
+    async def invalidate(self, tags: Iterable[str]):
+        tags = list(tags)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(generation_key(tag))
+            for tag in tags:
+                pipe.smembers(tag)
+            results = await pipe.execute()
+        keys = set(chain.from_iterable(results[len(tags) :]))
+        await self.redis.delete(*tags, *keys)
+
+    async def publish(self, tags: Iterable[str]):
+        await self.redis.publish(CHANNEL, " ".join(tags))
+
+    async def listen(self, callback: Callable[[Set[str]], None]):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    callback(set(message["data"].decode().split()))
+        finally:
+            await pubsub.close()
+
+    async def close(self):
+        await self.redis.close()
+
+
+def make_backend(url: str):
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemoryBackend()
+    return RedisBackend.from_url(url)
+
+
+class ResponseCache:
+    """JSON responses of GET routes keyed by path and query parameters
+
+    Entries are tagged with the school or corpus from the query (or as global
+    when there is none). A PrimarySession commit drops the tags of the rows it
+    touched together with the global one, the deletions are applied before the
+    writing request responds. Every drop also bumps the generation of the tag,
+    which is a part of the key: a response computed from rows read before the
+    commit is stored under the old generation and never served. Of concurrent
+    misses for a key only one computes the response, the rest wait for it.
+    """
+
+    def __init__(self, backend, ttl: float, lock_seconds: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._pending: Set[str] = set()
+        self._callbacks: List[Callable[[Set[str]], None]] = []
+        self._listener: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    def key(self, path: str, request: Request) -> Tuple[str, List[str]]:
+        """Key of the response without the generations and its tags"""
+        params = request.query_params
+        query = urlencode(sorted(params.multi_items()))
+        tags = [
+            scope_tag(scope, params[name])
+            for name, scope in SCOPES.items()
+            if name in params
+        ]
+        return f"{PREFIX}:response:{path}?{query}", tags or [GLOBAL_TAG]
+
+    async def lookup(
+        self, path: str, request: Request
+    ) -> Tuple[Optional[Response], Optional[Miss]]:
+        """The stored response or the key, tags and whether the lock is held
+        to store the computed one under, None for both when the backend is
+        unavailable. Callers check the access to the route before"""
+        key, tags = self.key(path, request)
+        try:
+            # read before the handler reads any row
+            generations = await self.backend.generations(tags)
+            key = f"{key}#{'.'.join(map(str, generations))}"
+            entry = await self.backend.get(key)
+            locked = False
+            if entry is None:
+                locked = await self.backend.add(f"{key}:lock", self.lock_seconds)
+                if not locked:
+                    entry = await self._wait(key)
+        except self.backend.errors as error:
+            self.errors += 1
+            logger.warning(f"Response cache is unavailable: {error!r}")
+            return None, None
+
+        if entry is not None:
+            self.hits += 1
+            body, etag = unpack(entry)
+            headers = {"X-Cache": "HIT"}
+            if etag is not None:
+                headers["ETag"] = etag
+            response = Response(
+                content=body, media_type="application/json", headers=headers
+            )
+            return response, None
+        self.misses += 1
+        return None, (key, tags, locked)
+
+    async def store(self, miss: Optional[Miss], response: Response):
+        """Keep a computed response of a miss if it succeeded"""
+        if miss is None:
+            return
+        key, tags, locked = miss
+        try:
+            if response.status_code == 200:
+                entry = pack(response.body, response.headers.get("ETag"))
+                await self.backend.set(key, entry, self.ttl, tags)
+            if locked:
+                await self.backend.delete(f"{key}:lock")
+        except self.backend.errors as error:
+            self.errors += 1
+            logger.warning(f"Response cache is unavailable: {error!r}")
+        response.headers["X-Cache"] = "MISS"
+
+    async def release(self, miss: Optional[Miss]):
+        """Let the waiters of a miss that got no response compute their own"""
+        if miss is None or not miss[2]:
+            return
+        try:
+            await self.backend.delete(f"{miss[0]}:lock")
+        except self.backend.errors:
+            pass
+
+    async def serve(self, path: str, request: Request, handler) -> Response:
+        response, miss = await self.lookup(path, request)
+        if response is not None:
+            return response
+        try:
+            response = await handler(request)
+        except BaseException:
+            await self.release(miss)
+            raise
+        await self.store(miss, response)
+        return response
+
+    async def _wait(self, key: str) -> Optional[bytes]:
+        """Entry stored by the holder of the lock, None if it released the lock
+        without storing one (an error response) or held it too long"""
+        deadline = monotonic() + self.lock_seconds
+        while monotonic() < deadline:
+            await asyncio.sleep(POLL_INTERVAL)
+            entry = await self.backend.get(key)
+            if entry is not None:
+                return entry
+            if await self.backend.get(f"{key}:lock") is None:
+                # stored and released right after the entry was read
+                return await self.backend.get(key)
+        return None
+
+    def mark(self, session: AsyncSession, school_id: int, corpus_ids: Iterable[int]):
+        """Drop the responses of a school when `session` commits, for writes
+        that bypass the unit of work like bulk INSERTs"""
+        tags = session.sync_session.info.setdefault("response_cache_tags", set())
+        tags.add(scope_tag("school", school_id))
+        tags.update(scope_tag("corpus", corpus_id) for corpus_id in corpus_ids)
+
+    def invalidate_on_commit(self, session_class):
+        @event.listens_for(session_class, "after_flush")
+        def collect(session, flush_context):
+            tags = session.info.setdefault("response_cache_tags", set())
+            for instance in chain(session.new, session.dirty, session.deleted):
+                if not isinstance(instance, CACHED_ENTITIES):
+                    continue
+                values = inspect(instance).dict
+                if isinstance(instance, database.School):
+                    tags.add(scope_tag("school", instance.id))
+                if isinstance(instance, database.Corpus):
+                    tags.add(scope_tag("corpus", instance.id))
+                if values.get("school_id") is not None:
+                    tags.add(scope_tag("school", values["school_id"]))
+                if values.get("corpus_id") is not None:
+                    tags.add(scope_tag("corpus", values["corpus_id"]))
+                # school and tag lists are global
+                tags.add(GLOBAL_TAG)
+
+        @event.listens_for(session_class, "after_commit")
+        def schedule(session):
+            if self.enabled:
+                self._pending.update(session.info.get("response_cache_tags", ()))
+
+        @event.listens_for(session_class, "after_transaction_end")
+        def forget(session, transaction):
+            if transaction.parent is None:
+                session.info.pop("response_cache_tags", None)
+
+    async def flush(self):
+        """Apply the invalidations of finished commits"""
+        if not self._pending:
+            return
+        tags, self._pending = self._pending, set()
+        try:
+            await self.backend.invalidate(tags)
+            await self.backend.publish(tags)
+        except self.backend.errors as error:
+            self.errors += 1
+            logger.warning(f"Response cache invalidation failed: {error!r}")
+
+    def on_invalidate(self, callback: Callable[[Set[str]], None]):
+        """Call `callback` with the tags invalidated by any worker"""
+        self._callbacks.append(callback)
+
+    def _notify(self, tags: Set[str]):
+        for callback in self._callbacks:
+            callback(tags)
+
+    async def _listen(self):
+        while True:
+            try:
+                await self.backend.listen(self._notify)
+                return
+            except self.backend.errors as error:
+                logger.warning(f"Response cache subscription lost: {error!r}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        if self.enabled and self._listener is None:
+            self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self.enabled:
+            await self.backend.close()
+
+    def stats(self) -> Dict[str, object]:
+        requests = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__ if self.enabled else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / requests, 4) if requests else None,
+            "errors": self.errors,
+        }
+
+
+RESPONSE_CACHE = ResponseCache(
+    make_backend(RESPONSE_CACHE_URL), RESPONSE_CACHE_TTL, RESPONSE_CACHE_LOCK_SECONDS
+)
+RESPONSE_CACHE.invalidate_on_commit(PrimarySession)
@@ -0,0 +1,160 @@
+from contextvars import ContextVar
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config import ENGINE
+from extra.database_pool import PrimarySession
+from models import database
+from sqlalchemy import bindparam, event, insert, inspect, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.future import select
+
+school = database.School.__table__
+change_log = database.Change_log.__table__
+# rows a school timetable is made of
+VERSIONED_ENTITIES = (
+    database.Corpus,
+    database.Cabinet,
+    database.Teacher,
+    database.Subclass,
+    database.Lesson_number,
+    database.Lesson,
+)
+# the ones recorded in change_log, see routers/botapi/info.py changes feed
+LOGGED_ENTITIES = (
+    database.Cabinet,
+    database.Teacher,
+    database.Subclass,
+    database.Lesson_number,
+    database.Lesson,
+)
+
+# table name, row id, deleted
+Change = Tuple[str, int, bool]
+
+# school id -> version the body of the current response was read at
+BODY_VERSIONS: ContextVar[Optional[Dict[int, int]]] = ContextVar(
+    "body_versions", default=None
+)
+
+
+def bump_statement(school_ids: Iterable[int], corpus_ids: Iterable[int] = ()):
+    condition = school.c.id.in_(set(school_ids))
+    corpus_ids = set(corpus_ids)
+    if corpus_ids:
+        condition |= school.c.id.in_(
+            select(database.Corpus.school_id).where(database.Corpus.id.in_(corpus_ids))
+        )
+    return (
+        update(school).where(condition).values(data_version=school.c.data_version + 1)
+    )
+
+
+def log_statement():
+    # executed after the bump, so entries get the version they produced
+    return insert(change_log).values(
+        school_id=bindparam("log_school_id"),
+        version=select(school.c.data_version)
+        .where(school.c.id == bindparam("log_school_id"))
+        .scalar_subquery(),
+        entity=bindparam("log_entity"),
+        entity_id=bindparam("log_entity_id"),
+        deleted=bindparam("log_deleted"),
+    )
+
+
+def log_rows(school_id: int, changes: Iterable[Change]) -> List[Dict]:
+    return [
+        {
+            "log_school_id": school_id,
+            "log_entity": entity,
+            "log_entity_id": entity_id,
+            "log_deleted": deleted,
+        }
+        for entity, entity_id, deleted in changes
+    ]
+
+
+class SchoolVersions:
+    """Monotonic per-school data version kept in school.data_version
+
+    The version is bumped in the transaction that changes the school, so every
+    worker reads the same value from the primary. Changed rows are appended to
+    change_log with the version they produced.
+    """
+
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+
+    async def get(self, school_id: int) -> Optional[int]:
+        """Current version of the school on the primary, None if it does not
+        exist"""
+        async with self.engine.connect() as connection:
+            return await connection.scalar(
+                select(school.c.data_version).where(school.c.id == school_id)
+            )
+
+    async def read(self, session: AsyncSession, school_id: int) -> Optional[int]:
+        """Version of the school as `session` sees it, labels the response.
+        Read before the rows of the body, so they are at least that new"""
+        version = await session.scalar(
+            select(school.c.data_version).where(school.c.id == school_id)
+        )
+        if version is not None:
+            self.observe(school_id, version)
+        return version
+
+    @staticmethod
+    def observe(school_id: int, version: int):
+        """Label the current response with the version its body was built
+        from, see extra/api_router.py VersionedRoute"""
+        versions = BODY_VERSIONS.get()
+        if versions is not None:
+            # a body made of several reads is as old as the oldest one
+            versions[school_id] = min(versions.get(school_id, version), version)
+
+    async def bump(
+        self, session: AsyncSession, school_id: int, changes: Iterable[Change] = ()
+    ):
+        """For writes that bypass the unit of work like bulk INSERTs"""
+        await session.execute(bump_statement([school_id]))
+        rows = log_rows(school_id, changes)
+        if rows:
+            await session.execute(log_statement(), rows)
+
+    def bump_on_flush(self, session_class):
+        @event.listens_for(session_class, "after_flush")
+        def bump(session, flush_context):
+            school_ids: Set[int] = set()
+            corpus_ids: Set[int] = set()
+            rows: List[Dict] = []
+            for instance in chain(session.new, session.dirty, session.deleted):
+                if isinstance(instance, database.School):
+                    if instance not in session.deleted:
+                        school_ids.add(instance.id)
+                elif isinstance(instance, VERSIONED_ENTITIES):
+                    values = inspect(instance).dict
+                    school_id = values.get("school_id")
+                    if school_id is None:
+                        # cabinets may lack a school, they are not logged then
+                        if values.get("corpus_id") is not None:
+                            corpus_ids.add(values["corpus_id"])
+                        continue
+                    school_ids.add(school_id)
+                    if isinstance(instance, LOGGED_ENTITIES):
+                        change = (
+                            instance.__tablename__,
+                            values["id"],
+                            instance in session.deleted,
+                        )
+                        rows += log_rows(school_id, [change])
+            if school_ids or corpus_ids:
+                # the connection, session.execute would try to flush again
+                connection = session.connection()
+                connection.execute(bump_statement(school_ids, corpus_ids))
+                if rows:
+                    connection.execute(log_statement(), rows)
+
+
+SCHOOL_VERSIONS = SchoolVersions(ENGINE)
+SCHOOL_VERSIONS.bump_on_flush(PrimarySession)
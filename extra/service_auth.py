@@ -21,7 +21,8 @@ from jose import JWTError, jwt
 from models import database
 from passlib.context import CryptContext
 from config import BaseModel
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 
 # do not user logging middlewhere here
 router = APIRouter(prefix=API_PREFIX + API_SERVICE_AUTH_PREFIX)
@@ -49,12 +50,14 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
-def get_user(service_name: str, session: Session):
-    return session.query(database.Service).filter_by(name=service_name).first()
+async def get_user(service_name: str, session: AsyncSession):
+    return await session.scalar(
+        select(database.Service).filter_by(name=service_name).limit(1)
+    )
 
 
-def authenticate_user(service_name: str, password: str, session: Session):
-    user = get_user(service_name, session)
+async def authenticate_user(service_name: str, password: str, session: AsyncSession):
+    user = await get_user(service_name, session)
     if not user:
         return False
     if not verify_password(password, user.password):
@@ -72,7 +75,7 @@ def create_access_token(data: dict):
     return encoded_jwt
 
 
-def get_current_service(
+async def get_current_service(
     _: SecurityScopes,
     token: str = Depends(OAUTH2_SERVICE_SCHEME),
     session=Depends(get_session),
@@ -93,7 +96,7 @@ def get_current_service(
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(token_data.username, session)
+    user = await get_user(token_data.username, session)
     if user is None:
         raise credentials_exception
     return user
@@ -103,7 +106,7 @@ class AllowLevels:
     def __init__(self, *levels: Access):
         self.levels = [level.value for level in levels]
 
-    def __call__(self, service=Depends(get_current_service)):
+    async def __call__(self, service=Depends(get_current_service)):
         if service.access_level not in self.levels:
             raise HTTPException(
                 status_code=401,
@@ -117,7 +120,7 @@ class AllowLevels:
 async def service_login(
     form_data: OAuth2PasswordRequestForm = Depends(), session=Depends(get_session)
 ):
-    user = authenticate_user(form_data.username, form_data.password, session)
+    user = await authenticate_user(form_data.username, form_data.password, session)
     if not user:
         raise HTTPException(
             status_code=401,
@@ -0,0 +1,298 @@
+import asyncio
+from datetime import date, datetime
+from itertools import chain
+from typing import Callable, Collection, Iterable, List, Optional, Set, Tuple
+
+from config import DEFAULT_LOGGER as logger
+from config import SESSION_FACTORY, STATS_ROLLUP_DELAY_SECONDS
+from extra.database_pool import PrimarySession
+from models import database
+from sqlalchemy import distinct, event, func, inspect, literal, union_all
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select, delete, insert
+
+Role = database.Role
+Student = database.Student
+Teacher = database.Teacher
+Administration = database.Administration
+rollup = database.Stats_rollup.__table__
+
+COUNTS = {
+    "students": database.RoleEnum.STUDENT,
+    "teachers": database.RoleEnum.TEACHER,
+    "parents": database.RoleEnum.PARENT,
+    "administrations": database.RoleEnum.ADMINISTRATION,
+}
+USERS = "users"
+PARALLEL = "parallel"
+CHILDREN = "children"
+
+
+def today() -> date:
+    return datetime.utcnow().date()
+
+
+def role_schools(school_ids: Optional[Collection[int]] = None):
+    """(role id, school id) of every role, parents once per school of their
+    children, only of `school_ids` if given"""
+
+    def within(query: Select, school) -> Select:
+        return query if school_ids is None else query.filter(school.in_(school_ids))
+
+    return union_all(
+        within(
+            select(Role.id.label("role_id"), Student.school_id.label("school_id")).join(
+                Student, Role.student_id == Student.id
+            ),
+            Student.school_id,
+        ),
+        within(
+            select(Role.id, Teacher.school_id).join(
+                Teacher, Role.teacher_id == Teacher.id
+            ),
+            Teacher.school_id,
+        ),
+        within(
+            select(Role.id, Administration.school_id).join(
+                Administration, Role.administration_id == Administration.id
+            ),
+            Administration.school_id,
+        ),
+        within(
+            select(Role.id, Student.school_id)
+            .join(Student, Role.parent_id == Student.parent_id)
+            .distinct(),
+            Student.school_id,
+        ),
+    ).subquery()
+
+
+def counters(school_ids: Collection[int]) -> List[Tuple[str, Select]]:
+    """(metric, query of (school id, key, value)) of the schools"""
+    schools = role_schools(school_ids)
+    school = database.School.__table__
+    queries = [
+        (
+            # a row for every school even without users, it marks the day
+            USERS,
+            select(
+                school.c.id,
+                literal(0),
+                func.count(distinct(Role.account_id)),
+            )
+            .select_from(school)
+            .join(schools, schools.c.school_id == school.c.id, isouter=True)
+            .join(Role, Role.id == schools.c.role_id, isouter=True)
+            .filter(school.c.id.in_(school_ids))
+            .group_by(school.c.id),
+        )
+    ]
+    for metric, role_type in COUNTS.items():
+        query = (
+            select(schools.c.school_id, literal(0), func.count(distinct(Role.id)))
+            .join(Role, Role.id == schools.c.role_id)
+            .filter(Role.role_type == role_type)
+            .group_by(schools.c.school_id)
+        )
+        if role_type == database.RoleEnum.STUDENT:
+            # as /stats/students, students without an account are not users
+            query = query.filter(Role.account_id.isnot(None))
+        queries.append((metric, query))
+    queries.append(
+        (
+            PARALLEL,
+            select(Student.school_id, database.Subclass.educational_level, func.count())
+            .select_from(Role)
+            .join(Student, Role.student_id == Student.id)
+            .join(database.Subclass, Student.subclass_id == database.Subclass.id)
+            .filter(
+                Role.role_type == database.RoleEnum.STUDENT,
+                Student.school_id.in_(school_ids),
+            )
+            .group_by(Student.school_id, database.Subclass.educational_level),
+        )
+    )
+    children = (
+        select(
+            Student.school_id.label("school_id"),
+            func.count(Student.id).label("children"),
+        )
+        .select_from(Role)
+        .join(Student, Role.parent_id == Student.parent_id)
+        .filter(
+            Role.role_type == database.RoleEnum.PARENT,
+            Student.school_id.in_(school_ids),
+        )
+        .group_by(Role.id, Student.school_id)
+        .subquery()
+    )
+    queries.append(
+        (
+            CHILDREN,
+            select(children.c.school_id, children.c.children, func.count()).group_by(
+                children.c.school_id, children.c.children
+            ),
+        )
+    )
+    return queries
+
+
+def refresh(connection: Connection, school_ids: Collection[int], day: date):
+    """Recount the counters of the schools for `day`"""
+    if not school_ids:
+        return
+    connection.execute(
+        delete(rollup).where(rollup.c.day == day, rollup.c.school_id.in_(school_ids))
+    )
+    for metric, query in counters(school_ids):
+        counted = query.subquery()
+        school_id, key, value = counted.c
+        connection.execute(
+            insert(rollup).from_select(
+                ["school_id", "day", "metric", "key", "value"],
+                select(school_id, literal(day), literal(metric), key, value),
+            )
+        )
+
+
+def values(instance, *keys: str) -> Iterable[int]:
+    """Current and flushed away values of the attributes"""
+    attributes = inspect(instance).attrs
+    for key in keys:
+        for value in attributes[key].history.sum():
+            if value is not None:
+                yield value
+
+
+def changed_schools(session) -> Set[int]:
+    """Schools whose roles the flush of `session` changed"""
+    schools: Set[int] = set()
+    teachers: Set[int] = set()
+    students: Set[int] = set()
+    parents: Set[int] = set()
+    administrations: Set[int] = set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, (Student, Administration)):
+            schools.update(values(instance, "school_id"))
+            if isinstance(instance, Student):
+                parents.update(values(instance, "parent_id"))
+        elif isinstance(instance, Role):
+            teachers.update(values(instance, "teacher_id"))
+            students.update(values(instance, "student_id"))
+            parents.update(values(instance, "parent_id"))
+            administrations.update(values(instance, "administration_id"))
+    if not (teachers or students or parents or administrations):
+        return schools - {None}
+    # the connection, session.execute would try to flush again
+    connection = session.connection()
+    if teachers:
+        schools.update(
+            connection.scalars(
+                select(Teacher.school_id).filter(Teacher.id.in_(teachers))
+            )
+        )
+    if administrations:
+        schools.update(
+            connection.scalars(
+                select(Administration.school_id).filter(
+                    Administration.id.in_(administrations)
+                )
+            )
+        )
+    if students or parents:
+        schools.update(
+            connection.scalars(
+                select(Student.school_id).filter(
+                    Student.id.in_(students) | Student.parent_id.in_(parents)
+                )
+            )
+        )
+    return schools - {None}
+
+
+class StatsRollup:
+    """Recounts today's counters of schools whose roles were committed
+
+    Schools are collected on flush and recounted by a background task of the
+    worker `delay` seconds after the commit, each in a transaction of its own.
+    Neither a registration nor any other request waits for a recount or holds
+    locks of stats_rollup, and the commits of a school within `delay` are
+    recounted once. A school that could not be recounted is tried again after
+    the next commit.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.session_factory: Callable[..., AsyncSession] = SESSION_FACTORY
+        self.refreshes = 0
+        self.errors = 0
+        self._pending: Set[int] = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def refresh_on_commit(self, session_class):
+        @event.listens_for(session_class, "after_flush")
+        def collect(session, flush_context):
+            schools = changed_schools(session)
+            if schools:
+                session.info.setdefault("stats_rollup_schools", set()).update(schools)
+
+        @event.listens_for(session_class, "after_commit")
+        def schedule(session):
+            schools = session.info.get("stats_rollup_schools", ())
+            self._pending.update(schools)
+            if schools and self._wakeup is not None:
+                self._wakeup.set()
+
+        @event.listens_for(session_class, "after_transaction_end")
+        def forget(session, transaction):
+            if transaction.parent is None:
+                session.info.pop("stats_rollup_schools", None)
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.delay)
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Recount the schools of finished commits"""
+        if not self._pending:
+            return
+        schools, self._pending = self._pending, set()
+        for school_id in sorted(schools):
+            try:
+                async with self.session_factory() as session:
+                    await session.run_sync(
+                        lambda sync: refresh(sync.connection(), [school_id], today())
+                    )
+                    await session.commit()
+                self.refreshes += 1
+            except Exception as error:
+                self.errors += 1
+                self._pending.add(school_id)
+                logger.warning(
+                    f"Can not count statistics of school with id {school_id}: {error!r}"
+                )
+
+
+STATS_ROLLUP = StatsRollup(STATS_ROLLUP_DELAY_SECONDS)
+STATS_ROLLUP.refresh_on_commit(PrimarySession)
@@ -1,5 +1,6 @@
 from typing import List
-from sqlalchemy.orm.session import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
 from models import database
 
 INFO = "#info"
@@ -19,12 +20,16 @@ PARENT = "#parent"
 ANNOUNCEMENTS = "#announcements"
 STATS = "#stats"
 TAG = "#tags"
+MONITOR = "#monitor"
+TIMETABLE = "#timetable"
 
 
-def get_tags(session: Session, request: List[str]) -> List[database.Tag]:
+async def get_tags(session: AsyncSession, request: List[str]) -> List[database.Tag]:
     tags = []
     for request_tag in request:
-        tag = session.query(database.Tag).filter_by(label=request_tag.lower()).first()
+        tag = await session.scalar(
+            select(database.Tag).filter_by(label=request_tag.lower()).limit(1)
+        )
         if tag is None:
             tag = database.Tag(label=request_tag.lower())
             session.add(tag)
@@ -0,0 +1,101 @@
+from asyncio import Lock
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Dict, Optional
+
+from config import DEFAULT_LOGGER as logger
+from config import TELEGRAPH_PAGE_CACHE_SIZE, TELEGRAPH_TOKEN
+from telegraph.aio import Telegraph
+from telegraph.exceptions import InvalidHTML, TelegraphException
+
+SHORT_NAME = "skedule_bot"
+AUTHOR_NAME = "Skedule Publisher"
+AUTHOR_URL = "https://t.me/skedule_bot"
+
+
+def content_hash(title: str, text: str) -> str:
+    return sha256(f"{title}\0{text}".encode()).hexdigest()
+
+
+class TelegraphPages:
+    """Telegraph pages published by a worker
+
+    One Telegraph account is made per worker on the first publish (or the
+    token from the config is used) and kept for every page after it. URLs of
+    the last `size` pages are kept by content hash, publishing the same title
+    and text again costs no call to Telegraph.
+    """
+
+    def __init__(self, token: str, size: int):
+        self.token = token
+        self.size = size
+        self.published = 0
+        self.hits = 0
+        self._client: Optional[Telegraph] = None
+        self._lock: Optional[Lock] = None
+        self._pages: "OrderedDict[str, str]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        url = self._pages.get(key)
+        if url is not None:
+            self._pages.move_to_end(key)
+            self.hits += 1
+        return url
+
+    def put(self, key: str, url: str):
+        self._pages[key] = url
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.size:
+            self._pages.popitem(last=False)
+
+    async def client(self) -> Telegraph:
+        if self._lock is None:
+            self._lock = Lock()
+        async with self._lock:
+            if self._client is None:
+                client = Telegraph(self.token or None)
+                if not self.token:
+                    await client.create_account(
+                        short_name=SHORT_NAME,
+                        author_name=AUTHOR_NAME,
+                        author_url=AUTHOR_URL,
+                    )
+                    logger.info("Created Telegraph account")
+                self._client = client
+            return self._client
+
+    async def publish(self, title: str, text: str, key: Optional[str] = None) -> str:
+        """URL of a page with the title and the HTML text, InvalidHTML is raised
+        as is"""
+        key = key or content_hash(title, text)
+        url = self.get(key)
+        if url is not None:
+            return url
+        client = await self.client()
+        try:
+            page = await client.create_page(
+                title,
+                html_content=text,
+                author_name=AUTHOR_NAME,
+                author_url=AUTHOR_URL,
+            )
+        except InvalidHTML:
+            raise
+        except TelegraphException:
+            # a revoked token for example, the next publish makes an account
+            if not self.token:
+                self._client = None
+            raise
+        self.published += 1
+        self.put(key, page["url"])
+        return page["url"]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "pages": len(self._pages),
+            "published": self.published,
+            "hits": self.hits,
+        }
+
+
+TELEGRAPH_PAGES = TelegraphPages(TELEGRAPH_TOKEN, TELEGRAPH_PAGE_CACHE_SIZE)
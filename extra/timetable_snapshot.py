@@ -0,0 +1,344 @@
+from asyncio import Lock
+from itertools import chain
+from time import monotonic
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import valid_db_requests as db_validated
+from config import DEFAULT_LOGGER as logger
+from config import (
+    DATABASE_REPLICA_PIN_SECONDS,
+    SESSION_FACTORY,
+    TIMETABLE_SNAPSHOT_TTL,
+)
+from extra.database_pool import PrimarySession
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from models import database
+from models.bot import info, item
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+TEACHER = "teacher"
+SUBCLASS = "subclass"
+# a commit touching any of these drops the snapshot of the row's school
+TIMETABLE_ENTITIES = (
+    database.School,
+    database.Corpus,
+    database.Cabinet,
+    database.Teacher,
+    database.Subclass,
+    database.Lesson_number,
+    database.Lesson,
+)
+
+OwnerKey = Tuple[str, int, int]
+
+
+def render(model) -> bytes:
+    """Bytes FastAPI would send for `model` returned from a route"""
+    return JSONResponse(jsonable_encoder(model)).body
+
+
+class SchoolTimetable:
+    """Lessons of one school grouped by (teacher or subclass, day), sorted by
+    lesson number and serialized ahead of time, as of data version `version`"""
+
+    def __init__(
+        self,
+        version: int,
+        lessons: Iterable[database.Lesson],
+        numbers: Iterable[int],
+        teachers: Iterable[int],
+        subclasses: Iterable[int],
+    ):
+        self.version = version
+        self.numbers: Set[int] = set(numbers)
+        self.owners: Dict[str, Set[int]] = {
+            TEACHER: set(teachers),
+            SUBCLASS: set(subclasses),
+        }
+
+        grouped: Dict[OwnerKey, List[item.Lesson]] = {}
+        for lesson in sorted(lessons, key=lambda x: x.lesson_number.number):
+            serialized = item.Lesson.from_orm(lesson)
+            day = lesson.day_of_week
+            grouped.setdefault((TEACHER, lesson.teacher_id, day), []).append(serialized)
+            for subclass in lesson.subclasses:
+                grouped.setdefault((SUBCLASS, subclass.id, day), []).append(serialized)
+
+        self.days: Dict[OwnerKey, bytes] = {}
+        self.lessons: Dict[Tuple[str, int, int, int], bytes] = {}
+        for key, day_lessons in grouped.items():
+            self.days[key] = render(
+                info.LessonsForDay(day_of_week=key[2], lessons=day_lessons)
+            )
+            for lesson in day_lessons:
+                self.lessons.setdefault(
+                    (*key, lesson.lesson_number.number), render(lesson)
+                )
+
+    def has_owner(self, owner: str, owner_id: int) -> bool:
+        return owner_id in self.owners[owner]
+
+    def day(self, owner: str, owner_id: int, day: int) -> bytes:
+        """info.LessonsForDay"""
+        lessons = self.days.get((owner, owner_id, day))
+        if lessons is None:
+            return render(info.LessonsForDay(day_of_week=day, lessons=[]))
+        return lessons
+
+    def range(self, owner: str, owner_id: int, start: int, end: int) -> bytes:
+        """info.LessonsForRange, days without lessons are left out"""
+        days = (self.days.get((owner, owner_id, day)) for day in range(start, end + 1))
+        return b'{"data":[' + b",".join(filter(None, days)) + b"]}"
+
+    def lesson(
+        self, owner: str, owner_id: int, day: int, number: int
+    ) -> Optional[bytes]:
+        """item.Lesson"""
+        return self.lessons.get((owner, owner_id, day, number))
+
+
+def bits(bitset: int) -> Iterator[int]:
+    """Indexes of the set bits, lowest first"""
+    while bitset:
+        lowest = bitset & -bitset
+        yield lowest.bit_length() - 1
+        bitset ^= lowest
+
+
+class CorpusOccupancy:
+    """Cabinets of one corpus as bits of a bitset, with the bitset of cabinets
+    taken at every (day, lesson number) and of cabinets on every floor"""
+
+    def __init__(
+        self,
+        school_id: int,
+        cabinets: Iterable[database.Cabinet],
+        lessons: Iterable[Tuple[int, int, int]],
+    ):
+        self.school_id = school_id
+        self.cabinets = [
+            item.Cabinet.from_orm(cabinet)
+            for cabinet in sorted(cabinets, key=lambda x: x.id)
+        ]
+        bit = {cabinet.id: 1 << index for index, cabinet in enumerate(self.cabinets)}
+        self.everything = (1 << len(self.cabinets)) - 1
+        self.floors: Dict[int, int] = {}
+        for cabinet in self.cabinets:
+            self.floors[cabinet.floor] = (
+                self.floors.get(cabinet.floor, 0) | bit[cabinet.id]
+            )
+        self.taken: Dict[Tuple[int, int], int] = {}
+        self.days: Dict[int, int] = {}
+        for cabinet_id, day, number in lessons:
+            if cabinet_id in bit:
+                self.taken[(day, number)] = (
+                    self.taken.get((day, number), 0) | bit[cabinet_id]
+                )
+                self.days[day] = self.days.get(day, 0) | bit[cabinet_id]
+
+    def free(
+        self,
+        day: int,
+        first: Optional[int] = None,
+        last: Optional[int] = None,
+        floor: Optional[int] = None,
+    ) -> List[item.Cabinet]:
+        """Cabinets without lessons from lesson number `first` to `last` of
+        the day, the whole day if `first` is None"""
+        if first is None:
+            taken = self.days.get(day, 0)
+        else:
+            taken = 0
+            for number in range(first, (first if last is None else last) + 1):
+                taken |= self.taken.get((day, number), 0)
+        free = self.everything & ~taken
+        if floor is not None:
+            free &= self.floors.get(floor, 0)
+        return [self.cabinets[index] for index in bits(free)]
+
+
+class TimetableSnapshots:
+    """Per-school SchoolTimetable and per-corpus CorpusOccupancy cache of a
+    worker
+
+    A snapshot is built on the first request for a school (corpus) and dropped
+    after `ttl` seconds or when a PrimarySession commits a change to the school.
+    For `pin_seconds` after a school was changed its snapshots are built from
+    the primary, the read session of the request may be a replica without the
+    change yet.
+    """
+
+    def __init__(self, ttl: float, pin_seconds: float):
+        self.ttl = ttl
+        self.pin_seconds = pin_seconds
+        self.session_factory: Callable[..., AsyncSession] = SESSION_FACTORY
+        self.builds = 0
+        self._snapshots: Dict[int, Tuple[float, SchoolTimetable]] = {}
+        self._locks: Dict[int, Lock] = {}
+        self._occupancies: Dict[int, Tuple[float, CorpusOccupancy]] = {}
+        self._occupancy_locks: Dict[int, Lock] = {}
+        # bumped by every invalidation, a build that raced one is not stored
+        self._generation = 0
+        # school id (None for every school) -> end of builds from the primary
+        self._changed: Dict[Optional[int], float] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _cached(self, school_id: int) -> Optional[SchoolTimetable]:
+        cached = self._snapshots.get(school_id)
+        if cached is None or monotonic() - cached[0] >= self.ttl:
+            return None
+        return cached[1]
+
+    def _changed_lately(self, school_id: int) -> bool:
+        now = monotonic()
+        return (
+            self._changed.get(school_id, 0.0) > now
+            or self._changed.get(None, 0.0) > now
+        )
+
+    def _cached_occupancy(self, corpus_id: int) -> Optional[CorpusOccupancy]:
+        cached = self._occupancies.get(corpus_id)
+        if cached is None or monotonic() - cached[0] >= self.ttl:
+            return None
+        return cached[1]
+
+    async def occupancy(self, session: AsyncSession, corpus_id: int) -> CorpusOccupancy:
+        occupancy = self._cached_occupancy(corpus_id)
+        if occupancy is not None:
+            return occupancy
+        async with self._occupancy_locks.setdefault(corpus_id, Lock()):
+            occupancy = self._cached_occupancy(corpus_id)
+            if occupancy is not None:
+                return occupancy
+            generation = self._generation
+            corpus = await db_validated.get_corpus_by_id(session, corpus_id)
+            if self._changed_lately(corpus.school_id):
+                async with self.session_factory() as primary:
+                    occupancy = await self._build_occupancy(primary, corpus)
+            else:
+                occupancy = await self._build_occupancy(session, corpus)
+            if generation == self._generation:
+                self._occupancies[corpus_id] = (monotonic(), occupancy)
+            return occupancy
+
+    async def _build_occupancy(
+        self, session: AsyncSession, corpus: database.Corpus
+    ) -> CorpusOccupancy:
+        cabinets = await session.scalars(
+            select(database.Cabinet)
+            .filter_by(corpus_id=corpus.id)
+            .options(*db_validated.CABINET_OPTIONS)
+        )
+        lessons = await session.execute(
+            select(
+                database.Lesson.cabinet_id,
+                database.Lesson.day_of_week,
+                database.Lesson_number.number,
+            )
+            .join(database.Lesson.lesson_number)
+            .filter(database.Lesson.corpus_id == corpus.id)
+        )
+        self.builds += 1
+        logger.debug(f"Building cabinet occupancy of corpus with id {corpus.id}")
+        return CorpusOccupancy(corpus.school_id, cabinets.all(), lessons.all())
+
+    async def get(self, session: AsyncSession, school_id: int) -> SchoolTimetable:
+        snapshot = self._cached(school_id)
+        if snapshot is not None:
+            return snapshot
+        async with self._locks.setdefault(school_id, Lock()):
+            snapshot = self._cached(school_id)
+            if snapshot is not None:
+                return snapshot
+            generation = self._generation
+            if self._changed_lately(school_id):
+                async with self.session_factory() as primary:
+                    snapshot = await self._build(primary, school_id)
+            else:
+                snapshot = await self._build(session, school_id)
+            if generation == self._generation:
+                self._snapshots[school_id] = (monotonic(), snapshot)
+            return snapshot
+
+    async def _build(self, session: AsyncSession, school_id: int) -> SchoolTimetable:
+        # read before the rows, they are at least as new as the version
+        version = await session.scalar(
+            select(database.School.data_version).filter_by(id=school_id)
+        )
+        if version is None:
+            logger.debug(
+                f"Raised an exception because school with id {school_id} does not exists"
+            )
+            raise HTTPException(
+                status_code=404, detail=f"School with id {school_id} does not exist"
+            )
+        school = await db_validated.get_school_by_id(session, school_id)
+        lessons = await session.scalars(
+            select(database.Lesson)
+            .filter_by(school_id=school.id)
+            .options(*db_validated.LESSON_OPTIONS)
+        )
+        numbers = await session.scalars(
+            select(database.Lesson_number.number).filter_by(school_id=school.id)
+        )
+        teachers = await session.scalars(
+            select(database.Teacher.id).filter_by(school_id=school.id)
+        )
+        subclasses = await session.scalars(
+            select(database.Subclass.id).filter_by(school_id=school.id)
+        )
+        self.builds += 1
+        logger.debug(f"Building timetable snapshot of school with id {school.id}")
+        return SchoolTimetable(version, lessons.all(), numbers, teachers, subclasses)
+
+    def invalidate(self, school_id: Optional[int] = None):
+        """Drop the snapshots of a school, of every school if `school_id` is None"""
+        self._generation += 1
+        self._changed[school_id] = monotonic() + self.pin_seconds
+        if school_id is None:
+            self._snapshots.clear()
+            self._occupancies.clear()
+        else:
+            self._snapshots.pop(school_id, None)
+            for corpus_id, (_, occupancy) in list(self._occupancies.items()):
+                if occupancy.school_id == school_id:
+                    del self._occupancies[corpus_id]
+
+    def mark(self, session: AsyncSession, school_id: int):
+        """Drop the school's snapshot when `session` commits, for writes that
+        bypass the unit of work like bulk INSERTs"""
+        session.sync_session.info.setdefault("timetable_schools", set()).add(school_id)
+
+    def invalidate_on_commit(self, session_class):
+        @event.listens_for(session_class, "after_flush")
+        def collect(session, flush_context):
+            schools = session.info.setdefault("timetable_schools", set())
+            for instance in chain(session.new, session.dirty, session.deleted):
+                if isinstance(instance, database.School):
+                    schools.add(instance.id)
+                elif isinstance(instance, TIMETABLE_ENTITIES):
+                    # None (cabinet without a school) drops every snapshot
+                    schools.add(inspect(instance).dict.get("school_id"))
+
+        @event.listens_for(session_class, "after_commit")
+        def invalidate(session):
+            for school_id in session.info.get("timetable_schools", ()):
+                self.invalidate(school_id)
+
+        @event.listens_for(session_class, "after_transaction_end")
+        def forget(session, transaction):
+            if transaction.parent is None:
+                session.info.pop("timetable_schools", None)
+
+
+TIMETABLE_SNAPSHOTS = TimetableSnapshots(
+    TIMETABLE_SNAPSHOT_TTL, DATABASE_REPLICA_PIN_SECONDS
+)
+TIMETABLE_SNAPSHOTS.invalidate_on_commit(PrimarySession)
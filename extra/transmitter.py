@@ -0,0 +1,97 @@
+import asyncio
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+from config import DEFAULT_LOGGER as logger
+from config import (
+    TRANSMITTER_CONNECT_TIMEOUT,
+    TRANSMITTER_CONNECTIONS,
+    TRANSMITTER_HOST,
+    TRANSMITTER_PARALLEL_POSTS,
+    TRANSMITTER_PORT,
+    TRANSMITTER_TIMEOUT,
+)
+
+TELEGRAM_PATH = "/api/trans/redirect/telegram"
+
+
+class TransmitterError(Exception):
+    """The transmitter did not accept telegram ids"""
+
+
+class Transmitter:
+    """Keep-alive connections of a worker to the transmitter
+
+    The client session is opened at startup and closed at shutdown, posts
+    reuse its pooled connections instead of connecting every time. At most
+    `parallel` posts are in flight, the rest wait for a free slot.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        connections: int,
+        timeout: float,
+        connect_timeout: float,
+        parallel: int,
+    ):
+        self.url = url
+        self.connections = connections
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.parallel = parallel
+        self.posts = 0
+        self.errors = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def start(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.connections),
+                timeout=self.timeout,
+            )
+            self._slots = asyncio.Semaphore(self.parallel)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._slots = None
+
+    async def post(self, text: str, telegram_ids: Iterable[int], silent: bool):
+        # scripts and tests post without the app startup
+        self.start()
+        async with self._slots:
+            self.posts += 1
+            async with self._session.post(
+                self.url + TELEGRAM_PATH,
+                json={
+                    "text": text,
+                    "telegram_ids": list(telegram_ids),
+                    "silent": silent,
+                },
+            ) as response:
+                if response.status != 200:
+                    self.errors += 1
+                    logger.error(
+                        f"Can not post announcement to {self.url}. More: {await response.text()}"
+                    )
+                    raise TransmitterError(response.status)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "open": self._session is not None,
+            "posts": self.posts,
+            "errors": self.errors,
+            "connections": self.connections,
+            "parallel": self.parallel,
+        }
+
+
+TRANSMITTER = Transmitter(
+    f"http://{TRANSMITTER_HOST}:{TRANSMITTER_PORT}",
+    TRANSMITTER_CONNECTIONS,
+    TRANSMITTER_TIMEOUT,
+    TRANSMITTER_CONNECT_TIMEOUT,
+    TRANSMITTER_PARALLEL_POSTS,
+)
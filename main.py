@@ -1,9 +1,29 @@
+from config import API_MONITOR_PREFIX, API_PREFIX
 from config import DEFAULT_LOGGER as logger
-from config import WEBSITE_HOST, WEBSITE_PORT
+from config import (
+    ENGINE,
+    LOOP_MONITOR_ENABLED,
+    REPLICA_ENGINES,
+    REPLICA_ROUTER,
+    WEBSITE_HOST,
+    WEBSITE_PORT,
+    Access,
+)
 from extra.api_router import LoggingRouter
-from fastapi import FastAPI
+from extra.database_pool import pool_stats
+from extra.entity_cache import ENTITY_CACHE
+from extra.loop_monitor import LOOP_MONITOR
+from extra.response_cache import RESPONSE_CACHE, scope_ids
+from extra.service_auth import AllowLevels
+from extra.stats_rollup import STATS_ROLLUP
+from extra.tags import MONITOR
+from extra.telegraph_pages import TELEGRAPH_PAGES
+from extra.timetable_snapshot import TIMETABLE_SNAPSHOTS
+from extra.transmitter import TRANSMITTER
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers import routers
+from routers.webapi.announcements.dispatcher import ANNOUNCEMENT_DISPATCHER
 
 app = FastAPI(
     title="Skedule API v2", debug=False, version="v2", router_class=LoggingRouter
@@ -23,6 +43,125 @@ for router in routers:
     logger.info(f"Router {router.prefix} included")
 
 
+@app.on_event("startup")
+async def start_loop_monitor():
+    if LOOP_MONITOR_ENABLED:
+        LOOP_MONITOR.start(app.routes)
+
+
+def drop_timetable_snapshots(tags):
+    # commits of other workers arrive through the response cache channel
+    for school_id in scope_ids("school", tags):
+        TIMETABLE_SNAPSHOTS.invalidate(school_id)
+
+
+def drop_cached_entities(tags):
+    # sooner than the poll of school versions
+    ENTITY_CACHE.invalidate_scopes(scope_ids("school", tags), scope_ids("corpus", tags))
+
+
+@app.on_event("startup")
+async def start_response_cache():
+    RESPONSE_CACHE.on_invalidate(drop_timetable_snapshots)
+    RESPONSE_CACHE.on_invalidate(drop_cached_entities)
+    RESPONSE_CACHE.start()
+
+
+@app.on_event("shutdown")
+async def stop_response_cache():
+    await RESPONSE_CACHE.stop()
+
+
+@app.on_event("startup")
+async def start_announcement_dispatcher():
+    TRANSMITTER.start()
+    ANNOUNCEMENT_DISPATCHER.start()
+
+
+@app.on_event("shutdown")
+async def stop_announcement_dispatcher():
+    await ANNOUNCEMENT_DISPATCHER.stop()
+    await TRANSMITTER.close()
+
+
+@app.on_event("startup")
+async def start_entity_cache():
+    ENTITY_CACHE.start()
+
+
+@app.on_event("shutdown")
+async def stop_entity_cache():
+    await ENTITY_CACHE.stop()
+
+
+@app.on_event("startup")
+async def start_stats_rollup():
+    STATS_ROLLUP.start()
+
+
+@app.on_event("shutdown")
+async def stop_stats_rollup():
+    await STATS_ROLLUP.stop()
+
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    if LOOP_MONITOR.running:
+        await LOOP_MONITOR.stop()
+        LOOP_MONITOR.log_summary()
+
+
+@app.get(
+    API_PREFIX + API_MONITOR_PREFIX + "/loop",
+    tags=[MONITOR],
+    dependencies=[Depends(AllowLevels(Access.Admin))],
+)
+async def loop_monitor_summary():
+    return LOOP_MONITOR.summary()
+
+
+@app.get(
+    API_PREFIX + API_MONITOR_PREFIX + "/pool",
+    tags=[MONITOR],
+    dependencies=[Depends(AllowLevels(Access.Admin))],
+)
+async def database_pool_stats():
+    return {
+        "primary": pool_stats(ENGINE),
+        "replicas": [pool_stats(engine) for engine in REPLICA_ENGINES],
+        "routing": REPLICA_ROUTER.stats(),
+    }
+
+
+@app.get(
+    API_PREFIX + API_MONITOR_PREFIX + "/cache",
+    tags=[MONITOR],
+    dependencies=[Depends(AllowLevels(Access.Admin))],
+)
+async def cache_stats():
+    return {"entities": ENTITY_CACHE.stats(), "responses": RESPONSE_CACHE.stats()}
+
+
+@app.get(
+    API_PREFIX + API_MONITOR_PREFIX + "/announcements",
+    tags=[MONITOR],
+    dependencies=[Depends(AllowLevels(Access.Admin))],
+)
+async def announcement_dispatcher_stats():
+    return {
+        **ANNOUNCEMENT_DISPATCHER.stats(),
+        "transmitter": TRANSMITTER.stats(),
+        "telegraph": TELEGRAPH_PAGES.stats(),
+    }
+
+
+@app.on_event("shutdown")
+async def dispose_engine():
+    await ENGINE.dispose()
+    for engine in REPLICA_ENGINES:
+        await engine.dispose()
+
+
 @app.get("/")
 async def index_page():
     pass
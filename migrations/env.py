@@ -0,0 +1,55 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from models import database
+
+config = context.config
+
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = database.Base.metadata
+
+
+def run_migrations_offline():
+    from config import ENGINE
+
+    context.configure(
+        url=ENGINE.url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection):
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_migrations_online():
+    from config import ENGINE
+
+    async with ENGINE.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await ENGINE.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif config.attributes.get("connection") is not None:
+    # connection passed in by a script (benchmarks/lessons_queries.py)
+    do_run_migrations(config.attributes["connection"])
+else:
+    asyncio.run(run_migrations_online())
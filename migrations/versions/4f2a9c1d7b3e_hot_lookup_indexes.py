@@ -0,0 +1,117 @@
+"""Indexes for hot lookup columns, primary keys for association tables
+
+Revision ID: 4f2a9c1d7b3e
+Revises:
+Create Date: 2022-05-14 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "4f2a9c1d7b3e"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# table, primary key columns, secondary index name and columns
+ASSOCIATIONS = (
+    (
+        "lesson_subclass_association",
+        ("lesson_id", "subclass_id"),
+        "ix_lesson_subclass_association_subclass_id",
+        ("subclass_id", "lesson_id"),
+    ),
+    (
+        "cabinet_tag_association",
+        ("cabinet_id", "tag_id"),
+        "ix_cabinet_tag_association_tag_id",
+        ("tag_id",),
+    ),
+    (
+        "teacher_tag_association",
+        ("teacher_id", "tag_id"),
+        "ix_teacher_tag_association_tag_id",
+        ("tag_id",),
+    ),
+    (
+        "role_announcement_association",
+        ("role_id", "announcement_id"),
+        "ix_role_announcement_association_announcement_id",
+        ("announcement_id",),
+    ),
+)
+
+INDEXES = (
+    (
+        "ix_lesson_school_id_day_of_week_teacher_id",
+        "lesson",
+        ("school_id", "day_of_week", "teacher_id"),
+    ),
+    ("ix_lesson_lesson_number_id", "lesson", ("lesson_number_id",)),
+    ("ix_lesson_number_school_id_number", "lesson_number", ("school_id", "number")),
+    ("ix_role_role_type", "role", ("role_type",)),
+    ("ix_role_account_id", "role", ("account_id",)),
+    ("ix_teacher_school_id", "teacher", ("school_id",)),
+    ("ix_subclass_school_id", "subclass", ("school_id",)),
+    ("ix_cabinet_corpus_id", "cabinet", ("corpus_id",)),
+)
+
+
+def _foreign_key_index(table, columns):
+    # MariaDB needs an index on the first column for its foreign key once the
+    # primary key is gone
+    return f"ix_{table}_{columns[0]}"
+
+
+def _first_column_indexes(table, columns):
+    # the index MariaDB made for the foreign key is named after the column or
+    # the constraint, the primary key starts with the column and replaces it
+    return [
+        existing["name"]
+        for existing in sa.inspect(op.get_bind()).get_indexes(table)
+        if existing["column_names"] == [columns[0]] and not existing["unique"]
+    ]
+
+
+def _deduplicate(table, columns):
+    # rows with NULLs or duplicates would break the new primary key
+    first, second = columns
+    op.execute(f"DELETE FROM {table} WHERE {first} IS NULL OR {second} IS NULL")
+    op.execute(
+        f"CREATE TABLE {table}_dedup AS SELECT DISTINCT {first}, {second} FROM {table}"
+    )
+    op.execute(f"DELETE FROM {table}")
+    op.execute(
+        f"INSERT INTO {table} ({first}, {second}) SELECT {first}, {second} FROM {table}_dedup"
+    )
+    op.execute(f"DROP TABLE {table}_dedup")
+
+
+def upgrade():
+    for table, columns, index, index_columns in ASSOCIATIONS:
+        _deduplicate(table, columns)
+        with op.batch_alter_table(table) as batch:
+            for column in columns:
+                batch.alter_column(column, existing_type=sa.Integer(), nullable=False)
+            batch.create_primary_key(f"pk_{table}", list(columns))
+        for existing in _first_column_indexes(table, columns):
+            op.drop_index(existing, table_name=table)
+        op.create_index(index, table, list(index_columns))
+
+    for index, table, columns in INDEXES:
+        op.create_index(index, table, list(columns))
+
+
+def downgrade():
+    for index, table, columns in reversed(INDEXES):
+        op.drop_index(index, table_name=table)
+
+    for table, columns, index, index_columns in reversed(ASSOCIATIONS):
+        op.drop_index(index, table_name=table)
+        op.create_index(_foreign_key_index(table, columns), table, [columns[0]])
+        with op.batch_alter_table(table) as batch:
+            batch.drop_constraint(f"pk_{table}", type_="primary")
+            for column in columns:
+                batch.alter_column(column, existing_type=sa.Integer(), nullable=True)
@@ -0,0 +1,28 @@
+"""Data version counter of schools
+
+Revision ID: 8c3e5b2a91d4
+Revises: 4f2a9c1d7b3e
+Create Date: 2022-05-21 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8c3e5b2a91d4"
+down_revision = "4f2a9c1d7b3e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("school") as batch:
+        batch.add_column(
+            sa.Column("data_version", sa.Integer(), nullable=False, server_default="0")
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("school") as batch:
+        batch.drop_column("data_version")
@@ -0,0 +1,38 @@
+"""Daily statistics counters of schools
+
+Revision ID: a93e1f4c6b27
+Revises: d61a7f0e3c25
+Create Date: 2022-06-04 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a93e1f4c6b27"
+down_revision = "d61a7f0e3c25"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled after every commit changing the roles of a school, see
+    # extra/stats_rollup.py
+    op.create_table(
+        "stats_rollup",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("school_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("metric", sa.String(length=20), nullable=False),
+        sa.Column("key", sa.Integer(), nullable=False),
+        sa.Column("value", sa.Integer(), nullable=False),
+    )
+    op.create_index(
+        "ix_stats_rollup_school_id_day", "stats_rollup", ["school_id", "day"]
+    )
+
+
+def downgrade():
+    op.drop_index("ix_stats_rollup_school_id_day", table_name="stats_rollup")
+    op.drop_table("stats_rollup")
@@ -0,0 +1,29 @@
+"""Last progress of announcement jobs
+
+Revision ID: b5d9e2f7a316
+Revises: f3a8c6d1e042
+Create Date: 2022-06-25 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5d9e2f7a316"
+down_revision = "f3a8c6d1e042"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("announcement_job") as batch:
+        batch.add_column(sa.Column("updated", sa.DateTime(), nullable=True))
+    op.execute("UPDATE announcement_job SET updated = created")
+    with op.batch_alter_table("announcement_job") as batch:
+        batch.alter_column("updated", existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table("announcement_job") as batch:
+        batch.drop_column("updated")
@@ -0,0 +1,48 @@
+"""Change log of school timetables
+
+Revision ID: d61a7f0e3c25
+Revises: 8c3e5b2a91d4
+Create Date: 2022-05-28 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "d61a7f0e3c25"
+down_revision = "8c3e5b2a91d4"
+branch_labels = None
+depends_on = None
+
+ENTITIES = ("lesson", "teacher", "cabinet", "subclass", "lesson_number")
+
+
+def upgrade():
+    op.create_table(
+        "change_log",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("school_id", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("entity", sa.String(length=20), nullable=False),
+        sa.Column("entity_id", sa.Integer(), nullable=False),
+        sa.Column("deleted", sa.Boolean(), nullable=False),
+    )
+    op.create_index(
+        "ix_change_log_school_id_version", "change_log", ["school_id", "version"]
+    )
+
+    # rows that exist already are logged as changed at the next version, so a
+    # feed from version 0 returns the whole school
+    op.execute("UPDATE school SET data_version = data_version + 1")
+    for entity in ENTITIES:
+        op.execute(
+            "INSERT INTO change_log (school_id, version, entity, entity_id, deleted) "
+            f"SELECT {entity}.school_id, school.data_version, '{entity}', {entity}.id, 0 "
+            f"FROM {entity} JOIN school ON school.id = {entity}.school_id"
+        )
+
+
+def downgrade():
+    op.drop_index("ix_change_log_school_id_version", table_name="change_log")
+    op.drop_table("change_log")
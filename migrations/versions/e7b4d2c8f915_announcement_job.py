@@ -0,0 +1,50 @@
+"""Queued announcement deliveries
+
+Revision ID: e7b4d2c8f915
+Revises: a93e1f4c6b27
+Create Date: 2022-06-11 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e7b4d2c8f915"
+down_revision = "a93e1f4c6b27"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "announcement_job",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column(
+            "announcement_id",
+            sa.Integer(),
+            sa.ForeignKey("announcement.id"),
+            nullable=True,
+        ),
+        sa.Column("to_all", sa.Boolean(), nullable=False),
+        sa.Column("text", sa.String(length=2500), nullable=False),
+        sa.Column("silent", sa.Boolean(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("QUEUED", "SENDING", "DONE", "FAILED", name="jobstatusenum"),
+            nullable=False,
+        ),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("sent", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("cursor", sa.Integer(), nullable=False),
+        sa.Column("created", sa.DateTime(), nullable=False),
+        sa.Column("finished", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_announcement_job_status", "announcement_job", ["status"])
+
+
+def downgrade():
+    op.drop_index("ix_announcement_job_status", table_name="announcement_job")
+    op.drop_table("announcement_job")
+    sa.Enum(name="jobstatusenum").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,30 @@
+"""Content hash of announcements
+
+Revision ID: f3a8c6d1e042
+Revises: e7b4d2c8f915
+Create Date: 2022-06-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a8c6d1e042"
+down_revision = "e7b4d2c8f915"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing announcements have no hash, their pages are not reused
+    op.add_column(
+        "announcement",
+        sa.Column("content_hash", sa.String(length=64), nullable=True),
+    )
+    op.create_index("ix_announcement_content_hash", "announcement", ["content_hash"])
+
+
+def downgrade():
+    op.drop_index("ix_announcement_content_hash", table_name="announcement")
+    op.drop_column("announcement", "content_hash")
@@ -2,6 +2,7 @@
 
 from models.bot.info.cabinets import Cabinets
 from models.bot.info.canteen import Canteen
+from models.bot.info.changes import Changes, Tombstones
 from models.bot.info.corpuses import Corpuses
 from models.bot.info.groups import Groups
 from models.bot.info.lesson_numbers import LessonNumbers
@@ -0,0 +1,22 @@
+from typing import List
+
+from models.bot.item import Cabinet, Lesson, LessonNumber, Subclass, Teacher
+from config import BaseModel
+
+
+class Tombstones(BaseModel):
+    lessons: List[int] = []
+    teachers: List[int] = []
+    cabinets: List[int] = []
+    subclasses: List[int] = []
+    lesson_numbers: List[int] = []
+
+
+class Changes(BaseModel):
+    version: int
+    lessons: List[Lesson] = []
+    teachers: List[Teacher] = []
+    cabinets: List[Cabinet] = []
+    subclasses: List[Subclass] = []
+    lesson_numbers: List[LessonNumber] = []
+    deleted: Tombstones = Tombstones()
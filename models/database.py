@@ -7,16 +7,19 @@ from sqlalchemy import (
     BigInteger,
     Boolean,
     Column,
+    Date,
     DateTime,
     Enum,
     ForeignKey,
+    Index,
     Integer,
+    PrimaryKeyConstraint,
     SmallInteger,
     String,
     Table,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, configure_mappers, deferred, relationship
 
 Base = declarative_base()
 
@@ -43,8 +46,12 @@ def mod(status: int) -> Dict[str, bool]:
 lesson_subclass_association = Table(
     "lesson_subclass_association",
     Base.metadata,
-    Column("lesson_id", Integer, ForeignKey("lesson.id")),
-    Column("subclass_id", Integer, ForeignKey("subclass.id")),
+    Column("lesson_id", Integer, ForeignKey("lesson.id"), **mod(0b0000)),
+    Column("subclass_id", Integer, ForeignKey("subclass.id"), **mod(0b0000)),
+    PrimaryKeyConstraint(
+        "lesson_id", "subclass_id", name="pk_lesson_subclass_association"
+    ),
+    Index("ix_lesson_subclass_association_subclass_id", "subclass_id", "lesson_id"),
 )
 # ==================================================================================================
 
@@ -60,16 +67,20 @@ class Tag(Base):
 cabinet_tag_association = Table(
     "cabinet_tag_association",
     Base.metadata,
-    Column("cabinet_id", Integer, ForeignKey("cabinet.id")),
-    Column("tag_id", Integer, ForeignKey("tag.id")),
+    Column("cabinet_id", Integer, ForeignKey("cabinet.id"), **mod(0b0000)),
+    Column("tag_id", Integer, ForeignKey("tag.id"), **mod(0b0000)),
+    PrimaryKeyConstraint("cabinet_id", "tag_id", name="pk_cabinet_tag_association"),
+    Index("ix_cabinet_tag_association_tag_id", "tag_id"),
 )
 
 # ==================================================================================================
 teacher_tag_association = Table(
     "teacher_tag_association",
     Base.metadata,
-    Column("teacher_id", Integer, ForeignKey("teacher.id")),
-    Column("tag_id", Integer, ForeignKey("tag.id")),
+    Column("teacher_id", Integer, ForeignKey("teacher.id"), **mod(0b0000)),
+    Column("tag_id", Integer, ForeignKey("tag.id"), **mod(0b0000)),
+    PrimaryKeyConstraint("teacher_id", "tag_id", name="pk_teacher_tag_association"),
+    Index("ix_teacher_tag_association_tag_id", "tag_id"),
 )
 # ==================================================================================================
 
@@ -98,8 +109,8 @@ class Role(Base):
     __tablename__ = "role"
     id = Column(Integer, **mod(0b1011))
     is_main_role = Column(Boolean, default=False, **mod(0b0000))
-    role_type = Column(Enum(RoleEnum), **mod(0b0000))
-    account_id = Column(Integer, ForeignKey("account.id"), **mod(0b0000))
+    role_type = Column(Enum(RoleEnum), index=True, **mod(0b0000))
+    account_id = Column(Integer, ForeignKey("account.id"), index=True, **mod(0b0000))
     student_id = Column(Integer, ForeignKey("student.id"), default=None, **mod(0b0100))
     student = relationship("Student")
     teacher_id = Column(Integer, ForeignKey("teacher.id"), default=None, **mod(0b0100))
@@ -130,7 +141,7 @@ class Teacher(Base):
     __tablename__ = "teacher"
     id = Column(Integer, **mod(0b1011))
     name = Column(String(length=200), **mod(0b0000))
-    school_id = Column(Integer, ForeignKey("school.id"), **mod(0b0000))
+    school_id = Column(Integer, ForeignKey("school.id"), index=True, **mod(0b0000))
     lessons = relationship("Lesson", backref=backref("teacher"))
     tags = relationship(
         "Tag",
@@ -166,7 +177,7 @@ class Subclass(Base):
     educational_level = Column(SmallInteger, **mod(0b0000))
     identificator = Column(String(length=50), **mod(0b0000))
     additional_identificator = Column(String(length=50), **mod(0b0100))
-    school_id = Column(Integer, ForeignKey("school.id"), **mod(0b0000))
+    school_id = Column(Integer, ForeignKey("school.id"), index=True, **mod(0b0000))
     student_id = relationship("Student", backref=backref("subclass"))
 
 
@@ -192,7 +203,7 @@ class Cabinet(Base):
     id = Column(Integer, **mod(0b1011))
     floor = Column(SmallInteger, **mod(0b0000))
     name = Column(String(length=100), **mod(0b0000))
-    corpus_id = Column(Integer, ForeignKey("corpus.id"), **mod(0b0000))
+    corpus_id = Column(Integer, ForeignKey("corpus.id"), index=True, **mod(0b0000))
     lessons = relationship("Lesson", backref=backref("cabinet"))
     school_id = Column(Integer, ForeignKey("school.id"), **mod(0b0100))
     tags = relationship(
@@ -209,6 +220,10 @@ class School(Base):
     __tablename__ = "school"
     id = Column(Integer, **mod(0b1011))
     name = Column(String(length=200), **mod(0b0001))
+    # bumped by every commit changing the school timetable, see extra/school_versions.py
+    data_version = deferred(
+        Column(Integer, default=0, server_default="0", **mod(0b0000))
+    )
     students = relationship("Student", backref=backref("school"))
     teachers = relationship("Teacher", backref=backref("school"))
     administrations = relationship("Administration", backref=backref("school"))
@@ -224,6 +239,9 @@ class School(Base):
 
 class Lesson_number(Base):
     __tablename__ = "lesson_number"
+    __table_args__ = (
+        Index("ix_lesson_number_school_id_number", "school_id", "number"),
+    )
     id = Column(Integer, **mod(0b1011))
     number = Column(SmallInteger, **mod(0b0000))
     time_start = Column(String(length=5), **mod(0b0000))
@@ -237,10 +255,20 @@ class Lesson_number(Base):
 
 class Lesson(Base):
     __tablename__ = "lesson"
+    __table_args__ = (
+        Index(
+            "ix_lesson_school_id_day_of_week_teacher_id",
+            "school_id",
+            "day_of_week",
+            "teacher_id",
+        ),
+    )
     id = Column(Integer, **mod(0b1011))
     day_of_week = Column(SmallInteger, **mod(0b0000))
     subject = Column(String(length=200), **mod(0b0000))
-    lesson_number_id = Column(Integer, ForeignKey("lesson_number.id"), **mod(0b0000))
+    lesson_number_id = Column(
+        Integer, ForeignKey("lesson_number.id"), index=True, **mod(0b0000)
+    )
     teacher_id = Column(Integer, ForeignKey("teacher.id"), **mod(0b0000))
     subclasses = relationship(
         "Subclass",
@@ -257,8 +285,12 @@ class Lesson(Base):
 role_announcement_association = Table(
     "role_announcement_association",
     Base.metadata,
-    Column("role_id", Integer, ForeignKey("role.id")),
-    Column("announcement_id", Integer, ForeignKey("announcement.id")),
+    Column("role_id", Integer, ForeignKey("role.id"), **mod(0b0000)),
+    Column("announcement_id", Integer, ForeignKey("announcement.id"), **mod(0b0000)),
+    PrimaryKeyConstraint(
+        "role_id", "announcement_id", name="pk_role_announcement_association"
+    ),
+    Index("ix_role_announcement_association_announcement_id", "announcement_id"),
 )
 
 # ==================================================================================================
@@ -269,6 +301,8 @@ class Announcement(Base):
     id = Column(Integer, **mod(0b1011))
     link = Column(String(length=500), **mod(0b0000))
     title = Column(String(length=150), **mod(0b0000))
+    # sha256 of the title and the text, the page is reused for the same content
+    content_hash = Column(String(length=64), default=None, index=True, **mod(0b0100))
     roles = relationship(
         "Role",
         secondary=role_announcement_association,
@@ -279,6 +313,41 @@ class Announcement(Base):
 # ==================================================================================================
 
 
+class JobStatusEnum(EnumClass):
+    QUEUED = 0
+    SENDING = 1
+    DONE = 2
+    FAILED = 3
+
+
+class Announcement_job(Base):
+    """Delivery of a text to the transmitter, to accounts of the roles of the
+    announcement or to every account if to_all, in the order of account ids"""
+
+    __tablename__ = "announcement_job"
+    __table_args__ = (Index("ix_announcement_job_status", "status"),)
+    id = Column(Integer, **mod(0b1011))
+    announcement_id = Column(
+        Integer, ForeignKey("announcement.id"), default=None, **mod(0b0100)
+    )
+    to_all = Column(Boolean, default=False, **mod(0b0000))
+    text = Column(String(length=2500), **mod(0b0000))
+    silent = Column(Boolean, default=False, **mod(0b0000))
+    status = Column(Enum(JobStatusEnum), default=JobStatusEnum.QUEUED, **mod(0b0000))
+    total = Column(Integer, default=0, **mod(0b0000))
+    sent = Column(Integer, default=0, **mod(0b0000))
+    failed = Column(Integer, default=0, **mod(0b0000))
+    # id of the last account a chunk was posted for
+    cursor = Column(Integer, default=0, **mod(0b0000))
+    created = Column(DateTime, **mod(0b0000))
+    # last claim or saved batch, a SENDING job without any for long is reclaimed
+    updated = Column(DateTime, **mod(0b0000))
+    finished = Column(DateTime, default=None, **mod(0b0100))
+
+
+# ==================================================================================================
+
+
 class Service(Base):
     __tablename__ = "service"
     id = Column(Integer, **mod(0b1011))
@@ -306,3 +375,43 @@ class HarvestUser(Base):
 
 
 # ==================================================================================================
+
+
+class Change_log(Base):
+    """Rows of a school timetable changed at a school data_version, deleted
+    ones are tombstones"""
+
+    __tablename__ = "change_log"
+    __table_args__ = (Index("ix_change_log_school_id_version", "school_id", "version"),)
+    id = Column(Integer, **mod(0b1011))
+    # no foreign key, entries outlive the rows they describe
+    school_id = Column(Integer, **mod(0b0000))
+    version = Column(Integer, **mod(0b0000))
+    entity = Column(String(length=20), **mod(0b0000))
+    entity_id = Column(Integer, **mod(0b0000))
+    deleted = Column(Boolean, default=False, **mod(0b0000))
+
+
+# ==================================================================================================
+
+
+class Stats_rollup(Base):
+    """Statistics counters of a school at the end of a day, key is the
+    parallel or the amount of children for the per-key metrics and 0 otherwise"""
+
+    __tablename__ = "stats_rollup"
+    __table_args__ = (Index("ix_stats_rollup_school_id_day", "school_id", "day"),)
+    id = Column(Integer, **mod(0b1011))
+    # no foreign key, the history outlives the school
+    school_id = Column(Integer, **mod(0b0000))
+    day = Column(Date, **mod(0b0000))
+    metric = Column(String(length=20), **mod(0b0000))
+    key = Column(Integer, default=0, **mod(0b0000))
+    value = Column(Integer, **mod(0b0000))
+
+
+# ==================================================================================================
+
+# backref attributes (Lesson.teacher, Student.subclass, ...) only exist after
+# configuration, loader options in valid_db_requests reference them directly
+configure_mappers()
@@ -13,3 +13,12 @@ from models.web.incoming.simple_announcement import (
     SimpleTelegraphAnnouncement,
     SimpleTextAnnouncement,
 )
+from models.web.incoming.timetable import (
+    Timetable,
+    TimetableCabinet,
+    TimetableLesson,
+    TimetableLessonNumber,
+    TimetableSubclass,
+    TimetableSync,
+    TimetableTeacher,
+)
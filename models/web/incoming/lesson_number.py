@@ -6,18 +6,22 @@ from pydantic import Field, validator
 time_regex = compile(r"[0-2]?[0-9]:[0-5][0-9]")
 
 
+def validate_time(time: str) -> str:
+    if len(time) == 4:
+        time = "0" + time
+    elif len(time) != 5:
+        raise ValueError("Must be at 5 or 4 characters")
+    if not match(time_regex, time):
+        raise ValueError("Wrong format")
+    return time
+
+
 class LessonNumber(BaseModel):
     number: int = Field(ge=0, le=20)
     time_start: str = Field(min_length=4, max_length=5)
     time_end: str = Field(min_length=4, max_length=5)
     school_id: int = Field(ge=1, le=2147483647)
 
-    @validator("time_end", "time_start")
-    def validate_time(cls, time: str):
-        if len(time) == 4:
-            time = "0" + time
-        elif len(time) != 5:
-            raise ValueError("Must be at 5 or 4 characters")
-        if not match(time_regex, time):
-            raise ValueError("Wrong format")
-        return time
+    _validate_time = validator("time_end", "time_start", allow_reuse=True)(
+        validate_time
+    )
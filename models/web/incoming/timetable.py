@@ -0,0 +1,71 @@
+from typing import List
+
+from config import BaseModel
+from models.web.incoming.lesson_number import validate_time
+from pydantic import Field, validator
+
+
+class TimetableLessonNumber(BaseModel):
+    number: int = Field(ge=0, le=20)
+    time_start: str = Field(min_length=4, max_length=5)
+    time_end: str = Field(min_length=4, max_length=5)
+
+    _validate_time = validator("time_end", "time_start", allow_reuse=True)(
+        validate_time
+    )
+
+
+class TimetableTeacher(BaseModel):
+    name: str = Field(max_length=200, min_length=1)
+    tags: List[str] = Field(default_factory=list, max_items=10)
+
+
+class TimetableCabinet(BaseModel):
+    name: str = Field(max_length=100, min_length=1)
+    floor: int = Field(ge=-10, le=100)
+    corpus: str = Field(max_length=100)
+    tags: List[str] = Field(default_factory=list, max_items=10)
+
+
+class TimetableSubclass(BaseModel):
+    educational_level: int = Field(ge=0, le=12)
+    identificator: str = Field(max_length=50)
+    additional_identificator: str = Field("", max_length=50)
+
+
+class TimetableLesson(BaseModel):
+    day_of_week: int = Field(ge=1, le=7)
+    subject: str = Field(min_length=2, max_length=200)
+    lesson_number: int = Field(ge=0, le=20)
+    teacher: str = Field(max_length=200, min_length=1)
+    cabinet: str = Field(max_length=100, min_length=1)
+    corpus: str = Field(max_length=100)
+    subclasses: List[TimetableSubclass]
+
+
+class Timetable(BaseModel):
+    """Whole school timetable, entities reference each other by natural keys:
+    lesson number by number, teacher by name, cabinet by corpus and name"""
+
+    school_id: int = Field(ge=1, le=2147483647)
+    lesson_numbers: List[TimetableLessonNumber] = Field(default_factory=list)
+    teachers: List[TimetableTeacher] = Field(default_factory=list)
+    cabinets: List[TimetableCabinet] = Field(default_factory=list)
+    subclasses: List[TimetableSubclass] = Field(default_factory=list)
+    lessons: List[TimetableLesson] = Field(default_factory=list)
+
+
+class TimetableSync(BaseModel):
+    """Every lesson a school should have after the sync, references have to
+    exist already. An empty list deletes every lesson of the school, so it is
+    only taken with `allow_empty` set"""
+
+    school_id: int = Field(ge=1, le=2147483647)
+    allow_empty: bool = False
+    lessons: List[TimetableLesson]
+
+    @validator("lessons")
+    def validate_lessons(cls, lessons, values):
+        if not lessons and not values.get("allow_empty", False):
+            raise ValueError("Set allow_empty to delete every lesson of the school")
+        return lessons
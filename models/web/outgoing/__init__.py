@@ -6,8 +6,16 @@ from models.web.outgoing.lesson import Lesson
 from models.web.outgoing.lesson_number import LessonNumber
 from models.web.outgoing.preview import AnnouncementsPreview
 from models.web.outgoing.school import School
-from models.web.outgoing.stats import Statistics
+from models.web.outgoing.stats import (
+    CountsHistory,
+    CountsPoint,
+    Statistics,
+    StatisticsHistory,
+    StatisticsPoint,
+)
 from models.web.outgoing.subclass import Subclass
 from models.web.outgoing.teacher import Teacher
 from models.web.outgoing.history import HistoryAnnouncement
+from models.web.outgoing.job import AnnouncementJob
 import models.web.outgoing.history as history
+from models.web.outgoing.timetable import TimetableImport, TimetableSync
@@ -1,12 +1,15 @@
-from typing import List
+from typing import List, Optional
 from config import BaseModel
 from pydantic import Field
 
 
 class HistoryEntity(BaseModel):
+    id: int
     link: str
     title: str
 
 
 class HistoryAnnouncement(BaseModel):
     data: List[HistoryEntity]
+    # before_id of the next page, None on the last one
+    next_before_id: Optional[int] = None
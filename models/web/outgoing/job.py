@@ -0,0 +1,10 @@
+from config import BaseModel
+
+
+class AnnouncementJob(BaseModel):
+    id: int
+    # queued, sending, done or failed
+    status: str
+    total: int
+    sent: int
+    failed: int
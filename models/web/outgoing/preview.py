@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Optional
 
 from config import BaseModel
 from pydantic import Field
@@ -20,3 +20,5 @@ class AnnouncementsPreview(BaseModel):
     sent_to_parents: bool = Field(False)
     silent: bool = Field(False)
     sent_only_to_parents: bool = Field(False)
+    # delivery of a created announcement, see /announcements/job
+    job_id: Optional[int] = None
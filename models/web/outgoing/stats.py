@@ -1,4 +1,5 @@
-from typing import Dict, List
+from datetime import date
+from typing import Dict, List, Optional
 
 from config import BaseModel
 from pydantic import Field
@@ -6,3 +7,29 @@ from pydantic import Field
 
 class Statistics(BaseModel):
     data: Dict[int, int]
+    # school id -> data of the school
+    schools: Optional[Dict[int, Dict[int, int]]] = None
+
+
+class CountsPoint(BaseModel):
+    day: date
+    users: int
+    students: int
+    teachers: int
+    parents: int
+    administrations: int
+
+
+class CountsHistory(BaseModel):
+    school_id: int
+    points: List[CountsPoint]
+
+
+class StatisticsPoint(BaseModel):
+    day: date
+    data: Dict[int, int]
+
+
+class StatisticsHistory(BaseModel):
+    school_id: int
+    points: List[StatisticsPoint]
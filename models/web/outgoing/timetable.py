@@ -0,0 +1,22 @@
+from config import BaseModel
+from pydantic import Field
+
+
+class TimetableImport(BaseModel):
+    """Amount of created rows per entity"""
+
+    lesson_numbers: int = Field(ge=0)
+    teachers: int = Field(ge=0)
+    cabinets: int = Field(ge=0)
+    subclasses: int = Field(ge=0)
+    lessons: int = Field(ge=0)
+    skipped_lessons: int = Field(ge=0)
+
+
+class TimetableSync(BaseModel):
+    """Amount of lessons per applied change"""
+
+    created: int = Field(ge=0)
+    updated: int = Field(ge=0)
+    deleted: int = Field(ge=0)
+    unchanged: int = Field(ge=0)
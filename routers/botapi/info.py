@@ -2,13 +2,20 @@
 
 from typing import List, Optional
 
-import Levenshtein  # pyright: reportMissingTypeStubs=false
 import valid_db_requests as db_validated
 from api_types import ID, TID
 from config import API_INFO_PREFIX, API_PREFIX
 from config import DEFAULT_LOGGER as logger
-from config import MAX_LEVENSHTEIN_RESULTS, Access, get_session
-from extra.api_router import LoggingRouter
+from config import (
+    LEVENSHTEIN_CANDIDATES,
+    MAX_LEVENSHTEIN_RESULTS,
+    Access,
+    get_read_session,
+)
+from extra.api_router import CachedRouter, cached
+from extra.eager_loading import load_options
+from extra.ngram_index import SCHOOL_NAMES, TEACHER_NAMES
+from extra.school_versions import SCHOOL_VERSIONS
 from extra.service_auth import AllowLevels, get_current_service
 from extra.tags import (
     CABINET,
@@ -23,10 +30,12 @@ from extra.tags import (
     WEBSITE,
     TAG,
 )
+from extra.timetable_snapshot import TIMETABLE_SNAPSHOTS
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.bot import incoming, info, item, telegram
 from pydantic import Field
+from sqlalchemy.future import select
 from typing_extensions import Annotated
 
 allowed = AllowLevels(Access.Admin, Access.Telegram, Access.Parser)
@@ -34,203 +43,396 @@ allowed = AllowLevels(Access.Admin, Access.Telegram, Access.Parser)
 router = APIRouter(
     prefix=API_PREFIX + API_INFO_PREFIX,
     dependencies=[Depends(allowed)],
-    route_class=LoggingRouter,
+    route_class=CachedRouter,
 )
 logger.info(f"Info router created on {API_PREFIX+API_INFO_PREFIX}")
 
 
 @router.get("/subclasses/all", tags=[SUBCLASS], response_model=info.Subclasses)
-async def get_subclasses(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
-    return info.Subclasses(data=[item.Subclass.from_orm(s) for s in school.subclasses])
+@cached
+async def get_subclasses(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    subclasses = (
+        await session.scalars(select(database.Subclass).filter_by(school_id=school.id))
+    ).all()
+    return info.Subclasses(data=[item.Subclass.from_orm(s) for s in subclasses])
 
 
 @router.get("/tags/all", tags=[TAG], response_model=info.Tags)
-async def get_all_tags(session=Depends(get_session)):
-    tags = session.query(database.Tag).all()
+@cached
+async def get_all_tags(session=Depends(get_read_session)):
+    tags = (await session.scalars(select(database.Tag))).all()
     return info.Tags(data=[item.Tag.from_orm(t) for t in tags])
 
 
 @router.get("/teachers/all", tags=[TEACHER], response_model=info.Teachers)
-async def get_teachers(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
-    return info.Teachers(data=[item.Teacher.from_orm(t) for t in school.teachers])
+@cached
+async def get_teachers(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    teachers = (
+        await session.scalars(
+            select(database.Teacher)
+            .filter_by(school_id=school.id)
+            .options(*db_validated.TEACHER_OPTIONS)
+        )
+    ).all()
+    return info.Teachers(data=[item.Teacher.from_orm(t) for t in teachers])
 
 
 @router.get("/parallels/all", tags=[SUBCLASS], response_model=info.Parallels)
-async def get_parallels(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
-    return info.Parallels(data=list({i.educational_level for i in school.subclasses}))
+@cached
+async def get_parallels(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    parallels = (
+        await session.scalars(
+            select(database.Subclass.educational_level)
+            .filter_by(school_id=school.id)
+            .distinct()
+        )
+    ).all()
+    return info.Parallels(data=list(parallels))
 
 
 @router.get("/teachers/distance", tags=[TEACHER], response_model=info.Teachers)
+@cached
 async def get_teacher_by_levenshtein(
     school_id: ID,
     name: Annotated[str, Field(max_length=200, min_length=1)],
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
-    school = db_validated.get_school_by_id(session, school_id)
-    name = name.lower()
-    teachers = list(school.teachers)
-    teachers.sort(
-        key=lambda teacher: (
-            name not in teacher.name.lower(),
-            teacher.name.lower().find(name)
-            if teacher.name.lower().find(name) != -1
-            else len(teacher.name) + 1,
-            Levenshtein.distance(teacher.name.lower(), name),
-        )
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    index = await TEACHER_NAMES.get(session, school.id)
+    ids = index.search(name, MAX_LEVENSHTEIN_RESULTS, LEVENSHTEIN_CANDIDATES)
+    teachers = {}
+    if ids:
+        teachers = {
+            teacher.id: teacher
+            for teacher in await session.scalars(
+                select(database.Teacher)
+                .filter(database.Teacher.id.in_(ids))
+                .options(*db_validated.TEACHER_OPTIONS)
+            )
+        }
+    # teachers deleted since the index was built are skipped
+    return info.Teachers(
+        data=[item.Teacher.from_orm(teachers[id]) for id in ids if id in teachers]
     )
-    teachers = teachers[:MAX_LEVENSHTEIN_RESULTS]
-    return info.Teachers(data=[item.Teacher.from_orm(teacher) for teacher in teachers])
 
 
 @router.get("/teachers/tag", tags=[TAG], response_model=info.Teachers)
-async def get_teachers_by_tag(school_id: ID, tag: str, session=Depends(get_session)):
-    tag = db_validated.get_tag_by_label(session, tag)
+@cached
+async def get_teachers_by_tag(
+    school_id: ID, tag: str, session=Depends(get_read_session)
+):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    tag = await db_validated.get_tag_by_label(session, tag)
     teachers = (
-        session.query(database.Teacher)
-        .filter_by(school_id=school_id)
-        .filter(database.Teacher.tags.contains(tag))
-        .all()
-    )
+        await session.scalars(
+            select(database.Teacher)
+            .filter_by(school_id=school_id)
+            .filter(database.Teacher.tags.contains(tag))
+            .options(*db_validated.TEACHER_OPTIONS)
+        )
+    ).all()
     return info.Teachers(data=[item.Teacher.from_orm(teacher) for teacher in teachers])
 
 
 @router.get("/letters/all", tags=[SUBCLASS], response_model=info.Letters)
+@cached
 async def get_letters(
     school_id: ID,
     educational_level: Annotated[int, Field(ge=0, le=12)],
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
-    school = db_validated.get_school_by_id(session, school_id)
-    data = filter(lambda s: s.educational_level == educational_level, school.subclasses)
-    return info.Letters(data=sorted(set([s.identificator for s in data])))
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    data = await session.scalars(
+        select(database.Subclass.identificator)
+        .filter_by(school_id=school.id, educational_level=educational_level)
+        .distinct()
+    )
+    return info.Letters(data=sorted(data.all()))
 
 
 @router.get("/groups/all", tags=[SUBCLASS], response_model=info.Groups)
+@cached
 async def get_groups(
     school_id: ID,
     educational_level: Annotated[int, Field(ge=0, le=12)],
     identificator: Annotated[str, Field(max_length=50)],
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
-    school = db_validated.get_school_by_id(session, school_id)
-    data = filter(
-        lambda s: s.educational_level == educational_level
-        and s.identificator == identificator,
-        school.subclasses,
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    data = await session.scalars(
+        select(database.Subclass.additional_identificator)
+        .filter_by(
+            school_id=school.id,
+            educational_level=educational_level,
+            identificator=identificator,
+        )
+        .distinct()
     )
-    return info.Groups(data=sorted(set([s.additional_identificator for s in data])))
+    return info.Groups(data=sorted(data.all()))
 
 
 @router.get("/schools/all", tags=[SCHOOL], response_model=info.Schools)
-async def get_school(session=Depends(get_session)):
-    schools = session.query(database.School).all()
+@cached
+async def get_school(session=Depends(get_read_session)):
+    schools = (await session.scalars(select(database.School))).all()
     return info.Schools(data=[item.School.from_orm(school) for school in schools])
 
 
 @router.get("/corpuses/all", tags=[CORPUS], response_model=info.Corpuses)
-async def get_corpuses(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
-    return info.Corpuses(data=[item.Corpus.from_orm(c) for c in school.corpuses])
+@cached
+async def get_corpuses(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    corpuses = (
+        await session.scalars(select(database.Corpus).filter_by(school_id=school.id))
+    ).all()
+    return info.Corpuses(data=[item.Corpus.from_orm(c) for c in corpuses])
 
 
 @router.get("/schools/distance", tags=[SCHOOL], response_model=info.Schools)
+@cached
 async def get_schools_by_levenshtein(
     name: Annotated[str, Field(max_length=200, min_length=1)],
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
-    schools = (
-        session.query(database.School)
-        .filter(database.School.name.contains(name))
-        .limit(MAX_LEVENSHTEIN_RESULTS)
-        .all()
+    index = await SCHOOL_NAMES.get(session)
+    ids = index.search(name, MAX_LEVENSHTEIN_RESULTS, LEVENSHTEIN_CANDIDATES)
+    schools = {}
+    if ids:
+        schools = {
+            school.id: school
+            for school in await session.scalars(
+                select(database.School).filter(database.School.id.in_(ids))
+            )
+        }
+    # schools deleted since the index was built are skipped
+    return info.Schools(
+        data=[item.School.from_orm(schools[id]) for id in ids if id in schools]
     )
-    return info.Schools(data=[item.School.from_orm(school) for school in schools])
 
 
 @router.get("/cabinets/all", tags=[CABINET], response_model=info.Cabinets)
-async def get_cabinets(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
-    return info.Cabinets(data=[item.Cabinet.from_orm(c) for c in school.cabinets])
+@cached
+async def get_cabinets(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    cabinets = (
+        await session.scalars(
+            select(database.Cabinet)
+            .filter_by(school_id=school.id)
+            .options(*db_validated.CABINET_OPTIONS)
+        )
+    ).all()
+    return info.Cabinets(data=[item.Cabinet.from_orm(c) for c in cabinets])
 
 
 @router.get("/cabinets/tag", tags=[TAG], response_model=info.Cabinets)
-async def get_cabinets_by_tag(school_id: ID, tag: str, session=Depends(get_session)):
-    tag = db_validated.get_tag_by_label(tag)
+@cached
+async def get_cabinets_by_tag(
+    school_id: ID, tag: str, session=Depends(get_read_session)
+):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    tag = await db_validated.get_tag_by_label(session, tag)
     cabinets = (
-        session.query(database.Cabinet)
-        .filter_by(school_id=school_id)
-        .filter(database.Cabinet.tags.contains(tag))
-        .all()
-    )
+        await session.scalars(
+            select(database.Cabinet)
+            .filter_by(school_id=school_id)
+            .filter(database.Cabinet.tags.contains(tag))
+            .options(*db_validated.CABINET_OPTIONS)
+        )
+    ).all()
     return info.Cabinets(data=[item.Cabinet.from_orm(cabinet) for cabinet in cabinets])
 
 
 @router.get("/lessons/all", tags=[LESSON], response_model=info.Lessons)
-async def get_lessons(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
-    return info.Lessons(data=[item.Lesson.from_orm(l) for l in school.lessons])
+@cached
+async def get_lessons(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    lessons = (
+        await session.scalars(
+            select(database.Lesson)
+            .filter_by(school_id=school.id)
+            .options(*db_validated.LESSON_OPTIONS)
+        )
+    ).all()
+    return info.Lessons(data=[item.Lesson.from_orm(l) for l in lessons])
 
 
 @router.get(
     "/lessontimetables/all", tags=[LESSON_NUMBER], response_model=info.LessonNumbers
 )
-async def get_all_timetables(school_id: ID, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, school_id)
+@cached
+async def get_all_timetables(school_id: ID, session=Depends(get_read_session)):
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
+    lesson_numbers = (
+        await session.scalars(
+            select(database.Lesson_number).filter_by(school_id=school.id)
+        )
+    ).all()
     return info.LessonNumbers(
-        data=[item.LessonNumber.from_orm(ln) for ln in school.lesson_numbers]
+        data=[item.LessonNumber.from_orm(ln) for ln in lesson_numbers]
     )
 
 
+# change_log entity -> Changes field, row and response model
+CHANGE_FEED = {
+    "lesson": ("lessons", database.Lesson, item.Lesson),
+    "teacher": ("teachers", database.Teacher, item.Teacher),
+    "cabinet": ("cabinets", database.Cabinet, item.Cabinet),
+    "subclass": ("subclasses", database.Subclass, item.Subclass),
+    "lesson_number": ("lesson_numbers", database.Lesson_number, item.LessonNumber),
+}
+
+
+@router.get("/changes", tags=[SCHOOL], response_model=info.Changes)
+@cached
+async def get_changes(
+    school_id: ID,
+    since: Annotated[int, Field(ge=0)],
+    session=Depends(get_read_session),
+):
+    """Rows of the school changed after data version `since`, rows deleted since
+    then are listed by id in `deleted`. Lessons embed their teacher, cabinet and
+    so on, changed ones are listed on their own and not through every lesson"""
+    version = await SCHOOL_VERSIONS.read(session, school_id)
+    if version is None:
+        logger.debug(
+            f"Raised an exception because school with id {school_id} does not exists"
+        )
+        raise HTTPException(
+            status_code=404, detail=f"School with id {school_id} does not exist"
+        )
+    entries = await session.execute(
+        select(
+            database.Change_log.entity,
+            database.Change_log.entity_id,
+            database.Change_log.deleted,
+        )
+        .filter_by(school_id=school_id)
+        .filter(
+            database.Change_log.version > since,
+            database.Change_log.version <= version,
+        )
+        .order_by(database.Change_log.version, database.Change_log.id)
+    )
+    # the latest entry of a row wins
+    latest = {(entity, entity_id): deleted for entity, entity_id, deleted in entries}
+    changes = info.Changes(version=version)
+    for entity, (field, table, model) in CHANGE_FEED.items():
+        ids = {
+            entity_id
+            for (name, entity_id), deleted in latest.items()
+            if name == entity and not deleted
+        }
+        rows = []
+        if ids:
+            rows = (
+                await session.scalars(
+                    select(table)
+                    .filter(table.id.in_(ids))
+                    .options(*load_options(table, model))
+                )
+            ).all()
+        getattr(changes, field).extend(model.from_orm(row) for row in rows)
+        # rows deleted without a log entry, with the whole school for example
+        gone = ids - {row.id for row in rows}
+        gone |= {
+            entity_id
+            for (name, entity_id), deleted in latest.items()
+            if name == entity and deleted
+        }
+        getattr(changes.deleted, field).extend(sorted(gone))
+    return changes
+
+
 @router.get("/cabinets/free", tags=[CABINET], response_model=info.Cabinets)
+@cached
 async def get_free_cabinet(
     corpus_id: ID,
     day_of_week: Annotated[int, Field(ge=1, le=7)],
     lesson_number: Optional[Annotated[int, Field(ge=0, le=20)]] = None,
     floor: Optional[Annotated[int, Field(ge=-10, le=100)]] = None,
-    session=Depends(get_session),
+    end_lesson_number: Optional[Annotated[int, Field(ge=0, le=20)]] = None,
+    session=Depends(get_read_session),
 ):
-    corpus = db_validated.get_corpus_by_id(session, corpus_id)
-    cabinet_query = session.query(database.Cabinet).filter_by(corpus_id=corpus.id)
+    """Cabinets free at `lesson_number`, through `end_lesson_number` if given,
+    or the whole day if `lesson_number` is not given"""
+    if end_lesson_number is not None:
+        if lesson_number is None or lesson_number > end_lesson_number:
+            logger.debug(
+                "Raised an exception because end_lesson_number is given without a lesson_number before it"
+            )
+            raise HTTPException(
+                status_code=422,
+                detail="Invalid lesson_number and end_lesson_number. lesson_number must be less than or equal to end_lesson_number",
+            )
+
+    if TIMETABLE_SNAPSHOTS.enabled:
+        occupancy = await TIMETABLE_SNAPSHOTS.occupancy(session, corpus_id)
+        return info.Cabinets(
+            data=occupancy.free(day_of_week, lesson_number, end_lesson_number, floor)
+        )
+
+    corpus = await db_validated.get_corpus_by_id(session, corpus_id)
+    cabinet_query = (
+        select(database.Cabinet)
+        .filter_by(corpus_id=corpus.id)
+        .options(*db_validated.CABINET_OPTIONS)
+    )
 
     if floor is not None:
         cabinet_query = cabinet_query.filter_by(floor=floor)
-    cabinets = cabinet_query.all()
+    cabinets = (await session.scalars(cabinet_query)).all()
 
     cabinets_ids = {cabinet.id for cabinet in cabinets}
 
-    lesson_query = session.query(database.Lesson).filter_by(
+    lesson_query = select(database.Lesson.cabinet_id).filter_by(
         corpus_id=corpus.id, day_of_week=day_of_week
     )
 
     if lesson_number is not None:
-        lesson_query = lesson_query.join(
-            (database.Lesson_number, database.Lesson.lesson_number)
-        ).filter(database.Lesson_number.number == lesson_number)
-    lessons = lesson_query.all()
-    for lesson in lessons:
-        cabinets_ids.discard(lesson.cabinet_id)
+        lesson_query = lesson_query.join(database.Lesson.lesson_number).filter(
+            database.Lesson_number.number.between(
+                lesson_number,
+                lesson_number if end_lesson_number is None else end_lesson_number,
+            )
+        )
+    for cabinet_id in await session.scalars(lesson_query):
+        cabinets_ids.discard(cabinet_id)
     cabinets = filter(lambda c: c.id in cabinets_ids, cabinets)
     return info.Cabinets(data=[item.Cabinet.from_orm(cabinet) for cabinet in cabinets])
 
 
 @router.get("/corpus/canteen", tags=[CORPUS], response_model=info.Canteen)
-async def get_canteen_text(corpus_id: ID, session=Depends(get_session)):
-    return info.Canteen.from_orm(db_validated.get_corpus_by_id(session, corpus_id))
+@cached
+async def get_canteen_text(corpus_id: ID, session=Depends(get_read_session)):
+    return info.Canteen.from_orm(
+        await db_validated.get_corpus_by_id(session, corpus_id)
+    )
 
 
 @router.get("/subclass/params", tags=[SUBCLASS], response_model=item.Subclass)
+@cached
 async def get_subclass_by_params(
     school_id: ID,
     educational_level: Annotated[int, Field(ge=0, le=12)],
     identificator: Annotated[str, Field(max_length=50)],
     additional_identificator: Annotated[str, Field(max_length=50)],
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ) -> item.Subclass:
-    school = db_validated.get_school_by_id(session, school_id)
-    subclass = db_validated.get_subclass_by_params(
+    school = await db_validated.get_school_by_id(session, school_id)
+    subclass = await db_validated.get_subclass_by_params(
         session,
         school.id,
         educational_level,
@@ -246,8 +448,10 @@ async def get_subclass_by_params(
     response_model=item.Result,
     dependencies=[Depends(AllowLevels(Access.Admin, Access.Telegram))],
 )
-async def check_existence(telegram_id: TID, session=Depends(get_session)):
-    account = session.query(database.Account).filter_by(telegram_id=telegram_id).first()
+async def check_existence(telegram_id: TID, session=Depends(get_read_session)):
+    account = await session.scalar(
+        select(database.Account).filter_by(telegram_id=telegram_id).limit(1)
+    )
     return item.Result(data=account is not None)
 
 
@@ -257,5 +461,5 @@ async def check_existence(telegram_id: TID, session=Depends(get_session)):
     response_model=List[int],
     dependencies=[Depends(AllowLevels(Access.Admin))],
 )
-async def get_all_users(session=Depends(get_session)):
-    return [acc.telegram_id for acc in session.query(database.Account).all()]
+async def get_all_users(session=Depends(get_read_session)):
+    return (await session.scalars(select(database.Account.telegram_id))).all()
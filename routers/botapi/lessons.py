@@ -1,18 +1,26 @@
 from collections import defaultdict
-from typing import Any, Dict, Optional, Union
+from typing import Any, Dict, Optional, Tuple, Union
 
 import valid_db_requests as db_validated
 from api_types.types import ID
 from config import API_LESSON_GETTER_PREFIX, API_PREFIX
 from config import DEFAULT_LOGGER as logger
-from config import Access, get_session
-from extra.api_router import LoggingRouter
+from config import Access, get_read_session
+from extra.api_router import CachedRouter, cached
+from extra.school_versions import SCHOOL_VERSIONS
 from extra.service_auth import AllowLevels, get_current_service
 from extra.tags import LESSON, TELEGRAM
-from fastapi import APIRouter, Depends, HTTPException
+from extra.timetable_snapshot import (
+    SUBCLASS,
+    TEACHER,
+    TIMETABLE_SNAPSHOTS,
+    SchoolTimetable,
+)
+from fastapi import APIRouter, Depends, HTTPException, Response
 from models import database
 from models.bot import incoming, info, item
 from pydantic import Field
+from sqlalchemy.future import select
 from typing_extensions import Annotated
 
 # pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false, reportUnknownLambdaType=false, reportGeneralTypeIssues=false
@@ -22,18 +30,40 @@ allowed = AllowLevels(Access.Admin, Access.Telegram, Access.Parser)
 router = APIRouter(
     prefix=API_PREFIX + API_LESSON_GETTER_PREFIX,
     dependencies=[Depends(allowed)],
-    route_class=LoggingRouter,
+    route_class=CachedRouter,
 )
 logger.info(f"Lesson Getter router created on {API_PREFIX+API_LESSON_GETTER_PREFIX}")
 
 
+async def snapshot_owner(
+    session,
+    snapshot: SchoolTimetable,
+    teacher_id: Optional[int],
+    subclass_id: Optional[int],
+) -> Tuple[str, int]:
+    """Owner of the requested lessons. Only ids the snapshot does not know are
+    looked up, so they still get a 404"""
+    if teacher_id is not None:
+        if not snapshot.has_owner(TEACHER, teacher_id):
+            await db_validated.get_teacher_by_id(session, teacher_id)
+        return TEACHER, teacher_id
+    if not snapshot.has_owner(SUBCLASS, subclass_id):
+        await db_validated.get_subclass_by_id(session, subclass_id)
+    return SUBCLASS, subclass_id
+
+
+def json_response(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json")
+
+
 @router.get("/day", tags=[LESSON], response_model=info.LessonsForDay)
+@cached
 async def get_lesson_for_day(
     school_id: ID,
     day_of_week: Annotated[int, Field(ge=1, le=7)],
     teacher_id: Optional[ID] = None,
     subclass_id: Optional[ID] = None,
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
     if teacher_id is not None and subclass_id is not None:
         raise HTTPException(
@@ -45,26 +75,31 @@ async def get_lesson_for_day(
             status_code=422, detail="You must specify a subclass_id or a teacher_id"
         )
 
-    school = db_validated.get_school_by_id(session, school_id)
+    if TIMETABLE_SNAPSHOTS.enabled:
+        snapshot = await TIMETABLE_SNAPSHOTS.get(session, school_id)
+        SCHOOL_VERSIONS.observe(school_id, snapshot.version)
+        owner = await snapshot_owner(session, snapshot, teacher_id, subclass_id)
+        return json_response(snapshot.day(*owner, day_of_week))
+
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
     if teacher_id is not None:
-        teacher = db_validated.get_teacher_by_id(session, teacher_id)
-        lessons = (
-            session.query(database.Lesson)
-            .filter_by(
-                day_of_week=day_of_week,
-                teacher_id=teacher.id,
-                school_id=school.id,
-            )
-            .all()
+        teacher = await db_validated.get_teacher_by_id(session, teacher_id)
+        lessons = select(database.Lesson).filter_by(
+            day_of_week=day_of_week,
+            teacher_id=teacher.id,
+            school_id=school.id,
         )
     else:
-        subclass = db_validated.get_subclass_by_id(session, subclass_id)
+        subclass = await db_validated.get_subclass_by_id(session, subclass_id)
         lessons = (
-            session.query(database.Lesson)
+            select(database.Lesson)
             .filter_by(day_of_week=day_of_week, school_id=school.id)
             .filter(database.Lesson.subclasses.contains(subclass))
-            .all()
         )
+    lessons = (
+        await session.scalars(lessons.options(*db_validated.LESSON_OPTIONS))
+    ).all()
 
     lessons = sorted(lessons, key=lambda x: x.lesson_number.number)
 
@@ -73,13 +108,14 @@ async def get_lesson_for_day(
 
 
 @router.get("/range", tags=[LESSON, TELEGRAM], response_model=info.LessonsForRange)
+@cached
 async def get_lesson_for_range(
     school_id: ID,
     start_index: Annotated[int, Field(ge=1, le=7)],
     end_index: Annotated[int, Field(ge=1, le=7)],
     teacher_id: Optional[ID] = None,
     subclass_id: Optional[ID] = None,
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
     if teacher_id is not None and subclass_id is not None:
         raise HTTPException(
@@ -91,7 +127,12 @@ async def get_lesson_for_range(
             status_code=422, detail="You must specify a subclass_id or a teacher_id"
         )
 
-    school = db_validated.get_school_by_id(session, school_id)
+    if TIMETABLE_SNAPSHOTS.enabled:
+        snapshot = await TIMETABLE_SNAPSHOTS.get(session, school_id)
+        SCHOOL_VERSIONS.observe(school_id, snapshot.version)
+    else:
+        await SCHOOL_VERSIONS.read(session, school_id)
+        school = await db_validated.get_school_by_id(session, school_id)
 
     logger.debug(f"Checking if start_index ({start_index}) < end_index ({end_index})")
 
@@ -104,21 +145,31 @@ async def get_lesson_for_range(
             detail="Invalid start_index and and end_index. start_index must be less than or equal to start_index",
         )
 
+    if TIMETABLE_SNAPSHOTS.enabled:
+        owner = await snapshot_owner(session, snapshot, teacher_id, subclass_id)
+        return json_response(snapshot.range(*owner, start_index, end_index))
+
     if teacher_id is not None:
-        teacher = db_validated.get_teacher_by_id(session, teacher_id)
-        lessons = session.query(database.Lesson).filter_by(
+        teacher = await db_validated.get_teacher_by_id(session, teacher_id)
+        lessons = select(database.Lesson).filter_by(
             teacher_id=teacher.id, school_id=school.id
         )
     else:
-        subclass = db_validated.get_subclass_by_id(session, subclass_id)
+        subclass = await db_validated.get_subclass_by_id(session, subclass_id)
 
         lessons = (
-            session.query(database.Lesson)
+            select(database.Lesson)
             .filter_by(school_id=school.id)
             .filter(database.Lesson.subclasses.contains(subclass))
         )
     days = list(range(start_index, end_index + 1))
-    lessons = lessons.filter(database.Lesson.day_of_week.in_(days)).all()
+    lessons = (
+        await session.scalars(
+            lessons.filter(database.Lesson.day_of_week.in_(days)).options(
+                *db_validated.LESSON_OPTIONS
+            )
+        )
+    ).all()
 
     lessons = sorted(lessons, key=lambda x: x.lesson_number.number)
 
@@ -138,13 +189,14 @@ async def get_lesson_for_range(
 
 
 @router.get("/certain", tags=[LESSON, TELEGRAM], response_model=item.Lesson)
+@cached
 async def get_certain_lesson(
     school_id: ID,
     lesson_number: Annotated[int, Field(ge=0, le=20)],
     day_of_week: Annotated[int, Field(ge=1, le=7)],
     teacher_id: Optional[ID] = None,
     subclass_id: Optional[ID] = None,
-    session=Depends(get_session),
+    session=Depends(get_read_session),
 ):
     if teacher_id is not None and subclass_id is not None:
         raise HTTPException(
@@ -156,14 +208,38 @@ async def get_certain_lesson(
             status_code=422, detail="You must specify a subclass_id or a teacher_id"
         )
 
-    school = db_validated.get_school_by_id(session, school_id)
+    if TIMETABLE_SNAPSHOTS.enabled:
+        snapshot = await TIMETABLE_SNAPSHOTS.get(session, school_id)
+        SCHOOL_VERSIONS.observe(school_id, snapshot.version)
+        if lesson_number not in snapshot.numbers:
+            logger.debug(
+                f"Raised an exception because lesson number with number {lesson_number} and school id {school_id} does not exist"
+            )
+            raise HTTPException(
+                status_code=409,
+                detail=f"Lesson number with number {lesson_number} and school id {school_id} does not exist",
+            )
+        owner = await snapshot_owner(session, snapshot, teacher_id, subclass_id)
+        lesson = snapshot.lesson(*owner, day_of_week, lesson_number)
+        if lesson is None:
+            logger.debug(
+                f"Raised an exception because lesson with params {day_of_week=} {lesson_number=} {(teacher_id, subclass_id)=} {school_id=} does not exist"
+            )
+            raise HTTPException(
+                status_code=422,
+                detail=f"Lesson with params {day_of_week=} lesson_number.number={lesson_number} {(teacher_id, subclass_id)=} {school_id=} does not exist",
+            )
+        return json_response(lesson)
+
+    await SCHOOL_VERSIONS.read(session, school_id)
+    school = await db_validated.get_school_by_id(session, school_id)
     logger.debug(
         f"Searching lesson number with number {lesson_number} and school id {school_id}"
     )
-    lesson_number = (
-        session.query(database.Lesson_number)
+    lesson_number = await session.scalar(
+        select(database.Lesson_number)
         .filter_by(school_id=school.id, number=lesson_number)
-        .first()
+        .limit(1)
     )
     if lesson_number is None:
         logger.debug(
@@ -174,23 +250,27 @@ async def get_certain_lesson(
             detail=f"Lesson number with number {lesson_number} and school id {school_id} does not exist",
         )
     if teacher_id is not None:
-        teacher = db_validated.get_teacher_by_id(session, teacher_id)
-        lessons = session.query(database.Lesson).filter_by(
+        teacher = await db_validated.get_teacher_by_id(session, teacher_id)
+        lessons = select(database.Lesson).filter_by(
             teacher_id=teacher.id, school_id=school.id
         )
     else:
-        subclass = db_validated.get_subclass_by_id(session, subclass_id)
+        subclass = await db_validated.get_subclass_by_id(session, subclass_id)
 
         lessons = (
-            session.query(database.Lesson)
+            select(database.Lesson)
             .filter_by(school_id=school.id)
             .filter(database.Lesson.subclasses.contains(subclass))
         )
 
-    lesson = lessons.filter_by(
-        day_of_week=day_of_week,
-        lesson_number_id=lesson_number.id,
-    ).first()
+    lesson = await session.scalar(
+        lessons.filter_by(
+            day_of_week=day_of_week,
+            lesson_number_id=lesson_number.id,
+        )
+        .options(*db_validated.LESSON_OPTIONS)
+        .limit(1)
+    )
     if lesson is None:
         logger.debug(
             f"Raised an exception because lesson with params {day_of_week=} {lesson_number=} {(teacher_id, subclass_id)=} {school_id=} does not exist"
@@ -24,9 +24,9 @@ logger.info(f"Registation router created on {API_PREFIX+API_REGISTRATION_PREFIX}
 
 @router.post("/student", tags=[STUDENT], response_model=outgoing.Account)
 async def register_student(request: incoming.Student, session=Depends(get_session)):
-    db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
-    subclass = db_validated.get_subclass_by_id(session, request.subclass_id)
-    school = db_validated.get_school_by_id(session, subclass.school_id)
+    await db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
+    subclass = await db_validated.get_subclass_by_id(session, request.subclass_id)
+    school = await db_validated.get_school_by_id(session, subclass.school_id)
 
     account = database.Account(
         telegram_id=request.telegram_id,
@@ -49,15 +49,18 @@ async def register_student(request: incoming.Student, session=Depends(get_sessio
     session.add(student)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.post("/teacher", tags=[TEACHER], response_model=outgoing.Account)
 async def register_teacher(request: incoming.Teacher, session=Depends(get_session)):
-    db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
-    teacher = db_validated.get_teacher_by_id(session, request.teacher_id)
+    await db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
+    teacher = await db_validated.get_teacher_by_id(session, request.teacher_id)
 
     account = database.Account(
         telegram_id=request.telegram_id,
@@ -78,8 +81,11 @@ async def register_teacher(request: incoming.Teacher, session=Depends(get_sessio
     account.roles.append(role)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
@@ -87,8 +93,8 @@ async def register_teacher(request: incoming.Teacher, session=Depends(get_sessio
 async def register_administration(
     request: incoming.Administration, session=Depends(get_session)
 ):
-    db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
-    school = db_validated.get_school_by_id(session, request.school_id)
+    await db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
+    school = await db_validated.get_school_by_id(session, request.school_id)
     account = database.Account(
         telegram_id=request.telegram_id,
         premium_status=0,
@@ -111,14 +117,17 @@ async def register_administration(
     session.add(administration)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.post("/parent", tags=[PARENT], response_model=outgoing.Account)
 async def register_parent(request: incoming.Parent, session=Depends(get_session)):
-    db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
+    await db_validated.check_unique_account_by_telegram_id(session, request.telegram_id)
 
     account = database.Account(
         telegram_id=request.telegram_id,
@@ -142,6 +151,9 @@ async def register_parent(request: incoming.Parent, session=Depends(get_session)
     session.add(parent)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
@@ -15,6 +15,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.bot import incoming as bot_incoming
 from models.bot.telegram import incoming, outgoing
+from sqlalchemy.future import select
+from sqlalchemy.orm import joinedload
 
 
 allowed = AllowLevels(Access.Admin, Access.Telegram)
@@ -31,13 +33,15 @@ logger.info(
 
 @router.get("/get", tags=[TELEGRAM], response_model=outgoing.Account)
 async def get_by_id(telegram_id: TID, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, telegram_id)
+    account = await db_validated.get_account_by_telegram_id(session, telegram_id)
     return outgoing.Account.from_orm(account)
 
 
 @router.put("/add/parent", tags=[PARENT], response_model=outgoing.Account)
-def add_parent_role(request: incoming.Parent, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+async def add_parent_role(request: incoming.Parent, session=Depends(get_session)):
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     if any(role.role_type == database.RoleEnum.PARENT for role in account.roles):
         logger.debug(
@@ -63,14 +67,19 @@ def add_parent_role(request: incoming.Parent, session=Depends(get_session)):
     session.add(parent)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.put("/add/student", tags=[STUDENT], response_model=outgoing.Account)
-def add_student_role(request: incoming.Student, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+async def add_student_role(request: incoming.Student, session=Depends(get_session)):
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     if any(role.role_type == database.RoleEnum.STUDENT for role in account.roles):
         logger.debug(
@@ -81,8 +90,8 @@ def add_student_role(request: incoming.Student, session=Depends(get_session)):
             detail=f"User with telegram id {request.telegram_id} already has student role",
         )
 
-    subclass = db_validated.get_subclass_by_id(session, request.subclass_id)
-    school = db_validated.get_school_by_id(session, subclass.school_id)
+    subclass = await db_validated.get_subclass_by_id(session, request.subclass_id)
+    school = await db_validated.get_school_by_id(session, subclass.school_id)
 
     student = database.Student(school=school, subclass=subclass)
 
@@ -98,14 +107,19 @@ def add_student_role(request: incoming.Student, session=Depends(get_session)):
     session.add(student)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.put("/add/teacher", tags=[TEACHER], response_model=outgoing.Account)
-def add_teacher_role(request: incoming.Teacher, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+async def add_teacher_role(request: incoming.Teacher, session=Depends(get_session)):
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     if any(role.role_type == database.RoleEnum.TEACHER for role in account.roles):
         logger.debug(
@@ -115,7 +129,7 @@ def add_teacher_role(request: incoming.Teacher, session=Depends(get_session)):
             status_code=409,
             detail=f"User with telegram id {request.telegram_id} already has teacher role",
         )
-    teacher = db_validated.get_teacher_by_id(session, request.teacher_id)
+    teacher = await db_validated.get_teacher_by_id(session, request.teacher_id)
 
     role = database.Role(
         is_main_role=False,
@@ -128,18 +142,23 @@ def add_teacher_role(request: incoming.Teacher, session=Depends(get_session)):
     account.roles.append(role)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.put(
     "/add/administration", tags=[ADMINISTRATION], response_model=outgoing.Account
 )
-def add_administration_role(
+async def add_administration_role(
     request: incoming.Administration, session=Depends(get_session)
 ):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     if any(
         role.role_type == database.RoleEnum.ADMINISTRATION for role in account.roles
@@ -151,7 +170,7 @@ def add_administration_role(
             status_code=409,
             detail=f"User with telegram id {request.telegram_id} already has administration role",
         )
-    school = db_validated.get_school_by_id(session, request.school_id)
+    school = await db_validated.get_school_by_id(session, request.school_id)
 
     administration = database.Administration(school=school)
 
@@ -168,14 +187,19 @@ def add_administration_role(
     session.add(administration)
     session.add(account)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.put("/add/child", tags=[PARENT], response_model=outgoing.Account)
 async def add_child(request: incoming.Child, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     for role in account.roles:
         if role.role_type == database.RoleEnum.PARENT:
@@ -201,7 +225,9 @@ async def add_child(request: incoming.Child, session=Depends(get_session)):
             detail=f"User {account.telegram_id} has premium status {account.premium_status} which allow having only {BASIC_STATUS_MAX_CHILDREN} child(ren)",
         )
 
-    subclass = db_validated.get_subclass_by_id(session, request.subclass_id)
+    subclass = await db_validated.get_subclass_by_id(
+        session, request.subclass_id, joinedload(database.Subclass.school)
+    )
 
     child = database.Student(subclass=subclass, school=subclass.school)
 
@@ -209,14 +235,19 @@ async def add_child(request: incoming.Child, session=Depends(get_session)):
 
     session.add(child)
     session.add(account)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.put("/delete/child", tags=[PARENT], response_model=outgoing.Account)
 async def remove_child(request: bot_incoming.Child, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     for role in account.roles:
         if role.role_type == database.RoleEnum.PARENT:
@@ -232,16 +263,19 @@ async def remove_child(request: bot_incoming.Child, session=Depends(get_session)
 
     parent_id = role.parent.id
 
-    child = (
-        session.query(database.Student)
+    child = await session.scalar(
+        select(database.Student)
         .filter_by(parent_id=parent_id, id=request.child_id)
-        .first()
+        .limit(1)
     )
 
-    session.delete(child)
+    await session.delete(child)
     session.add(role)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
@@ -249,8 +283,10 @@ async def remove_child(request: bot_incoming.Child, session=Depends(get_session)
 async def change_role_to_teacher(
     request: incoming.Teacher, session=Depends(get_session)
 ):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
-    teacher = db_validated.get_teacher_by_id(session, request.teacher_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
+    teacher = await db_validated.get_teacher_by_id(session, request.teacher_id)
 
     main_role = None
     teacher_role = None
@@ -277,21 +313,24 @@ async def change_role_to_teacher(
             administration=None,
         )
         main_role.is_main_role = False
-        session.delete(teacher_role)
+        await session.delete(teacher_role)
 
         if main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.parent is not None:
-            session.delete(main_role.parent)
-        session.delete(main_role)
+            await session.delete(main_role.parent)
+        await session.delete(main_role)
 
         account.roles = [new_role]
         session.add(new_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
 
         # raise HTTPException(
@@ -306,8 +345,11 @@ async def change_role_to_teacher(
         session.add(main_role)
         session.add(teacher_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
 
     if account.premium_status >= 1:
@@ -333,25 +375,30 @@ async def change_role_to_teacher(
         )
 
         if main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.parent is not None:
-            session.delete(main_role.parent)
-        session.delete(main_role)
+            await session.delete(main_role.parent)
+        await session.delete(main_role)
 
         account.roles = [new_role]
 
     session.add(new_role)
     session.add(account)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
 @router.put("/change/parent", tags=[PARENT], response_model=outgoing.Account)
 async def change_role_to_parent(request: incoming.Parent, session=Depends(get_session)):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
 
     main_role = None
     parent_role = None
@@ -380,22 +427,25 @@ async def change_role_to_parent(request: incoming.Parent, session=Depends(get_se
         )
         main_role.is_main_role = False
 
-        session.delete(parent_role.parent)
-        session.delete(parent_role)
+        await session.delete(parent_role.parent)
+        await session.delete(parent_role)
 
         if main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.teacher is not None:
-            session.delete(main_role.teacher)
-        session.delete(main_role)
+            await session.delete(main_role.teacher)
+        await session.delete(main_role)
 
         account.roles = [new_role]
         session.add(new_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
         # raise HTTPException(
         #     status_code=409,
@@ -409,8 +459,11 @@ async def change_role_to_parent(request: incoming.Parent, session=Depends(get_se
         session.add(main_role)
         session.add(parent_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
 
     if account.premium_status >= 1:
@@ -436,19 +489,22 @@ async def change_role_to_parent(request: incoming.Parent, session=Depends(get_se
         )
 
         if main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.parent is not None:
-            session.delete(main_role.parent)
-        session.delete(main_role)
+            await session.delete(main_role.parent)
+        await session.delete(main_role)
 
         account.roles = [new_role]
 
     session.add(new_role)
     session.add(account)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
@@ -456,8 +512,12 @@ async def change_role_to_parent(request: incoming.Parent, session=Depends(get_se
 async def change_role_to_student(
     request: incoming.Student, session=Depends(get_session)
 ):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
-    subclass = db_validated.get_subclass_by_id(session, request.subclass_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
+    subclass = await db_validated.get_subclass_by_id(
+        session, request.subclass_id, joinedload(database.Subclass.school)
+    )
 
     main_role = None
     student_role = None
@@ -486,23 +546,26 @@ async def change_role_to_student(
         )
         main_role.is_main_role = False
 
-        session.delete(student_role.student)
-        session.delete(student_role)
+        await session.delete(student_role.student)
+        await session.delete(student_role)
 
         if main_role.parent is not None:
-            session.delete(main_role.parent)
+            await session.delete(main_role.parent)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.teacher is not None:
-            session.delete(main_role.teacher)
-        session.delete(main_role)
+            await session.delete(main_role.teacher)
+        await session.delete(main_role)
 
         account.roles = [new_role]
 
         session.add(new_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
         # raise HTTPException(
         #     status_code=409,
@@ -516,8 +579,11 @@ async def change_role_to_student(
         session.add(main_role)
         session.add(student_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
 
     if account.premium_status >= 1:
@@ -543,19 +609,22 @@ async def change_role_to_student(
         )
 
         if main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.parent is not None:
-            session.delete(main_role.parent)
-        session.delete(main_role)
+            await session.delete(main_role.parent)
+        await session.delete(main_role)
 
         account.roles = [new_role]
 
     session.add(new_role)
     session.add(account)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
 
 
@@ -565,8 +634,10 @@ async def change_role_to_student(
 async def change_role_to_administration(
     request: incoming.Administration, session=Depends(get_session)
 ):
-    account = db_validated.get_account_by_telegram_id(session, request.telegram_id)
-    school = db_validated.get_subclass_by_id(session, request.school_id)
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
+    school = await db_validated.get_subclass_by_id(session, request.school_id)
 
     main_role = None
     administration_role = None
@@ -595,23 +666,26 @@ async def change_role_to_administration(
         )
         main_role.is_main_role = False
 
-        session.delete(administration_role.administration)
-        session.delete(administration_role)
+        await session.delete(administration_role.administration)
+        await session.delete(administration_role)
 
         if main_role.parent is not None:
-            session.delete(main_role.parent)
+            await session.delete(main_role.parent)
         elif main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.teacher is not None:
-            session.delete(main_role.teacher)
-        session.delete(main_role)
+            await session.delete(main_role.teacher)
+        await session.delete(main_role)
 
         account.roles = [new_role]
 
         session.add(new_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
         # raise HTTPException(
         #     status_code=409,
@@ -625,8 +699,11 @@ async def change_role_to_administration(
         session.add(main_role)
         session.add(administration_role)
         session.add(account)
-        session.commit()
+        await session.commit()
 
+        account = await db_validated.get_account_by_telegram_id(
+            session, request.telegram_id
+        )
         return outgoing.Account.from_orm(account)
 
     if account.premium_status >= 1:
@@ -652,17 +729,20 @@ async def change_role_to_administration(
         )
 
         if main_role.student is not None:
-            session.delete(main_role.student)
+            await session.delete(main_role.student)
         elif main_role.administration is not None:
-            session.delete(main_role.administration)
+            await session.delete(main_role.administration)
         elif main_role.parent is not None:
-            session.delete(main_role.parent)
-        session.delete(main_role)
+            await session.delete(main_role.parent)
+        await session.delete(main_role)
 
         account.roles = [new_role]
 
     session.add(new_role)
     session.add(account)
-    session.commit()
+    await session.commit()
 
+    account = await db_validated.get_account_by_telegram_id(
+        session, request.telegram_id
+    )
     return outgoing.Account.from_orm(account)
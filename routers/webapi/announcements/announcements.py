@@ -1,11 +1,15 @@
 # pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false, reportUnknownLambdaType=false, reportGeneralTypeIssues=false
 
 
-from typing import List
+from typing import Optional
+
+from extra.telegraph_pages import content_hash
+from routers.webapi.announcements.dispatcher import ANNOUNCEMENT_DISPATCHER
 from routers.webapi.announcements.utils import (
+    link_roles,
+    new_job,
     process_announcement,
     publish_to_telegraph,
-    send_to_transmitter,
 )
 import valid_db_requests as db_validated
 from config import API_ANNOUNCEMENTS_PREFIX, API_PREFIX, MAX_HISTORY_RESULTS
@@ -19,6 +23,8 @@ from fastapi import APIRouter, Depends
 from fastapi.exceptions import HTTPException
 from models import database
 from models.web import incoming, outgoing
+from sqlalchemy import func
+from sqlalchemy.future import select
 
 allowed = AllowLevels(Access.Admin, Access.Website)
 
@@ -29,21 +35,40 @@ router = APIRouter(
 )
 
 
+def job_status(job: database.Announcement_job) -> outgoing.AnnouncementJob:
+    return outgoing.AnnouncementJob(
+        id=job.id,
+        status=job.status.name.lower(),
+        total=job.total,
+        sent=job.sent,
+        failed=job.failed,
+    )
+
+
+# Announcements are saved and answered with 202 at once, the telegram ids are
+# posted to the transmitter by ANNOUNCEMENT_DISPATCHER, see /job for progress.
+
+
 @router.post(
     "/create",
     tags=[ANNOUNCEMENTS, WEBSITE],
+    status_code=202,
     response_model=outgoing.AnnouncementsPreview,
+    response_model_exclude_none=True,
 )
 async def post_new_announcement(
     request: incoming.Announcement, session=Depends(get_session)
 ):
-    teachers, subclasses = await process_announcement(session, request, save=True)
+    ANNOUNCEMENT_DISPATCHER.ensure_capacity()
+    teachers, subclasses, job = await process_announcement(session, request, save=True)
+    ANNOUNCEMENT_DISPATCHER.enqueue(job.id)
     return outgoing.AnnouncementsPreview(
         teachers=[outgoing.preview.Teacher.from_orm(t) for t in teachers],
         subclasses=[outgoing.preview.Subclass.from_orm(s) for s in subclasses],
         sent_to_parents=request.resend_to_parents,
         sent_only_to_parents=request.send_only_to_parents,
         silent=request.silent,
+        job_id=job.id,
     )
 
 
@@ -51,11 +76,12 @@ async def post_new_announcement(
     "/preview",
     tags=[ANNOUNCEMENTS, WEBSITE],
     response_model=outgoing.AnnouncementsPreview,
+    response_model_exclude_none=True,
 )
 async def preview_announcement(
     request: incoming.Announcement, session=Depends(get_session)
 ):
-    teachers, subclasses = await process_announcement(session, session, save=False)
+    teachers, subclasses, _ = await process_announcement(session, request, save=False)
     return outgoing.AnnouncementsPreview(
         teachers=[outgoing.preview.Teacher.from_orm(t) for t in teachers],
         subclasses=[outgoing.preview.Subclass.from_orm(s) for s in subclasses],
@@ -68,40 +94,71 @@ async def preview_announcement(
 @router.post(
     "/toall",
     tags=[ANNOUNCEMENTS, WEBSITE],
-    response_model=List[int],
+    status_code=202,
+    response_model=outgoing.AnnouncementJob,
     dependencies=[Depends(AllowLevels(Access.Admin))],
 )
 async def send_to_all(
     request: incoming.SimpleTelegraphAnnouncement, session=Depends(get_session)
 ):
-    link = await publish_to_telegraph(request.title, request.text)
-    accounts = session.query(database.Account).all()
-    roles = []
-    for acc in accounts:
-        roles.extend(acc.roles)
-    announcement = database.Announcement(link=link, title=request.title)
-    for role in roles:
-        announcement.roles.append(role)
-
+    ANNOUNCEMENT_DISPATCHER.ensure_capacity()
+    link = await publish_to_telegraph(request.title, request.text, session)
+    announcement = database.Announcement(
+        link=link,
+        title=request.title,
+        content_hash=content_hash(request.title, request.text),
+    )
     session.add(announcement)
-    session.commit()
-
-    telegram_ids = [acc.telegram_id for acc in accounts]
-
-    await send_to_transmitter(link, telegram_ids, silent=request.silent)
-    return telegram_ids
+    await session.flush()
+    await link_roles(
+        session,
+        announcement.id,
+        select(database.Role.id).filter(database.Role.account_id.isnot(None)),
+    )
+    job = new_job(
+        link,
+        request.silent,
+        await session.scalar(select(func.count()).select_from(database.Account)),
+        announcement_id=announcement.id,
+        to_all=True,
+    )
+    session.add(job)
+    await session.commit()
+    ANNOUNCEMENT_DISPATCHER.enqueue(job.id)
+    return job_status(job)
 
 
-@router.post("/text/toall", tags=[ANNOUNCEMENTS], response_model=List[int])
+@router.post(
+    "/text/toall",
+    tags=[ANNOUNCEMENTS],
+    status_code=202,
+    response_model=outgoing.AnnouncementJob,
+)
 async def send_text_to_all(
     request: incoming.SimpleTextAnnouncement,
     session=Depends(get_session),
     _=Depends(AllowLevels(Access.Admin)),
 ):
-    accounts = session.query(database.Account).all()
-    telegram_ids = [acc.telegram_id for acc in accounts]
-    await send_to_transmitter(request.text, telegram_ids, silent=request.silent)
-    return telegram_ids
+    ANNOUNCEMENT_DISPATCHER.ensure_capacity()
+    job = new_job(
+        request.text,
+        request.silent,
+        await session.scalar(select(func.count()).select_from(database.Account)),
+        to_all=True,
+    )
+    session.add(job)
+    await session.commit()
+    ANNOUNCEMENT_DISPATCHER.enqueue(job.id)
+    return job_status(job)
+
+
+@router.get(
+    "/job",
+    tags=[ANNOUNCEMENTS, WEBSITE],
+    response_model=outgoing.AnnouncementJob,
+)
+async def get_job(job_id: ID, session=Depends(get_session)):
+    return job_status(await db_validated.get_announcement_job_by_id(session, job_id))
 
 
 @router.get(
@@ -110,9 +167,27 @@ async def send_text_to_all(
     response_model=outgoing.HistoryAnnouncement,
     dependencies=[Depends(AllowLevels(Access.Admin, Access.Telegram))],
 )
-async def get_history(role_id: ID, session=Depends(get_session)):
-    role = db_validated.get_role_by_id(session, role_id)
-    data = list(sorted(role.announcements, key=lambda x: -x.id))[:MAX_HISTORY_RESULTS]
+async def get_history(
+    role_id: ID, before_id: Optional[ID] = None, session=Depends(get_session)
+):
+    role = await db_validated.get_role_by_id(session, role_id)
+    association = database.role_announcement_association
+    # the (role_id, announcement_id) primary key of the association serves the
+    # filter and the order, only the returned page is read
+    query = (
+        select(database.Announcement)
+        .join(association, association.c.announcement_id == database.Announcement.id)
+        .filter(association.c.role_id == role.id)
+        .order_by(association.c.announcement_id.desc())
+        .limit(MAX_HISTORY_RESULTS)
+    )
+    if before_id is not None:
+        query = query.filter(association.c.announcement_id < before_id)
+    data = (await session.scalars(query)).all()
     return outgoing.HistoryAnnouncement(
-        data=[outgoing.history.HistoryEntity(link=x.link, title=x.title) for x in data]
+        data=[
+            outgoing.history.HistoryEntity(id=x.id, link=x.link, title=x.title)
+            for x in data
+        ],
+        next_before_id=data[-1].id if len(data) == MAX_HISTORY_RESULTS else None,
     )
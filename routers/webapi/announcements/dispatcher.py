@@ -0,0 +1,301 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+import aiohttp
+from config import (
+    ANNOUNCEMENT_CHUNK_SIZE,
+    ANNOUNCEMENT_CONCURRENCY,
+    ANNOUNCEMENT_QUEUE_SIZE,
+    ANNOUNCEMENT_RETRIES,
+    ANNOUNCEMENT_RETRY_SECONDS,
+    ANNOUNCEMENT_STALE_SECONDS,
+    ANNOUNCEMENT_SWEEP_SECONDS,
+    SESSION_FACTORY,
+)
+from config import DEFAULT_LOGGER as logger
+from extra.transmitter import TRANSMITTER, TransmitterError
+from fastapi.exceptions import HTTPException
+from models import database
+from routers.webapi.announcements import utils
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
+
+Job = database.Announcement_job
+Account = database.Account
+Status = database.JobStatusEnum
+
+
+def recipients(job: Job, after: int, limit: int) -> Select:
+    """(account id, telegram id) of the next `limit` accounts of the job"""
+    query = select(Account.id, Account.telegram_id)
+    if not job.to_all:
+        association = database.role_announcement_association
+        query = (
+            query.join(database.Role, database.Role.account_id == Account.id)
+            .join(association, association.c.role_id == database.Role.id)
+            .filter(association.c.announcement_id == job.announcement_id)
+            # an account with several of the roles gets the text once
+            .group_by(Account.id, Account.telegram_id)
+        )
+    return query.filter(Account.id > after).order_by(Account.id).limit(limit)
+
+
+def repeatable(error: Exception) -> bool:
+    """Whether a failed post surely did not reach the recipients"""
+    if isinstance(error, TransmitterError):
+        return error.args[0] >= 500
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+
+class AnnouncementDispatcher:
+    """Delivers queued announcement jobs of this worker in the background
+
+    A job is posted to the transmitter in chunks of `chunk_size` telegram ids,
+    as many at a time as TRANSMITTER allows. A chunk is posted again, up to
+    `retries` attempts in all, only when it surely did not go out: the
+    connection failed or the transmitter answered with a 5xx. A timeout or a
+    dropped connection may come after the transmitter sent the text, so the
+    ids of such a chunk count as failed rather than get it twice.
+
+    Progress is saved after every batch. Jobs are taken by the first worker
+    that switches them from QUEUED to SENDING, so a job queued by a worker
+    whose queue was full or which went down is delivered by a sweep of any
+    worker. A delivery stopped with the worker is queued again, one left
+    SENDING by a crash is queued again by a sweep once it saved nothing for
+    `stale_seconds`. Either way it resumes after the last saved batch, the
+    batch in flight may be posted twice.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int,
+        concurrency: int,
+        queue_size: int,
+        retries: int,
+        retry_seconds: float,
+        sweep_seconds: float,
+        stale_seconds: float,
+    ):
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.retries = retries
+        self.retry_seconds = retry_seconds
+        self.sweep_seconds = sweep_seconds
+        self.stale_seconds = stale_seconds
+        self.session_factory: Callable[..., AsyncSession] = SESSION_FACTORY
+        self.delivered = 0
+        self.retried = 0
+        self.reclaimed = 0
+        self._queue: Optional[asyncio.Queue] = None
+        # ids in the queue, a sweep does not queue them again
+        self._waiting: Set[int] = set()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def ensure_capacity(self):
+        """Refuse new jobs while the queue of the worker is full"""
+        if self._queue is not None and self._queue.full():
+            logger.debug("Raised an exception because the announcement queue is full")
+            raise HTTPException(
+                status_code=503,
+                detail="Too many announcements are being sent, try again later",
+            )
+
+    def enqueue(self, job_id: int):
+        """Queue a committed job, a job that does not fit waits for a sweep"""
+        if self._queue is None or job_id in self._waiting:
+            return
+        try:
+            self._queue.put_nowait(job_id)
+            self._waiting.add(job_id)
+        except asyncio.QueueFull:
+            logger.warning(f"Announcement job {job_id} left for a sweep")
+
+    def start(self):
+        if self.running:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [loop.create_task(self._sweep())] + [
+            loop.create_task(self._work()) for _ in range(self.concurrency)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+        self._waiting.clear()
+
+    async def _sweep(self):
+        while True:
+            try:
+                async with self.session_factory() as session:
+                    await self._reclaim(session)
+                    queued = await session.scalars(
+                        select(Job.id)
+                        .filter(Job.status == Status.QUEUED)
+                        .order_by(Job.id)
+                        .limit(self.queue_size)
+                    )
+                    for job_id in queued:
+                        if self._queue.full():
+                            break
+                        self.enqueue(job_id)
+            except Exception as error:
+                logger.error(f"Can not look for queued announcement jobs: {error!r}")
+            await asyncio.sleep(self.sweep_seconds)
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            self._waiting.discard(job_id)
+            try:
+                await self.deliver(job_id)
+            except Exception as error:
+                logger.error(f"Announcement job {job_id} stopped: {error!r}")
+            finally:
+                self._queue.task_done()
+
+    async def _reclaim(self, session: AsyncSession):
+        """Queue again the jobs of crashed workers"""
+        stale = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        reclaimed = await session.execute(
+            update(Job)
+            .where(Job.status == Status.SENDING, Job.updated < stale)
+            .values(status=Status.QUEUED, updated=datetime.utcnow())
+        )
+        await session.commit()
+        if reclaimed.rowcount:
+            self.reclaimed += reclaimed.rowcount
+            logger.warning(
+                f"Queued {reclaimed.rowcount} abandoned announcement jobs again"
+            )
+
+    async def _claim(self, session: AsyncSession, job_id: int) -> Optional[Job]:
+        claimed = await session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == Status.QUEUED)
+            .values(status=Status.SENDING, updated=datetime.utcnow())
+        )
+        await session.commit()
+        if claimed.rowcount != 1:
+            return None
+        return await session.get(Job, job_id)
+
+    async def _post(self, job: Job, telegram_ids: List[int]) -> bool:
+        """Whether the transmitter took the chunk within `retries` attempts,
+        only repeatable failures are tried again"""
+        for attempt in range(self.retries):
+            if attempt:
+                self.retried += 1
+                await asyncio.sleep(self.retry_seconds * 2 ** (attempt - 1))
+            try:
+                await utils.send_to_transmitter(job.text, telegram_ids, job.silent)
+                return True
+            except (
+                TransmitterError,
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+            ) as error:
+                logger.warning(
+                    f"Announcement job {job.id} chunk attempt {attempt + 1} failed: {error!r}"
+                )
+                if not repeatable(error):
+                    break
+        return False
+
+    async def deliver(self, job_id: int):
+        async with self.session_factory() as session:
+            job = await self._claim(session, job_id)
+            if job is None:
+                return
+            logger.info(f"Delivering announcement job {job.id} to {job.total} accounts")
+            try:
+                # chunks posted together, TRANSMITTER runs as many posts at a time
+                batch = self.chunk_size * TRANSMITTER.parallel
+                while True:
+                    rows = (
+                        await session.execute(recipients(job, job.cursor, batch))
+                    ).all()
+                    # the connection goes back to the pool while the chunks are posted
+                    await session.commit()
+                    if not rows:
+                        break
+                    chunks = [
+                        rows[start : start + self.chunk_size]
+                        for start in range(0, len(rows), self.chunk_size)
+                    ]
+                    posted = await asyncio.gather(
+                        *(
+                            self._post(job, [telegram_id for _, telegram_id in chunk])
+                            for chunk in chunks
+                        )
+                    )
+                    for chunk, delivered in zip(chunks, posted):
+                        if delivered:
+                            job.sent += len(chunk)
+                            self.delivered += len(chunk)
+                        else:
+                            job.failed += len(chunk)
+                    job.cursor = rows[-1][0]
+                    job.updated = datetime.utcnow()
+                    await session.commit()
+            except asyncio.CancelledError:
+                # the worker stops, another one resumes from the cursor
+                try:
+                    await session.rollback()
+                    job.status = Status.QUEUED
+                    job.updated = datetime.utcnow()
+                    await session.commit()
+                    logger.info(f"Announcement job {job_id} queued again")
+                except Exception as error:
+                    logger.error(
+                        f"Announcement job {job_id} is left for a sweep: {error!r}"
+                    )
+                raise
+            except Exception:
+                # saved progress is kept, a job left SENDING would never finish
+                await session.rollback()
+                job.status = Status.FAILED
+                job.finished = datetime.utcnow()
+                await session.commit()
+                raise
+            job.status = Status.FAILED if job.failed else Status.DONE
+            job.finished = datetime.utcnow()
+            await session.commit()
+            logger.info(
+                f"Announcement job {job.id} finished, {job.sent} sent, {job.failed} failed"
+            )
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "reclaimed": self.reclaimed,
+        }
+
+
+ANNOUNCEMENT_DISPATCHER = AnnouncementDispatcher(
+    ANNOUNCEMENT_CHUNK_SIZE,
+    ANNOUNCEMENT_CONCURRENCY,
+    ANNOUNCEMENT_QUEUE_SIZE,
+    ANNOUNCEMENT_RETRIES,
+    ANNOUNCEMENT_RETRY_SECONDS,
+    ANNOUNCEMENT_SWEEP_SECONDS,
+    ANNOUNCEMENT_STALE_SECONDS,
+)
@@ -1,103 +1,102 @@
-from typing import List, Set, Tuple, Union
-from sqlalchemy.orm.session import Session
+from datetime import datetime
+from typing import Collection, List, Optional, Set, Tuple, Union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
 from models import database
-from sqlalchemy import Column
+from sqlalchemy import Column, distinct, func, insert, literal, union_all
 import valid_db_requests as db_validated
 from models import database
 from models.web import incoming
 from sqlalchemy import Column
-import aiohttp
 from fastapi.exceptions import HTTPException
-from config import TRANSMITTER_HOST, TRANSMITTER_PORT
 from config import DEFAULT_LOGGER as logger
-from telegraph.aio import Telegraph
+from extra.telegraph_pages import TELEGRAPH_PAGES, content_hash
+from extra.transmitter import TRANSMITTER
 from telegraph.exceptions import InvalidHTML
 
 
-def get_students(
-    session: Session, subclasses: Set[database.Subclass]
-) -> Tuple[Set[Column], Set[database.Role]]:
-    telegram_ids = set()
-    roles = set()
-
-    student_query = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.STUDENT)
-        .join((database.Student, database.Role.student))
-        .join((database.Subclass, database.Student.subclass))
-        .filter(database.Subclass.id.in_([s.id for s in subclasses]))
-        .all()
-    )
-
-    for role in student_query:
-        telegram_ids.add(role.account.telegram_id)
-        roles.add(role)
-
-    return telegram_ids, roles
-
-
-def get_teachers(
-    session, teachers: Set[database.Teacher]
-) -> Tuple[Set[Column], Set[database.Role]]:
-    telegram_ids = set()
-    roles = set()
+def audience_query(
+    teacher_ids: Collection[int],
+    subclass_ids: Collection[int],
+    students: bool = True,
+    parents: bool = False,
+) -> Optional[Select]:
+    """(role id, telegram id) of roles of the teachers and, if asked for, of
+    students of the subclasses and their parents, None if there are none"""
+    Role = database.Role
+
+    def roles(role_type: database.RoleEnum) -> Select:
+        return (
+            select(Role.id, database.Account.telegram_id)
+            .join(database.Account, Role.account_id == database.Account.id)
+            .filter(Role.role_type == role_type)
+        )
 
-    teachers_query: List[database.Role] = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.TEACHER)
-        .join((database.Teacher, database.Role.teacher))
-        .filter(database.Teacher.id.in_([t.id for t in teachers]))
-        .all()
+    queries = []
+    if teacher_ids:
+        queries.append(
+            roles(database.RoleEnum.TEACHER).filter(Role.teacher_id.in_(teacher_ids))
+        )
+    if subclass_ids and students:
+        queries.append(
+            roles(database.RoleEnum.STUDENT)
+            .join(database.Student, Role.student_id == database.Student.id)
+            .filter(database.Student.subclass_id.in_(subclass_ids))
+        )
+    if subclass_ids and parents:
+        queries.append(
+            roles(database.RoleEnum.PARENT)
+            .join(database.Student, Role.parent_id == database.Student.parent_id)
+            .filter(database.Student.subclass_id.in_(subclass_ids))
+            # once for parents with several children in the subclasses
+            .distinct()
+        )
+    if not queries:
+        return None
+    # branches select roles of different types, none is in two of them
+    return union_all(*queries)
+
+
+async def link_roles(session: AsyncSession, announcement_id: int, roles: Select) -> int:
+    """Associate the announcement with roles of ids in the first column of
+    `roles` by one INSERT ... SELECT, returns the amount of their accounts"""
+    association = database.role_announcement_association
+    rows = roles.subquery()
+    await session.execute(
+        insert(association).from_select(
+            ["role_id", "announcement_id"],
+            select(list(rows.c)[0], literal(announcement_id)),
+        )
     )
-
-    for role in teachers_query:
-        telegram_ids.add(role.account.telegram_id)
-        roles.add(role)
-
-    return telegram_ids, roles
-
-
-def get_parents(
-    session: Session, subclasses: Set[database.Subclass]
-) -> Tuple[Set[Column], Set[database.Parent]]:
-    telegram_ids = set()
-    roles = set()
-
-    parents_query = (
-        session.query(database.Role).filter_by(role_type=database.RoleEnum.PARENT).all()
+    return await session.scalar(
+        select(func.count(distinct(database.Role.account_id)))
+        .select_from(association)
+        .join(database.Role, database.Role.id == association.c.role_id)
+        .filter(association.c.announcement_id == announcement_id)
     )
 
-    for parent in parents_query:
-        if any(child.subclass in subclasses for child in parent.parent.children):
-            roles.add(parent)
-
-    for role in roles:
-        telegram_ids.add(role.account.telegram_id)
-
-    return telegram_ids, roles
-
 
 async def process_announcement(
     session, request, save=False
-) -> Tuple[Set[database.Teacher], Set[database.Subclass]]:
-    school = db_validated.get_school_by_id(session, request.school_id)
+) -> Tuple[
+    Set[database.Teacher], Set[database.Subclass], Optional[database.Announcement_job]
+]:
+    school = await db_validated.get_school_by_id(session, request.school_id)
 
     teachers = set()
     subclasses = set()
 
-    telegram_ids = set()
-    roles = set()
-
     for _filter in request.filters:
         if isinstance(_filter, incoming.announcement.Teacher):
             teachers.add(
-                db_validated.get_teacher_by_name(
+                await db_validated.get_teacher_by_name(
                     session, _filter.name, request.school_id
                 )
             )
         elif isinstance(_filter, incoming.announcement.Subclass):
             filtered = False
-            sc_query = session.query(database.Subclass).filter_by(school_id=school.id)
+            sc_query = select(database.Subclass).filter_by(school_id=school.id)
 
             if _filter.educational_level is not None:
                 filtered = True
@@ -116,74 +115,77 @@ async def process_announcement(
                 sc_query = sc_query.filter_by(identificator=_filter.identificator)
 
             if filtered:
-                for subclass in sc_query.all():
+                for subclass in await session.scalars(sc_query):
                     subclasses.add(subclass)
-    if teachers:
-        teacher_telegram_ids, teacher_roles = get_teachers(session, teachers)
-    else:
-        teacher_telegram_ids, teacher_roles = set(), set()
-
-    if not request.send_only_to_parents:
-        students_telegram_ids, students_roles = get_students(session, subclasses)
-    else:
-        students_telegram_ids, students_roles = set(), set()
-
-    if request.resend_to_parents:
-        parent_telegram_ids, parent_roles = get_parents(session, subclasses)
-    else:
-        parent_telegram_ids, parent_roles = set(), set()
-
-    roles = teacher_roles | students_roles | parent_roles
-    telegram_ids = teacher_telegram_ids | students_telegram_ids | parent_telegram_ids
 
+    job = None
     if save:
-        link = await publish_to_telegraph(request.title, request.text)
+        audience = audience_query(
+            [t.id for t in teachers],
+            [s.id for s in subclasses],
+            students=not request.send_only_to_parents,
+            parents=request.resend_to_parents,
+        )
+        link = await publish_to_telegraph(request.title, request.text, session)
         logger.info(link)
-        announcement = database.Announcement(title=request.title, link=link)
-        for role in roles:
-            announcement.roles.append(role)
+        announcement = database.Announcement(
+            title=request.title,
+            link=link,
+            content_hash=content_hash(request.title, request.text),
+        )
 
         session.add(announcement)
-        session.commit()
-
-        await send_to_transmitter(link, telegram_ids, silent=request.silent)
-
-    return teachers, subclasses
+        await session.flush()
+        total = 0
+        if audience is not None:
+            total = await link_roles(session, announcement.id, audience)
+        job = new_job(link, request.silent, total, announcement_id=announcement.id)
+        session.add(job)
+        await session.commit()
+
+    return teachers, subclasses, job
+
+
+def new_job(text: str, silent: bool, total: int, **kwargs) -> database.Announcement_job:
+    """Delivery to queue with ANNOUNCEMENT_DISPATCHER after the commit"""
+    return database.Announcement_job(
+        text=text,
+        silent=silent,
+        total=total,
+        sent=0,
+        failed=0,
+        cursor=0,
+        status=database.JobStatusEnum.QUEUED,
+        created=datetime.utcnow(),
+        updated=datetime.utcnow(),
+        **kwargs,
+    )
 
 
 async def send_to_transmitter(
     text: str, telegram_ids: Union[List[Column], Set[Column]], silent: bool = False
 ):
-    async with aiohttp.ClientSession() as http_session:
-        async with http_session.post(
-            f"http://{TRANSMITTER_HOST}:{TRANSMITTER_PORT}/api/trans/redirect/telegram",
-            json={"text": text, "telegram_ids": list(telegram_ids), "silent": silent},
-        ) as response:
-            if response.status != 200:
-                logger.error(
-                    f"Can not post announcement to {TRANSMITTER_HOST}:{TRANSMITTER_PORT}. More: {await response.text()}"
-                )
-                raise HTTPException(
-                    status_code=500, detail="Can not post your announcement"
-                )
-
-
-async def publish_to_telegraph(title: str, text: str) -> str:
-    client = Telegraph()
-    await client.create_account(
-        short_name="skedule_bot",
-        author_name="Skedule Publisher",
-        author_url="https://t.me/skedule_bot",
-        replace_token=True,
-    )
-    try:
-        page = await client.create_page(
-            title,
-            html_content=text,
-            author_name="Skedule Publisher",
-            author_url="https://t.me/skedule_bot",
+    await TRANSMITTER.post(text, telegram_ids, silent)
+
+
+async def publish_to_telegraph(
+    title: str, text: str, session: Optional[AsyncSession] = None
+) -> str:
+    """URL of a Telegraph page with the title and the text, a page of the same
+    content is reused from TELEGRAPH_PAGES or, given a session, from the
+    announcements published by any worker"""
+    key = content_hash(title, text)
+    link = TELEGRAPH_PAGES.get(key)
+    if link is None and session is not None:
+        link = await session.scalar(
+            select(database.Announcement.link).filter_by(content_hash=key).limit(1)
         )
+        if link is not None:
+            TELEGRAPH_PAGES.put(key, link)
+    if link is not None:
+        logger.debug(f"Reusing Telegraph page {link}")
+        return link
+    try:
+        return await TELEGRAPH_PAGES.publish(title, text, key)
     except InvalidHTML as e:
         raise HTTPException(status_code=404, detail=f"Invalid HTML: {e}")
-
-    return page["url"]
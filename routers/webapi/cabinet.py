@@ -11,6 +11,8 @@ from extra.tags import CABINET, WEBSITE, get_tags
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
 
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
@@ -27,15 +29,15 @@ logger.info(f"Cabinet router created on {API_PREFIX+API_CABINET_PREFIX}")
 async def create_new_cabinet(
     request: incoming.Cabinet, session=Depends(get_session)
 ) -> outgoing.Cabinet:
-    corpus = db_validated.get_corpus_by_id(session, request.corpus_id)
-    school = db_validated.get_school_by_id(session, corpus.school_id)
+    corpus = await db_validated.get_corpus_by_id(session, request.corpus_id)
+    school = await db_validated.get_school_by_id(session, corpus.school_id)
     logger.debug(
         f"Searching cabinet with name {request.name} and corpus_id {request.corpus_id}"
     )
-    candidate = (
-        session.query(database.Cabinet)
+    candidate = await session.scalar(
+        select(database.Cabinet)
         .filter_by(name=request.name, corpus_id=request.corpus_id)
-        .first()
+        .limit(1)
     )
     if candidate:
         logger.debug(
@@ -48,26 +50,24 @@ async def create_new_cabinet(
     cabinet = database.Cabinet(
         floor=request.floor,
         name=request.name,
-        tags=get_tags(session, request.tags),
+        tags=await get_tags(session, request.tags),
         corpus_id=corpus.id,
         school_id=school.id,
     )
     logger.info(
         f"Adding cabinet with name {cabinet.name} on floor {cabinet.floor} to corpus with id {corpus.id}"
     )
-    corpus.cabinets.append(cabinet)
-    school.cabinets.append(cabinet)
     session.add(cabinet)
-    session.add(corpus)
-    session.add(school)
-    session.commit()
+    await session.commit()
     logger.debug(f"Cabinet with name {cabinet.name} acquired id {cabinet.id}")
     return outgoing.Cabinet.from_orm(cabinet)
 
 
 @router.put("/update", tags=[CABINET], response_model=outgoing.Cabinet)
 async def update_cabinet(request: updating.Cabinet, session=Depends(get_session)):
-    cabinet = db_validated.get_cabinet_by_id(session, request.cabinet_id)
+    cabinet = await db_validated.get_cabinet_by_id(
+        session, request.cabinet_id, selectinload(database.Cabinet.tags)
+    )
 
     if request.floor is not None:
         cabinet.floor = request.floor
@@ -76,10 +76,10 @@ async def update_cabinet(request: updating.Cabinet, session=Depends(get_session)
         logger.debug(
             f"Searching cabinet with name {request.name} and corpus_id {cabinet.corpus_id}"
         )
-        candidate = (
-            session.query(database.Cabinet)
+        candidate = await session.scalar(
+            select(database.Cabinet)
             .filter_by(name=request.name, corpus_id=cabinet.corpus_id)
-            .first()
+            .limit(1)
         )
         if candidate is not None:
             logger.debug(
@@ -92,9 +92,9 @@ async def update_cabinet(request: updating.Cabinet, session=Depends(get_session)
         cabinet.name = request.name
 
     if request.tags:
-        cabinet.tags = get_tags(session, request.tags)
+        cabinet.tags = await get_tags(session, request.tags)
 
     session.add(cabinet)
-    session.commit()
+    await session.commit()
 
     return outgoing.Cabinet.from_orm(cabinet)
@@ -11,6 +11,7 @@ from extra.tags import CORPUS, WEBSITE
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
 
@@ -24,14 +25,14 @@ logger.info(f"Corpus router created on {API_PREFIX+API_CORPUS_PREFIX}")
 
 @router.post("/new", tags=[CORPUS], response_model=outgoing.Corpus)
 async def create_new_corpus(corpus: incoming.Corpus, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, corpus.school_id)
+    school = await db_validated.get_school_by_id(session, corpus.school_id)
     logger.debug(
         f"Searching corpus with name {corpus.name} and school_id {corpus.school_id}"
     )
-    candidate = (
-        session.query(database.Corpus)
+    candidate = await session.scalar(
+        select(database.Corpus)
         .filter_by(name=corpus.name, school_id=corpus.school_id)
-        .first()
+        .limit(1)
     )
     if candidate:
         logger.debug(
@@ -42,28 +43,29 @@ async def create_new_corpus(corpus: incoming.Corpus, session=Depends(get_session
             detail=f"Corpus with name {corpus.name} is already exists",
         )
     corpus = database.Corpus(
-        name=corpus.name, address=corpus.address, canteen_text=corpus.canteen_text
+        name=corpus.name,
+        address=corpus.address,
+        canteen_text=corpus.canteen_text,
+        school_id=school.id,
     )
     logger.info(
         f"Adding corpus with name {corpus.name} and address {corpus.address} to school with name {school.name}"
     )
-    school.corpuses.append(corpus)
     session.add(corpus)
-    session.add(school)
-    session.commit()
+    await session.commit()
     logger.debug(f"Corpus acquired id {corpus.id}")
     return outgoing.Corpus.from_orm(corpus)
 
 
 @router.put("/update", tags=[CORPUS], response_model=outgoing.Corpus)
 async def update_corpus(request: updating.Corpus, session=Depends(get_session)):
-    corpus = db_validated.get_corpus_by_id(session, request.corpus_id)
+    corpus = await db_validated.get_corpus_by_id(session, request.corpus_id)
 
     if request.address is not None:
-        candidate = (
-            session.query(database.Corpus)
+        candidate = await session.scalar(
+            select(database.Corpus)
             .filter_by(address=request.address, school_id=corpus.school_id)
-            .first()
+            .limit(1)
         )
         if candidate is not None:
             logger.debug(
@@ -76,10 +78,10 @@ async def update_corpus(request: updating.Corpus, session=Depends(get_session)):
         corpus.address = request.address
 
     if request.name is not None:
-        candidate = (
-            session.query(database.Corpus)
+        candidate = await session.scalar(
+            select(database.Corpus)
             .filter_by(name=request.name, school_id=corpus.school_id)
-            .first()
+            .limit(1)
         )
         if candidate is not None:
             logger.debug(
@@ -95,6 +97,6 @@ async def update_corpus(request: updating.Corpus, session=Depends(get_session)):
         corpus.canteen_text = request.canteen_text
 
     session.add(corpus)
-    session.commit()
+    await session.commit()
 
     return outgoing.Corpus.from_orm(corpus)
@@ -12,6 +12,8 @@ from extra.tags import LESSON, WEBSITE
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
+from sqlalchemy.orm import selectinload
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
 
@@ -25,19 +27,20 @@ logger.info(f"Lesson router created on {API_PREFIX+API_LESSON_PREFIX}")
 
 @router.post("/new", tags=[LESSON], response_model=outgoing.Lesson)
 async def create_new_lesson(lesson: incoming.Lesson, session=Depends(get_session)):
-    cabinet = db_validated.get_cabinet_by_id(session, lesson.cabinet_id)
-    corpus = db_validated.get_corpus_by_id(session, cabinet.corpus_id)
-    school = db_validated.get_school_by_id(session, corpus.school_id)
-    teacher = db_validated.get_teacher_by_id(session, lesson.teacher_id)
-    lesson_number = db_validated.get_lesson_number_by_id(
+    cabinet = await db_validated.get_cabinet_by_id(session, lesson.cabinet_id)
+    corpus = await db_validated.get_corpus_by_id(session, cabinet.corpus_id)
+    school = await db_validated.get_school_by_id(session, corpus.school_id)
+    teacher = await db_validated.get_teacher_by_id(session, lesson.teacher_id)
+    lesson_number = await db_validated.get_lesson_number_by_id(
         session, lesson.lesson_number_id
     )
     subclasses = [
-        db_validated.get_subclass_by_id(session, s_id) for s_id in lesson.subclasses
+        await db_validated.get_subclass_by_id(session, s_id)
+        for s_id in lesson.subclasses
     ]
 
-    candidate = (
-        session.query(database.Lesson)
+    candidate = await session.scalar(
+        select(database.Lesson)
         .filter_by(
             school_id=school.id,
             corpus_id=corpus.id,
@@ -46,7 +49,7 @@ async def create_new_lesson(lesson: incoming.Lesson, session=Depends(get_session
             day_of_week=lesson.day_of_week,
             teacher_id=teacher.id,
         )
-        .first()
+        .limit(1)
     )
 
     if candidate:
@@ -64,18 +67,17 @@ async def create_new_lesson(lesson: incoming.Lesson, session=Depends(get_session
         school_id=school.id,
         subclasses=subclasses,
     )
-    school.lessons.append(lesson)
-
     session.add(lesson)
-    session.add(school)
-    session.commit()
+    await session.commit()
     logger.debug(f"Lesson acquired id {lesson.id}")
     return outgoing.Lesson.from_orm(lesson)
 
 
 @router.put("/update", tags=[LESSON], response_model=outgoing.Lesson)
 async def update_lesson(request: updating.Lesson, session=Depends(get_session)):
-    lesson = db_validated.get_lesson_by_id(session, request.lesson_id)
+    lesson = await db_validated.get_lesson_by_id(
+        session, request.lesson_id, selectinload(database.Lesson.subclasses)
+    )
 
     if request.day_of_week is not None:
         lesson.day_of_week = request.day_of_week
@@ -84,7 +86,7 @@ async def update_lesson(request: updating.Lesson, session=Depends(get_session)):
         lesson.subject = request.subject
 
     if request.lesson_number_id is not None:
-        lesson_number = db_validated.get_lesson_number_by_id(
+        lesson_number = await db_validated.get_lesson_number_by_id(
             session, request.lesson_number_id
         )
         if lesson_number.school_id != lesson.school_id:
@@ -97,7 +99,7 @@ async def update_lesson(request: updating.Lesson, session=Depends(get_session)):
         lesson.lesson_number_id = lesson_number.id
 
     if request.teacher_id is not None:
-        teacher = db_validated.get_teacher_by_id(session, request.teacher_id)
+        teacher = await db_validated.get_teacher_by_id(session, request.teacher_id)
         if teacher.school_id != lesson.school_id:
             logger.debug(
                 f"Raised an exception because teacher is in another school (ID: {teacher.school_id}) from lesson (ID: {lesson.school_id})"
@@ -107,7 +109,7 @@ async def update_lesson(request: updating.Lesson, session=Depends(get_session)):
 
     if request.subclasses is not None:
         subclasses = [
-            db_validated.get_subclass_by_id(session, s_id)
+            await db_validated.get_subclass_by_id(session, s_id)
             for s_id in request.subclasses
         ]
         if any(subclass.school_id != lesson.school_id for subclass in subclasses):
@@ -118,7 +120,7 @@ async def update_lesson(request: updating.Lesson, session=Depends(get_session)):
         lesson.subclasses = subclasses
 
     if request.cabinet_id is not None:
-        cabinet = db_validated.get_cabinet_by_id(session, request.cabinet_id)
+        cabinet = await db_validated.get_cabinet_by_id(session, request.cabinet_id)
         if cabinet.school_id != lesson.school_id:
             logger.debug(
                 f"Raised an exception because cabinet is in another school (ID: {cabinet.school_id}) from lesson (ID: {lesson.school_id})"
@@ -127,15 +129,15 @@ async def update_lesson(request: updating.Lesson, session=Depends(get_session)):
         lesson.cabinet_id = cabinet.id
 
     session.add(lesson)
-    session.commit()
+    await session.commit()
 
     return outgoing.Lesson.from_orm(lesson)
 
 
 @router.delete("/delete", tags=[LESSON], response_model=outgoing.Lesson)
 async def delete_lesson(lesson_id: ID, session=Depends(get_session)):
-    lesson = db_validated.get_lesson_by_id(session, lesson_id)
+    lesson = await db_validated.get_lesson_by_id(session, lesson_id)
     logger.info(f"Deleting lesson with id {lesson_id}")
-    session.delete(lesson)
-    session.commit()
+    await session.delete(lesson)
+    await session.commit()
     return outgoing.Lesson.from_orm(lesson)
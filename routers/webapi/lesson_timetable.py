@@ -13,6 +13,7 @@ from extra.tags import LESSON_NUMBER, WEBSITE
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
 
@@ -28,7 +29,7 @@ logger.info(f"Lesson_number router created on {API_PREFIX+API_LESSON_NUMBER_PREF
 async def create_new_lesson_number(
     lesson_number: incoming.LessonNumber, session=Depends(get_session)
 ):
-    school = db_validated.get_school_by_id(session, lesson_number.school_id)
+    school = await db_validated.get_school_by_id(session, lesson_number.school_id)
 
     logger.debug(
         f"Checking if time_start ({lesson_number.time_start}) < time_end ({lesson_number.time_end})"
@@ -46,10 +47,10 @@ async def create_new_lesson_number(
     logger.debug(
         f"Searching lesson_number with number {lesson_number.number} and school_id {lesson_number.school_id}"
     )
-    candidate = (
-        session.query(database.Lesson_number)
+    candidate = await session.scalar(
+        select(database.Lesson_number)
         .filter_by(school_id=lesson_number.school_id, number=lesson_number.number)
-        .first()
+        .limit(1)
     )
     if candidate:
         logger.debug(
@@ -63,14 +64,13 @@ async def create_new_lesson_number(
         number=lesson_number.number,
         time_start=lesson_number.time_start,
         time_end=lesson_number.time_end,
+        school_id=school.id,
     )
     logger.info(
         f"Adding lesson_number {lesson_number.number} from {lesson_number.time_start} to {lesson_number.time_end} to school with id {lesson_number.school_id}"
     )
-    school.lesson_numbers.append(lesson_number)
-    session.add(school)
-    session.add(school)
-    session.commit()
+    session.add(lesson_number)
+    await session.commit()
     logger.debug(f"Lesson_number acquired id {lesson_number.id}")
     return outgoing.LessonNumber.from_orm(lesson_number)
 
@@ -79,7 +79,7 @@ async def create_new_lesson_number(
 async def update_timetable(
     request: updating.LessonNumber, session=Depends(get_session)
 ):
-    lesson_number = db_validated.get_lesson_number_by_id(
+    lesson_number = await db_validated.get_lesson_number_by_id(
         session, request.lesson_number_id
     )
     if request.time_start is not None and request.time_end is not None:
@@ -125,6 +125,6 @@ async def update_timetable(
         lesson_number.number = request.number
 
     session.add(lesson_number)
-    session.commit()
+    await session.commit()
 
     return outgoing.LessonNumber.from_orm(lesson_number)
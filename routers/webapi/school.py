@@ -6,11 +6,13 @@ from config import API_PREFIX, API_SCHOOL_PREFIX
 from config import DEFAULT_LOGGER as logger
 from config import Access, get_session
 from extra.api_router import LoggingRouter
+from extra.ngram_index import SCHOOL_NAMES
 from extra.service_auth import AllowLevels, get_current_service
 from extra.tags import SCHOOL, WEBSITE
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
 
@@ -25,7 +27,9 @@ logger.info(f"School router created on {API_PREFIX+API_SCHOOL_PREFIX}")
 @router.post("/new", tags=[SCHOOL], response_model=outgoing.School)
 async def create_new_school(school: incoming.School, session=Depends(get_session)):
     logger.debug(f'Searching school with name "{school.name}"')
-    candidate = session.query(database.School).filter_by(name=school.name).first()
+    candidate = await session.scalar(
+        select(database.School).filter_by(name=school.name).limit(1)
+    )
     if candidate:
         logger.debug(
             "Raised an exception because school with the same name is already exists"
@@ -37,18 +41,21 @@ async def create_new_school(school: incoming.School, session=Depends(get_session
     logger.debug(f'Adding school with name "{school.name}" to database')
     school = database.School(name=school.name)
     session.add(school)
-    session.commit()
+    await session.commit()
     logger.debug(f"School acquired id {school.id}")
+    SCHOOL_NAMES.put(None, school.id, school.name)
     return outgoing.School.from_orm(school)
 
 
 @router.put("/update", tags=[SCHOOL, WEBSITE], response_model=outgoing.School)
 async def update_school(request: updating.School, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, request.school_id)
+    school = await db_validated.get_school_by_id(session, request.school_id)
 
     if request.name is not None:
         logger.debug(f'Searching school with name "{request.name}"')
-        candidate = session.query(database.School).filter_by(name=request.name).first()
+        candidate = await session.scalar(
+            select(database.School).filter_by(name=request.name).limit(1)
+        )
         if candidate:
             logger.debug(
                 "Raised an exception because school with the same name is already exists"
@@ -60,6 +67,8 @@ async def update_school(request: updating.School, session=Depends(get_session)):
         school.name = request.name
 
     session.add(school)
-    session.commit()
+    await session.commit()
+    if request.name is not None:
+        SCHOOL_NAMES.put(None, school.id, school.name)
 
     return outgoing.School.from_orm(school)
@@ -1,17 +1,26 @@
-from collections import defaultdict
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
 import valid_db_requests as db_validated
-from api_types import ID
 from config import API_PREFIX, API_STATISTICS_PREFIX
 from config import DEFAULT_LOGGER as logger
-from config import get_session
+from config import (
+    MAX_STATISTICS_HISTORY_DAYS,
+    STATISTICS_HISTORY_DAYS,
+    BaseModel,
+    get_session,
+)
+from extra import stats_rollup
 from extra.api_router import LoggingRouter
 from extra.auth_api import get_harvest_user
+from extra.stats_rollup import role_schools
 from extra.tags import STATS
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
-from models.web import incoming, outgoing, updating
-from config import BaseModel
+from models.web import outgoing
+from sqlalchemy import distinct, func
+from sqlalchemy.future import select
+from sqlalchemy.sql import Select
 
 router = APIRouter(
     prefix=API_PREFIX + API_STATISTICS_PREFIX,
@@ -20,131 +29,411 @@ router = APIRouter(
 )
 logger.info(f"Statistics router created on {API_PREFIX + API_STATISTICS_PREFIX}")
 
+# Everything is counted by the database, with by_school=true the counts are
+# also broken down by the school of the counted rows. A parent belongs to the
+# schools of their children, so parents and accounts can count in several.
+
+Role = database.Role
+Student = database.Student
+Subclass = database.Subclass
+association = database.lesson_subclass_association
+
 
 class Count(BaseModel):
     count: int
+    schools: Optional[Dict[int, int]] = None
+
+
+async def count(
+    session,
+    counted,
+    school,
+    by_school: bool,
+    rows: Callable[[Select], Select],
+) -> Count:
+    """Count of `counted` in `rows`, per `school` as well if `by_school`"""
+    result = Count(count=await session.scalar(rows(select(counted))))
+    if by_school:
+        schools = await session.execute(rows(select(school, counted)).group_by(school))
+        # rows without a school, roles missing their teacher row for example
+        result.schools = {id: amount for id, amount in schools if id is not None}
+    return result
+
+
+async def statistics(
+    session,
+    key,
+    counted,
+    school,
+    by_school: bool,
+    rows: Callable[[Select], Select],
+) -> outgoing.Statistics:
+    """`counted` in `rows` grouped by `key`, per `school` as well if `by_school`"""
+    data = await session.execute(rows(select(key, counted)).group_by(key))
+    result = outgoing.Statistics(data=dict(data.all()))
+    if by_school:
+        result.schools = {}
+        schools = await session.execute(
+            rows(select(school, key, counted)).group_by(school, key)
+        )
+        for school_id, value, amount in schools:
+            if school_id is not None:
+                result.schools.setdefault(school_id, {})[value] = amount
+    return result
 
 
-@router.get("/users", tags=[STATS], response_model=Count)
-async def get_user_count(session=Depends(get_session)) -> Count:
-    users = session.query(database.Account).all()
-    return Count(count=len(users))
+def roles(role_type: database.RoleEnum) -> Callable[[Select], Select]:
+    return lambda query: query.select_from(Role).filter(Role.role_type == role_type)
 
 
-@router.get("/teachers", tags=[STATS], response_model=Count)
-async def get_teachers_count(session=Depends(get_session)) -> Count:
-    teachers = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.TEACHER)
-        .all()
+@router.get(
+    "/users", tags=[STATS], response_model=Count, response_model_exclude_none=True
+)
+async def get_user_count(
+    by_school: bool = False, session=Depends(get_session)
+) -> Count:
+    result = Count(
+        count=await session.scalar(select(func.count()).select_from(database.Account))
     )
-    return Count(count=len(teachers))
+    if by_school:
+        schools = role_schools()
+        rows = await session.execute(
+            select(schools.c.school_id, func.count(distinct(Role.account_id)))
+            .join(schools, schools.c.role_id == Role.id)
+            .group_by(schools.c.school_id)
+        )
+        result.schools = dict(rows.all())
+    return result
 
 
-@router.get("/parents", tags=[STATS], response_model=Count)
-async def get_parents_count(session=Depends(get_session)) -> Count:
-    parents = (
-        session.query(database.Role).filter_by(role_type=database.RoleEnum.PARENT).all()
+@router.get(
+    "/teachers", tags=[STATS], response_model=Count, response_model_exclude_none=True
+)
+async def get_teachers_count(
+    by_school: bool = False, session=Depends(get_session)
+) -> Count:
+    return await count(
+        session,
+        func.count(),
+        database.Teacher.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.TEACHER)(query).join(
+            database.Teacher, Role.teacher_id == database.Teacher.id, isouter=True
+        ),
     )
-    return Count(count=len(parents))
 
 
-@router.get("/students", tags=[STATS], response_model=Count)
-async def get_students_count(session=Depends(get_session)) -> Count:
-    students = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.STUDENT)
-        .filter(database.Role.account_id is not None)
-        .all()
+@router.get(
+    "/parents", tags=[STATS], response_model=Count, response_model_exclude_none=True
+)
+async def get_parents_count(
+    by_school: bool = False, session=Depends(get_session)
+) -> Count:
+    result = await count(
+        session, func.count(), None, False, roles(database.RoleEnum.PARENT)
+    )
+    if by_school:
+        result.schools = (
+            await count(
+                session,
+                func.count(distinct(Role.id)),
+                Student.school_id,
+                True,
+                lambda query: roles(database.RoleEnum.PARENT)(query).join(
+                    Student, Role.parent_id == Student.parent_id
+                ),
+            )
+        ).schools
+    return result
+
+
+@router.get(
+    "/students", tags=[STATS], response_model=Count, response_model_exclude_none=True
+)
+async def get_students_count(
+    by_school: bool = False, session=Depends(get_session)
+) -> Count:
+    return await count(
+        session,
+        func.count(),
+        Student.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.STUDENT)(query)
+        .filter(Role.account_id.isnot(None))
+        .join(Student, Role.student_id == Student.id, isouter=True),
     )
-    return Count(count=len(students))
 
 
-@router.get("/administrations", tags=[STATS], response_model=Count)
-async def get_administrations_count(session=Depends(get_session)) -> Count:
-    administrations = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.ADMINISTRATION)
-        .all()
+@router.get(
+    "/administrations",
+    tags=[STATS],
+    response_model=Count,
+    response_model_exclude_none=True,
+)
+async def get_administrations_count(
+    by_school: bool = False, session=Depends(get_session)
+) -> Count:
+    return await count(
+        session,
+        func.count(),
+        database.Administration.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.ADMINISTRATION)(query).join(
+            database.Administration,
+            Role.administration_id == database.Administration.id,
+            isouter=True,
+        ),
     )
-    return Count(count=len(administrations))
 
 
-@router.get("/parallel", tags=[STATS], response_model=outgoing.Statistics)
-async def get_parallel_count(session=Depends(get_session)):
-    students = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.STUDENT)
-        .all()
+@router.get(
+    "/parallel",
+    tags=[STATS],
+    response_model=outgoing.Statistics,
+    response_model_exclude_none=True,
+)
+async def get_parallel_count(by_school: bool = False, session=Depends(get_session)):
+    return await statistics(
+        session,
+        Subclass.educational_level,
+        func.count(),
+        Student.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.STUDENT)(query)
+        .join(Student, Role.student_id == Student.id)
+        .join(Subclass, Student.subclass_id == Subclass.id),
     )
-    data = defaultdict(lambda: 0)
-    for student in students:
-        data[student.student.subclass.educational_level] += 1
 
-    return outgoing.Statistics(data=dict(data))
 
-
-@router.get("/childrencount", tags=[STATS], response_model=outgoing.Statistics)
-async def get_children_count(session=Depends(get_session)):
-    parents = (
-        session.query(database.Role).filter_by(role_type=database.RoleEnum.PARENT).all()
+@router.get(
+    "/childrencount",
+    tags=[STATS],
+    response_model=outgoing.Statistics,
+    response_model_exclude_none=True,
+)
+async def get_children_count(by_school: bool = False, session=Depends(get_session)):
+    children = (
+        select(Role.id, func.count(Student.id).label("children"))
+        .filter(Role.role_type == database.RoleEnum.PARENT)
+        .join(Student, Role.parent_id == Student.parent_id, isouter=True)
+        .group_by(Role.id)
+        .subquery()
+    )
+    result = await statistics(
+        session,
+        children.c.children,
+        func.count(),
+        None,
+        False,
+        lambda query: query.select_from(children),
+    )
+    if by_school:
+        # children of a parent in every school of them
+        children = (
+            select(
+                Role.id,
+                Student.school_id.label("school_id"),
+                func.count(Student.id).label("children"),
+            )
+            .filter(Role.role_type == database.RoleEnum.PARENT)
+            .join(Student, Role.parent_id == Student.parent_id)
+            .group_by(Role.id, Student.school_id)
+            .subquery()
+        )
+        result.schools = (
+            await statistics(
+                session,
+                children.c.children,
+                func.count(),
+                children.c.school_id,
+                True,
+                lambda query: query.select_from(children),
+            )
+        ).schools
+    return result
+
+
+@router.get(
+    "/teacherparallel",
+    tags=[STATS],
+    response_model=outgoing.Statistics,
+    response_model_exclude_none=True,
+)
+async def get_teacher_parallel(by_school: bool = False, session=Depends(get_session)):
+    # teachers once per parallel they have lessons in
+    return await statistics(
+        session,
+        Subclass.educational_level,
+        func.count(distinct(Role.id)),
+        database.Lesson.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.TEACHER)(query)
+        .join(database.Lesson, Role.teacher_id == database.Lesson.teacher_id)
+        .join(association, association.c.lesson_id == database.Lesson.id)
+        .join(Subclass, association.c.subclass_id == Subclass.id),
     )
-    data = defaultdict(lambda: 0)
-    for parent in parents:
-        data[len(parent.parent.children)] += 1
-
-    return outgoing.Statistics(data=dict(data))
 
 
-@router.get("/teacherparallel", tags=[STATS], response_model=outgoing.Statistics)
-async def get_teacher_parallel(session=Depends(get_session)):
-    teachers = (
-        session.query(database.Role)
-        .filter_by(role_type=database.RoleEnum.TEACHER)
-        .all()
+@router.get(
+    "/parentchildren",
+    tags=[STATS],
+    response_model=outgoing.Statistics,
+    response_model_exclude_none=True,
+)
+async def get_children_for_parents(
+    by_school: bool = False, session=Depends(get_session)
+):
+    return await statistics(
+        session,
+        Subclass.educational_level,
+        func.count(),
+        Student.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.PARENT)(query)
+        .join(Student, Role.parent_id == Student.parent_id)
+        .join(Subclass, Student.subclass_id == Subclass.id),
     )
 
-    data = defaultdict(lambda: 0)
 
-    for teacher in teachers:
-        lessons = (
-            session.query(database.Lesson)
-            .filter_by(teacher_id=teacher.teacher.id)
-            .all()
-        )
-
-        subclasses = set()
+@router.get(
+    "/parentswithchildren",
+    tags=[STATS],
+    response_model=Count,
+    response_model_exclude_none=True,
+)
+async def get_parent_with_children(
+    by_school: bool = False, session=Depends(get_session)
+):
+    return await count(
+        session,
+        func.count(distinct(Role.id)),
+        Student.school_id,
+        by_school,
+        lambda query: roles(database.RoleEnum.PARENT)(query).join(
+            Student, Role.parent_id == Student.parent_id
+        ),
+    )
 
-        for lesson in lessons:
-            for subclass in lesson.subclasses:
-                subclasses.add(subclass.educational_level)
 
-        for subclass in subclasses:
-            data[subclass] += 1
+Snapshot = Dict[str, Dict[int, int]]
+rollup = database.Stats_rollup.__table__
 
-    return outgoing.Statistics(data=dict(data))
 
+async def history(
+    session,
+    school_id: int,
+    metrics: Iterable[str],
+    start: Optional[date],
+    end: Optional[date],
+) -> List[Tuple[date, Snapshot]]:
+    """Counters of `metrics` of the school for every day from `start` to `end`
 
-@router.get("/parentchildren", tags=[STATS], response_model=outgoing.Statistics)
-async def get_children_for_parents(session=Depends(get_session)):
-    parents = (
-        session.query(database.Role).filter_by(role_type=database.RoleEnum.PARENT).all()
+    A day without a refresh has the counters of the last refreshed day before
+    it, days before the first refresh are left out.
+    """
+    end = end or stats_rollup.today()
+    start = start or end - timedelta(days=STATISTICS_HISTORY_DAYS - 1)
+    if start > end or (end - start).days >= MAX_STATISTICS_HISTORY_DAYS:
+        logger.debug(
+            f"Raised an exception because the history from {start} to {end} is not allowed"
+        )
+        raise HTTPException(
+            status_code=422,
+            detail=f"History must span from 1 to {MAX_STATISTICS_HISTORY_DAYS} days",
+        )
+    await db_validated.get_school_by_id(session, school_id)
+    counted = rollup.c.school_id == school_id, rollup.c.metric == stats_rollup.USERS
+    if await session.scalar(select(rollup.c.id).filter(*counted).limit(1)) is None:
+        # nothing changed in the school since the table was created, today is
+        # counted on the fly and not stored
+        logger.debug(f"Counting statistics of school with id {school_id}")
+        today = stats_rollup.today()
+        if not start <= today <= end:
+            return []
+        snapshot: Snapshot = {}
+        for metric, query in stats_rollup.counters([school_id]):
+            if metric in (stats_rollup.USERS, *metrics):
+                for _, key, value in await session.execute(query):
+                    snapshot.setdefault(metric, {})[key] = value
+        return [(today, snapshot)]
+    first = await session.scalar(
+        select(func.max(rollup.c.day)).filter(*counted, rollup.c.day <= start)
+    )
+    rows = await session.execute(
+        select(rollup.c.day, rollup.c.metric, rollup.c.key, rollup.c.value).filter(
+            rollup.c.school_id == school_id,
+            rollup.c.metric.in_([stats_rollup.USERS, *metrics]),
+            rollup.c.day.between(first or start, end),
+        )
+    )
+    snapshots: Dict[date, Snapshot] = {}
+    for day, metric, key, value in rows:
+        snapshots.setdefault(day, {}).setdefault(metric, {})[key] = value
+    points: List[Tuple[date, Snapshot]] = []
+    current: Optional[Snapshot] = snapshots.get(first) if first else None
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        current = snapshots.get(day, current)
+        if current is not None:
+            points.append((day, current))
+    return points
+
+
+@router.get("/history/counts", tags=[STATS], response_model=outgoing.CountsHistory)
+async def get_counts_history(
+    school_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session=Depends(get_session),
+):
+    metrics = [stats_rollup.USERS, *stats_rollup.COUNTS]
+    return outgoing.CountsHistory(
+        school_id=school_id,
+        points=[
+            outgoing.CountsPoint(
+                day=day,
+                **{metric: counters.get(metric, {}).get(0, 0) for metric in metrics},
+            )
+            for day, counters in await history(session, school_id, metrics, start, end)
+        ],
     )
 
-    data = defaultdict(lambda: 0)
-
-    for parent in parents:
-        for child in parent.parent.children:
-            data[child.subclass.educational_level] += 1
 
-    return outgoing.Statistics(data=dict(data))
+async def statistics_history(
+    session, school_id: int, metric: str, start: Optional[date], end: Optional[date]
+) -> outgoing.StatisticsHistory:
+    return outgoing.StatisticsHistory(
+        school_id=school_id,
+        points=[
+            outgoing.StatisticsPoint(day=day, data=counters.get(metric, {}))
+            for day, counters in await history(session, school_id, [metric], start, end)
+        ],
+    )
 
 
-@router.get("/parentswithchildren", tags=[STATS], response_model=Count)
-async def get_parent_with_children(session=Depends(get_session)):
-    parents = (
-        session.query(database.Role).filter_by(role_type=database.RoleEnum.PARENT).all()
+@router.get(
+    "/history/parallel", tags=[STATS], response_model=outgoing.StatisticsHistory
+)
+async def get_parallel_history(
+    school_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session=Depends(get_session),
+):
+    return await statistics_history(
+        session, school_id, stats_rollup.PARALLEL, start, end
     )
-    parents = list(filter(lambda x: len(x.parent.children) >= 1, parents))
 
-    return Count(count=len(parents))
+
+@router.get(
+    "/history/childrencount", tags=[STATS], response_model=outgoing.StatisticsHistory
+)
+async def get_children_count_history(
+    school_id: int,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    session=Depends(get_session),
+):
+    return await statistics_history(
+        session, school_id, stats_rollup.CHILDREN, start, end
+    )
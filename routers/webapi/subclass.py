@@ -11,6 +11,7 @@ from extra.tags import SUBCLASS, WEBSITE
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
 
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
@@ -25,19 +26,19 @@ logger.info(f"Subclass fouter created on {API_PREFIX + API_SUBCLASS_PREFIX}")
 
 @router.post("/new", tags=[SUBCLASS], response_model=outgoing.Subclass)
 async def create_subclass(subclass: incoming.Subclass, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, subclass.school_id)
+    school = await db_validated.get_school_by_id(session, subclass.school_id)
     logger.info(
         f"Adding subclass '{subclass.educational_level}{subclass.identificator}{subclass.additional_identificator}' to school '{school.name}' "
     )
-    candidate = (
-        session.query(database.Subclass)
+    candidate = await session.scalar(
+        select(database.Subclass)
         .filter_by(
             educational_level=subclass.educational_level,
             identificator=subclass.identificator,
             additional_identificator=subclass.additional_identificator,
             school_id=subclass.school_id,
         )
-        .first()
+        .limit(1)
     )
     if candidate:
         logger.debug(
@@ -51,29 +52,28 @@ async def create_subclass(subclass: incoming.Subclass, session=Depends(get_sessi
         educational_level=subclass.educational_level,
         identificator=subclass.identificator,
         additional_identificator=subclass.additional_identificator,
+        school_id=school.id,
     )
-    school.subclasses.append(subclass)
     session.add(subclass)
-    session.add(school)
-    session.commit()
+    await session.commit()
     logger.debug(f"Subclass acquired id {subclass.id}")
     return outgoing.Subclass.from_orm(subclass)
 
 
 @router.put("/update", tags=[SUBCLASS], response_model=outgoing.Subclass)
 async def update_subclass(request: updating.Subclass, session=Depends(get_session)):
-    subclass = db_validated.get_subclass_by_id(session, request.subclass_id)
+    subclass = await db_validated.get_subclass_by_id(session, request.subclass_id)
 
     if request.educational_level is not None:
-        candidate = (
-            session.query(database.Subclass)
+        candidate = await session.scalar(
+            select(database.Subclass)
             .filter_by(
                 educational_level=request.educational_level,
                 identificator=subclass.identificator,
                 additional_identificator=subclass.additional_identificator,
                 school_id=subclass.school_id,
             )
-            .first()
+            .limit(1)
         )
         if candidate is not None:
             logger.debug(
@@ -86,15 +86,15 @@ async def update_subclass(request: updating.Subclass, session=Depends(get_sessio
         subclass.educational_level = request.educational_level
 
     if request.identificator is not None:
-        candidate = (
-            session.query(database.Subclass)
+        candidate = await session.scalar(
+            select(database.Subclass)
             .filter_by(
                 educational_level=subclass.educational_level,
                 identificator=request.identificator,
                 additional_identificator=subclass.additional_identificator,
                 school_id=subclass.school_id,
             )
-            .first()
+            .limit(1)
         )
         if candidate:
             logger.debug(
@@ -107,17 +107,17 @@ async def update_subclass(request: updating.Subclass, session=Depends(get_sessio
         subclass.identificator = request.identificator
 
     if request.additional_identificator is not None:
-        candidate = (
-            session.query(database.Subclass)
+        candidate = await session.scalar(
+            select(database.Subclass)
             .filter_by(
                 educational_level=subclass.educational_level,
                 identificator=subclass.identificator,
                 additional_identificator=request.additional_identificator,
                 school_id=subclass.school_id,
             )
-            .all()
+            .limit(1)
         )
-        if candidate != []:
+        if candidate is not None:
             logger.debug(
                 f"Raised an exception because subclass with identificators {subclass.educational_level} {subclass.identificator} {request.additional_identificator} is already exists"
             )
@@ -128,6 +128,6 @@ async def update_subclass(request: updating.Subclass, session=Depends(get_sessio
         subclass.additional_identificator = request.additional_identificator
 
     session.add(subclass)
-    session.commit()
+    await session.commit()
 
     return outgoing.Subclass.from_orm(subclass)
@@ -6,11 +6,13 @@ from config import API_PREFIX, API_TEACHER_PREFIX
 from config import DEFAULT_LOGGER as logger
 from config import Access, get_session
 from extra.api_router import LoggingRouter
+from extra.ngram_index import TEACHER_NAMES
 from extra.service_auth import AllowLevels, get_current_service
 from extra.tags import TEACHER, WEBSITE, get_tags
 from fastapi import APIRouter, Depends, HTTPException
 from models import database
 from models.web import incoming, outgoing, updating
+from sqlalchemy.future import select
 
 allowed = AllowLevels(Access.Admin, Access.Parser)
 
@@ -24,14 +26,14 @@ logger.info(f"Teacher router created on {API_PREFIX+API_TEACHER_PREFIX}")
 
 @router.post("/new", tags=[TEACHER], response_model=outgoing.Teacher)
 async def create_new_teacher(request: incoming.Teacher, session=Depends(get_session)):
-    school = db_validated.get_school_by_id(session, request.school_id)
+    school = await db_validated.get_school_by_id(session, request.school_id)
     logger.debug(
         f"Searching teacher with name {request.name} in school with id {request.school_id}"
     )
-    candidate = (
-        session.query(database.Teacher)
+    candidate = await session.scalar(
+        select(database.Teacher)
         .filter_by(name=request.name, school_id=request.school_id)
-        .first()
+        .limit(1)
     )
     if candidate:
         logger.debug(
@@ -41,30 +43,31 @@ async def create_new_teacher(request: incoming.Teacher, session=Depends(get_sess
             status_code=409,
             detail=f"Teacher with name {request.name} is already exists",
         )
-    tags = get_tags(session, request.tags)
+    tags = await get_tags(session, request.tags)
 
     teacher = database.Teacher(name=request.name, tags=tags, school_id=school.id)
 
     logger.info(
         f"Adding teacher with name {teacher.name} to school with id {school.id}"
     )
-    school.teachers.append(teacher)
     session.add(teacher)
-    session.add(school)
-    session.commit()
+    await session.commit()
     logger.debug(f"Teacher with name {teacher.name} acquired id {teacher.id}")
+    TEACHER_NAMES.put(school.id, teacher.id, teacher.name)
     return outgoing.Teacher.from_orm(teacher)
 
 
 @router.put("/update", tags=[TEACHER], response_model=outgoing.Teacher)
 async def update_teacher(request: updating.Teacher, session=Depends(get_session)):
-    teacher = db_validated.get_teacher_by_id(session, request.teacher_id)
+    teacher = await db_validated.get_teacher_by_id(
+        session, request.teacher_id, *db_validated.TEACHER_OPTIONS
+    )
 
     if request.name is not None:
-        candidate = (
-            session.query(database.Teacher)
+        candidate = await session.scalar(
+            select(database.Teacher)
             .filter_by(name=request.name, school_id=teacher.school_id)
-            .first()
+            .limit(1)
         )
         if candidate:
             logger.debug(
@@ -76,9 +79,11 @@ async def update_teacher(request: updating.Teacher, session=Depends(get_session)
             )
         teacher.name = request.name
     if request.tags:
-        teacher.tags = get_tags(session, request.tags)
+        teacher.tags = await get_tags(session, request.tags)
 
     session.add(teacher)
-    session.commit()
+    await session.commit()
+    if request.name is not None:
+        TEACHER_NAMES.put(teacher.school_id, teacher.id, teacher.name)
 
     return outgoing.Teacher.from_orm(teacher)
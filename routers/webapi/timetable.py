@@ -0,0 +1,775 @@
+# pyright: reportUnknownMemberType=false, reportUnknownVariableType=false, reportUnknownArgumentType=false, reportUnknownLambdaType=false, reportGeneralTypeIssues=false
+
+import csv
+import re
+from io import StringIO
+from typing import Any, Dict, FrozenSet, Iterable, List, Set, Tuple
+
+import valid_db_requests as db_validated
+from api_types import ID
+from config import API_PREFIX, API_TIMETABLE_PREFIX
+from config import DEFAULT_LOGGER as logger
+from config import Access, get_session
+from extra.api_router import LoggingRouter
+from extra.ngram_index import TEACHER_NAMES
+from extra.service_auth import AllowLevels
+from extra.response_cache import RESPONSE_CACHE
+from extra.school_versions import SCHOOL_VERSIONS, Change
+from extra.tags import TIMETABLE, WEBSITE
+from extra.timetable_snapshot import TIMETABLE_SNAPSHOTS
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from models import database
+from models.web import incoming, outgoing
+from pydantic import ValidationError
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+allowed = AllowLevels(Access.Admin, Access.Parser)
+
+router = APIRouter(
+    prefix=API_PREFIX + API_TIMETABLE_PREFIX,
+    dependencies=[Depends(allowed)],
+    route_class=LoggingRouter,
+)
+logger.info(f"Timetable router created on {API_PREFIX+API_TIMETABLE_PREFIX}")
+
+CSV_COLUMNS = (
+    "day_of_week",
+    "lesson_number",
+    "time_start",
+    "time_end",
+    "subject",
+    "teacher",
+    "teacher_tags",
+    "cabinet",
+    "floor",
+    "corpus",
+    "subclasses",
+)
+# 10A, 10A/1 -> educational level, identificator, additional identificator
+CSV_SUBCLASS = re.compile(r"^(\d{1,2})([^/]+)(?:/(.+))?$")
+MAX_REPORTED_ERRORS = 20
+
+SubclassKey = Tuple[int, str, str]
+CabinetKey = Tuple[int, str]
+LessonKey = Tuple[int, int, int, int, int]
+# day of week, lesson number, teacher, corpus, cabinet
+NamedLessonKey = Tuple[int, int, str, str, str]
+# subject and subclasses, whatever a sync may change in place
+LessonState = Tuple[str, FrozenSet[SubclassKey]]
+
+
+def subclass_key(subclass: Any) -> SubclassKey:
+    return (
+        subclass.educational_level,
+        subclass.identificator,
+        subclass.additional_identificator or "",
+    )
+
+
+def lesson_key(lesson: Any) -> LessonKey:
+    # the same columns create_new_lesson checks for duplicates
+    return (
+        lesson.corpus_id,
+        lesson.cabinet_id,
+        lesson.lesson_number_id,
+        lesson.day_of_week,
+        lesson.teacher_id,
+    )
+
+
+async def load_lesson_numbers(session: AsyncSession, school_id: int) -> Dict[int, int]:
+    rows = await session.execute(
+        select(database.Lesson_number.number, database.Lesson_number.id).filter_by(
+            school_id=school_id
+        )
+    )
+    return dict(rows.all())
+
+
+async def load_teachers(session: AsyncSession, school_id: int) -> Dict[str, int]:
+    rows = await session.execute(
+        select(database.Teacher.name, database.Teacher.id).filter_by(
+            school_id=school_id
+        )
+    )
+    return dict(rows.all())
+
+
+async def load_corpuses(session: AsyncSession, school_id: int) -> Dict[str, int]:
+    rows = await session.execute(
+        select(database.Corpus.name, database.Corpus.id).filter_by(school_id=school_id)
+    )
+    return dict(rows.all())
+
+
+async def load_cabinets(
+    session: AsyncSession, corpus_ids: List[int]
+) -> Dict[CabinetKey, int]:
+    rows = await session.execute(
+        select(
+            database.Cabinet.corpus_id, database.Cabinet.name, database.Cabinet.id
+        ).filter(database.Cabinet.corpus_id.in_(corpus_ids))
+    )
+    return {(corpus_id, name): id for corpus_id, name, id in rows.all()}
+
+
+async def load_subclasses(
+    session: AsyncSession, school_id: int
+) -> Dict[SubclassKey, int]:
+    rows = await session.execute(
+        select(database.Subclass).filter_by(school_id=school_id)
+    )
+    return {subclass_key(subclass): subclass.id for subclass in rows.scalars()}
+
+
+async def load_lessons(session: AsyncSession, school_id: int) -> Dict[LessonKey, int]:
+    rows = await session.execute(
+        select(
+            database.Lesson.id,
+            database.Lesson.corpus_id,
+            database.Lesson.cabinet_id,
+            database.Lesson.lesson_number_id,
+            database.Lesson.day_of_week,
+            database.Lesson.teacher_id,
+        ).filter_by(school_id=school_id)
+    )
+    return {lesson_key(lesson): lesson.id for lesson in rows.all()}
+
+
+def named_lesson_key(lesson: incoming.TimetableLesson) -> NamedLessonKey:
+    return (
+        lesson.day_of_week,
+        lesson.lesson_number,
+        lesson.teacher,
+        lesson.corpus,
+        lesson.cabinet,
+    )
+
+
+def lesson_state(lesson: incoming.TimetableLesson) -> LessonState:
+    return (lesson.subject, frozenset(map(subclass_key, lesson.subclasses)))
+
+
+async def load_named_lessons(
+    session: AsyncSession, school_id: int
+) -> Tuple[Dict[NamedLessonKey, Tuple[int, LessonState]], List[int]]:
+    """Lessons of the school with their natural keys in a single query, the
+    second item are ids of lessons that repeat a key"""
+    rows = await session.execute(
+        select(
+            database.Lesson.id,
+            database.Lesson.day_of_week,
+            database.Lesson_number.number,
+            database.Teacher.name,
+            database.Corpus.name,
+            database.Cabinet.name,
+            database.Lesson.subject,
+            database.Subclass.educational_level,
+            database.Subclass.identificator,
+            database.Subclass.additional_identificator,
+        )
+        .join(
+            database.Lesson_number,
+            database.Lesson.lesson_number_id == database.Lesson_number.id,
+        )
+        .join(database.Teacher, database.Lesson.teacher_id == database.Teacher.id)
+        .join(database.Corpus, database.Lesson.corpus_id == database.Corpus.id)
+        .join(database.Cabinet, database.Lesson.cabinet_id == database.Cabinet.id)
+        .outerjoin(
+            database.lesson_subclass_association,
+            database.lesson_subclass_association.c.lesson_id == database.Lesson.id,
+        )
+        .outerjoin(
+            database.Subclass,
+            database.lesson_subclass_association.c.subclass_id == database.Subclass.id,
+        )
+        .filter(database.Lesson.school_id == school_id)
+        .order_by(database.Lesson.id)
+    )
+    keys: Dict[int, NamedLessonKey] = {}
+    subjects: Dict[int, str] = {}
+    subclasses: Dict[int, Set[SubclassKey]] = {}
+    for id, *key, subject, level, identificator, additional in rows.all():
+        keys[id] = tuple(key)
+        subjects[id] = subject
+        lesson_subclasses = subclasses.setdefault(id, set())
+        if level is not None:
+            lesson_subclasses.add((level, identificator, additional or ""))
+
+    lessons: Dict[NamedLessonKey, Tuple[int, LessonState]] = {}
+    duplicates: List[int] = []
+    for id, key in keys.items():
+        if key in lessons:
+            duplicates.append(id)
+        else:
+            lessons[key] = (id, (subjects[id], frozenset(subclasses[id])))
+    return lessons, duplicates
+
+
+async def load_tags(session: AsyncSession, labels: Set[str]) -> Dict[str, int]:
+    rows = await session.execute(
+        select(database.Tag.label, database.Tag.id).filter(
+            database.Tag.label.in_(labels)
+        )
+    )
+    return dict(rows.all())
+
+
+async def insert_rows(session: AsyncSession, table: Any, rows: List[Dict[str, Any]]):
+    # executemany, the MySQL drivers turn it into one multi-row INSERT
+    if rows:
+        await session.execute(insert(table), rows)
+
+
+async def mark_school_changed(
+    session: AsyncSession,
+    school_id: int,
+    corpus_ids: Iterable[int],
+    changes: Iterable[Change],
+):
+    # bulk statements are not seen by the caches' flush listeners
+    TIMETABLE_SNAPSHOTS.mark(session, school_id)
+    RESPONSE_CACHE.mark(session, school_id, corpus_ids)
+    await SCHOOL_VERSIONS.bump(session, school_id, changes)
+
+
+def missing(known: Dict[Any, int], wanted: Dict[Any, Any]) -> List[Any]:
+    return [key for key in wanted if key not in known]
+
+
+def check_references(
+    lessons: List[incoming.TimetableLesson],
+    corpuses: Dict[str, int],
+    lesson_numbers: Set[int],
+    teachers: Set[str],
+    cabinets: Set[CabinetKey],
+    subclasses: Set[SubclassKey],
+    errors: List[str],
+):
+    """Raise 422 with `errors` and every reference of `lessons` that is not
+    known"""
+    for index, lesson in enumerate(lessons):
+        if lesson.lesson_number not in lesson_numbers:
+            errors.append(
+                f"Lesson {index}: lesson number {lesson.lesson_number} does not exist"
+            )
+        if lesson.teacher not in teachers:
+            errors.append(f"Lesson {index}: teacher {lesson.teacher} does not exist")
+        if (corpuses.get(lesson.corpus), lesson.cabinet) not in cabinets:
+            errors.append(
+                f"Lesson {index}: cabinet {lesson.cabinet} in corpus {lesson.corpus} does not exist"
+            )
+        for subclass in map(subclass_key, lesson.subclasses):
+            if subclass not in subclasses:
+                errors.append(f"Lesson {index}: subclass {subclass} does not exist")
+    if errors:
+        logger.debug(
+            f"Raised an exception because timetable has {len(errors)} unresolved references"
+        )
+        raise HTTPException(status_code=422, detail=errors[:MAX_REPORTED_ERRORS])
+
+
+async def import_timetable(
+    session: AsyncSession, timetable: incoming.Timetable
+) -> outgoing.TimetableImport:
+    """Create everything in `timetable` that the school does not have yet
+
+    Existing rows are matched by natural keys and left untouched, lessons that
+    already exist are skipped. References are resolved with one query per
+    entity and new rows are written with bulk INSERTs, all in the session's
+    transaction.
+    """
+    school = await db_validated.get_school_by_id(session, timetable.school_id)
+
+    corpuses = await load_corpuses(session, school.id)
+    lesson_numbers = await load_lesson_numbers(session, school.id)
+    teachers = await load_teachers(session, school.id)
+    cabinets = await load_cabinets(session, list(corpuses.values()))
+    subclasses = await load_subclasses(session, school.id)
+
+    new_lesson_numbers = {
+        lesson_number.number: lesson_number
+        for lesson_number in timetable.lesson_numbers
+    }
+    new_teachers = {teacher.name: teacher for teacher in timetable.teachers}
+    new_subclasses = {
+        subclass_key(subclass): subclass for subclass in timetable.subclasses
+    }
+
+    errors: List[str] = []
+    new_cabinets: Dict[CabinetKey, incoming.TimetableCabinet] = {}
+    for cabinet in timetable.cabinets:
+        if cabinet.corpus not in corpuses:
+            errors.append(f"Corpus {cabinet.corpus} does not exist")
+            continue
+        new_cabinets[(corpuses[cabinet.corpus], cabinet.name)] = cabinet
+
+    check_references(
+        timetable.lessons,
+        corpuses,
+        lesson_numbers.keys() | new_lesson_numbers.keys(),
+        teachers.keys() | new_teachers.keys(),
+        cabinets.keys() | new_cabinets.keys(),
+        subclasses.keys() | new_subclasses.keys(),
+        errors,
+    )
+
+    created_lesson_numbers = missing(lesson_numbers, new_lesson_numbers)
+    await insert_rows(
+        session,
+        database.Lesson_number,
+        [
+            {
+                "number": number,
+                "time_start": new_lesson_numbers[number].time_start,
+                "time_end": new_lesson_numbers[number].time_end,
+                "school_id": school.id,
+            }
+            for number in created_lesson_numbers
+        ],
+    )
+
+    created_teachers = missing(teachers, new_teachers)
+    await insert_rows(
+        session,
+        database.Teacher,
+        [{"name": name, "school_id": school.id} for name in created_teachers],
+    )
+
+    created_cabinets = missing(cabinets, new_cabinets)
+    await insert_rows(
+        session,
+        database.Cabinet,
+        [
+            {
+                "name": name,
+                "floor": new_cabinets[(corpus_id, name)].floor,
+                "corpus_id": corpus_id,
+                "school_id": school.id,
+            }
+            for corpus_id, name in created_cabinets
+        ],
+    )
+
+    created_subclasses = missing(subclasses, new_subclasses)
+    await insert_rows(
+        session,
+        database.Subclass,
+        [
+            {
+                "educational_level": educational_level,
+                "identificator": identificator,
+                "additional_identificator": additional_identificator,
+                "school_id": school.id,
+            }
+            for educational_level, identificator, additional_identificator in created_subclasses
+        ],
+    )
+
+    if created_lesson_numbers:
+        lesson_numbers = await load_lesson_numbers(session, school.id)
+    if created_teachers:
+        teachers = await load_teachers(session, school.id)
+    if created_cabinets:
+        cabinets = await load_cabinets(session, list(corpuses.values()))
+    if created_subclasses:
+        subclasses = await load_subclasses(session, school.id)
+
+    teacher_tags = {
+        (teachers[name], tag.lower())
+        for name in created_teachers
+        for tag in new_teachers[name].tags
+    }
+    cabinet_tags = {
+        (cabinets[key], tag.lower())
+        for key in created_cabinets
+        for tag in new_cabinets[key].tags
+    }
+    labels = {label for _, label in teacher_tags | cabinet_tags}
+    if labels:
+        tags = await load_tags(session, labels)
+        await insert_rows(
+            session,
+            database.Tag,
+            [{"label": label} for label in labels if label not in tags],
+        )
+        if labels - tags.keys():
+            tags = await load_tags(session, labels)
+        await insert_rows(
+            session,
+            database.teacher_tag_association,
+            [
+                {"teacher_id": teacher_id, "tag_id": tags[label]}
+                for teacher_id, label in teacher_tags
+            ],
+        )
+        await insert_rows(
+            session,
+            database.cabinet_tag_association,
+            [
+                {"cabinet_id": cabinet_id, "tag_id": tags[label]}
+                for cabinet_id, label in cabinet_tags
+            ],
+        )
+
+    existing_lessons = await load_lessons(session, school.id)
+    new_lessons: Dict[LessonKey, Tuple[incoming.TimetableLesson, Set[int]]] = {}
+    for lesson in timetable.lessons:
+        corpus_id = corpuses[lesson.corpus]
+        key = (
+            corpus_id,
+            cabinets[(corpus_id, lesson.cabinet)],
+            lesson_numbers[lesson.lesson_number],
+            lesson.day_of_week,
+            teachers[lesson.teacher],
+        )
+        if key not in existing_lessons:
+            new_lessons[key] = (
+                lesson,
+                {subclasses[subclass_key(subclass)] for subclass in lesson.subclasses},
+            )
+    await insert_rows(
+        session,
+        database.Lesson,
+        [
+            {
+                "day_of_week": day_of_week,
+                "subject": lesson.subject,
+                "lesson_number_id": lesson_number_id,
+                "teacher_id": teacher_id,
+                "corpus_id": corpus_id,
+                "cabinet_id": cabinet_id,
+                "school_id": school.id,
+            }
+            for (
+                corpus_id,
+                cabinet_id,
+                lesson_number_id,
+                day_of_week,
+                teacher_id,
+            ), (lesson, _) in new_lessons.items()
+        ],
+    )
+    if new_lessons:
+        lesson_ids = await load_lessons(session, school.id)
+        await insert_rows(
+            session,
+            database.lesson_subclass_association,
+            [
+                {"lesson_id": lesson_ids[key], "subclass_id": subclass_id}
+                for key, (_, subclass_ids) in new_lessons.items()
+                for subclass_id in subclass_ids
+            ],
+        )
+
+    changes: List[Change] = [
+        *(
+            ("lesson_number", lesson_numbers[key], False)
+            for key in created_lesson_numbers
+        ),
+        *(("teacher", teachers[key], False) for key in created_teachers),
+        *(("cabinet", cabinets[key], False) for key in created_cabinets),
+        *(("subclass", subclasses[key], False) for key in created_subclasses),
+    ]
+    if new_lessons:
+        changes += [("lesson", lesson_ids[key], False) for key in new_lessons]
+    await mark_school_changed(session, school.id, corpuses.values(), changes)
+    await session.commit()
+    for name in created_teachers:
+        TEACHER_NAMES.put(school.id, teachers[name], name)
+    result = outgoing.TimetableImport(
+        lesson_numbers=len(created_lesson_numbers),
+        teachers=len(created_teachers),
+        cabinets=len(created_cabinets),
+        subclasses=len(created_subclasses),
+        lessons=len(new_lessons),
+        skipped_lessons=len(timetable.lessons) - len(new_lessons),
+    )
+    logger.info(f"Imported timetable to school with id {school.id}: {result}")
+    return result
+
+
+async def update_subjects(session: AsyncSession, subjects: List[Tuple[int, str]]):
+    if subjects:
+        lesson = database.Lesson.__table__
+        await session.execute(
+            update(lesson)
+            .where(lesson.c.id == bindparam("lesson_id"))
+            .values(subject=bindparam("new_subject")),
+            [{"lesson_id": id, "new_subject": subject} for id, subject in subjects],
+        )
+
+
+async def sync_timetable(
+    session: AsyncSession, timetable: incoming.TimetableSync
+) -> outgoing.TimetableSync:
+    """Make the school's lessons equal to `timetable.lessons`
+
+    Lessons are matched by their natural key, a lesson with the same key and
+    another subject or subclasses is updated in place, the rest is inserted or
+    deleted. An unchanged timetable costs the school lookup, one read and no
+    writes.
+    """
+    school = await db_validated.get_school_by_id(session, timetable.school_id)
+    current, duplicates = await load_named_lessons(session, school.id)
+
+    errors: List[str] = []
+    desired: Dict[NamedLessonKey, incoming.TimetableLesson] = {}
+    for index, lesson in enumerate(timetable.lessons):
+        key = named_lesson_key(lesson)
+        if key in desired:
+            errors.append(f"Lesson {index}: lesson {key} is already listed")
+        desired[key] = lesson
+    if errors:
+        logger.debug(
+            f"Raised an exception because timetable has {len(errors)} repeated lessons"
+        )
+        raise HTTPException(status_code=422, detail=errors[:MAX_REPORTED_ERRORS])
+
+    created = [key for key in desired if key not in current]
+    updated = [
+        key
+        for key, lesson in desired.items()
+        if key in current and current[key][1] != lesson_state(lesson)
+    ]
+    deleted = [id for key, (id, _) in current.items() if key not in desired]
+    deleted += duplicates
+    result = outgoing.TimetableSync(
+        created=len(created),
+        updated=len(updated),
+        deleted=len(deleted),
+        unchanged=len(desired) - len(created) - len(updated),
+    )
+    if not (created or updated or deleted):
+        return result
+    corpuses = await load_corpuses(session, school.id)
+
+    if deleted:
+        await session.execute(
+            delete(database.lesson_subclass_association).where(
+                database.lesson_subclass_association.c.lesson_id.in_(deleted)
+            )
+        )
+        await session.execute(
+            delete(database.Lesson.__table__).where(
+                database.Lesson.__table__.c.id.in_(deleted)
+            )
+        )
+
+    if created or updated:
+        lesson_numbers = await load_lesson_numbers(session, school.id)
+        teachers = await load_teachers(session, school.id)
+        cabinets = await load_cabinets(session, list(corpuses.values()))
+        subclasses = await load_subclasses(session, school.id)
+        check_references(
+            timetable.lessons,
+            corpuses,
+            lesson_numbers.keys(),
+            teachers.keys(),
+            cabinets.keys(),
+            subclasses.keys(),
+            [],
+        )
+
+        await update_subjects(
+            session,
+            [
+                (current[key][0], desired[key].subject)
+                for key in updated
+                if current[key][1][0] != desired[key].subject
+            ],
+        )
+        removed_subclasses: List[Dict[str, int]] = []
+        added_subclasses: List[Dict[str, int]] = []
+        for key in updated:
+            id, (_, old_subclasses) = current[key]
+            new_subclasses = lesson_state(desired[key])[1]
+            removed_subclasses += [
+                {"old_lesson_id": id, "old_subclass_id": subclasses[subclass]}
+                for subclass in old_subclasses - new_subclasses
+            ]
+            added_subclasses += [
+                {"lesson_id": id, "subclass_id": subclasses[subclass]}
+                for subclass in new_subclasses - old_subclasses
+            ]
+        if removed_subclasses:
+            association = database.lesson_subclass_association.c
+            await session.execute(
+                delete(database.lesson_subclass_association).where(
+                    association.lesson_id == bindparam("old_lesson_id"),
+                    association.subclass_id == bindparam("old_subclass_id"),
+                ),
+                removed_subclasses,
+            )
+
+        new_lessons: Dict[LessonKey, incoming.TimetableLesson] = {}
+        for key in created:
+            lesson = desired[key]
+            corpus_id = corpuses[lesson.corpus]
+            new_lessons[
+                (
+                    corpus_id,
+                    cabinets[(corpus_id, lesson.cabinet)],
+                    lesson_numbers[lesson.lesson_number],
+                    lesson.day_of_week,
+                    teachers[lesson.teacher],
+                )
+            ] = lesson
+        await insert_rows(
+            session,
+            database.Lesson,
+            [
+                {
+                    "day_of_week": day_of_week,
+                    "subject": lesson.subject,
+                    "lesson_number_id": lesson_number_id,
+                    "teacher_id": teacher_id,
+                    "corpus_id": corpus_id,
+                    "cabinet_id": cabinet_id,
+                    "school_id": school.id,
+                }
+                for (
+                    corpus_id,
+                    cabinet_id,
+                    lesson_number_id,
+                    day_of_week,
+                    teacher_id,
+                ), lesson in new_lessons.items()
+            ],
+        )
+        if new_lessons:
+            lesson_ids = await load_lessons(session, school.id)
+            added_subclasses += [
+                {
+                    "lesson_id": lesson_ids[key],
+                    "subclass_id": subclasses[subclass_key(subclass)],
+                }
+                for key, lesson in new_lessons.items()
+                for subclass in lesson.subclasses
+            ]
+        await insert_rows(
+            session, database.lesson_subclass_association, added_subclasses
+        )
+
+    changes: List[Change] = [("lesson", id, True) for id in deleted]
+    changes += [("lesson", current[key][0], False) for key in updated]
+    if created:
+        changes += [("lesson", lesson_ids[key], False) for key in new_lessons]
+    await mark_school_changed(session, timetable.school_id, corpuses.values(), changes)
+    await session.commit()
+    logger.info(f"Synced timetable of school with id {timetable.school_id}: {result}")
+    return result
+
+
+def parse_timetable_csv(school_id: int, content: str) -> incoming.Timetable:
+    """One lesson per row, see CSV_COLUMNS. Tags and subclasses are separated
+    with ";", a subclass is written as 10A or 10A/1"""
+    # cells missing from short rows are empty and fail validation like them
+    reader = csv.DictReader(StringIO(content), restval="")
+    try:
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+    except csv.Error as error:
+        logger.debug("Raised an exception because CSV can not be parsed")
+        raise HTTPException(status_code=422, detail=f"Invalid CSV: {error}")
+    absent = set(CSV_COLUMNS) - set(fieldnames or ())
+    if absent:
+        raise HTTPException(
+            status_code=422,
+            detail=f"CSV is missing columns: {', '.join(sorted(absent))}",
+        )
+
+    lesson_numbers: Dict[int, incoming.TimetableLessonNumber] = {}
+    teachers: Dict[str, incoming.TimetableTeacher] = {}
+    cabinets: Dict[Tuple[str, str], incoming.TimetableCabinet] = {}
+    subclasses: Dict[SubclassKey, incoming.TimetableSubclass] = {}
+    lessons: List[incoming.TimetableLesson] = []
+    for row_number, row in enumerate(rows, start=2):
+        try:
+            lesson_subclasses = []
+            for value in filter(None, map(str.strip, row["subclasses"].split(";"))):
+                parsed = CSV_SUBCLASS.match(value)
+                if parsed is None:
+                    raise ValueError(f"Invalid subclass {value}")
+                level, identificator, additional = parsed.groups()
+                lesson_subclasses.append(
+                    incoming.TimetableSubclass(
+                        educational_level=int(level),
+                        identificator=identificator,
+                        additional_identificator=additional or "",
+                    )
+                )
+            lesson_number = incoming.TimetableLessonNumber(
+                number=row["lesson_number"],
+                time_start=row["time_start"],
+                time_end=row["time_end"],
+            )
+            teacher = incoming.TimetableTeacher(
+                name=row["teacher"],
+                tags=list(filter(None, map(str.strip, row["teacher_tags"].split(";")))),
+            )
+            cabinet = incoming.TimetableCabinet(
+                name=row["cabinet"], floor=row["floor"], corpus=row["corpus"]
+            )
+            lesson = incoming.TimetableLesson(
+                day_of_week=row["day_of_week"],
+                subject=row["subject"],
+                lesson_number=lesson_number.number,
+                teacher=teacher.name,
+                cabinet=cabinet.name,
+                corpus=cabinet.corpus,
+                subclasses=lesson_subclasses,
+            )
+        except (ValidationError, ValueError) as error:
+            logger.debug(f"Raised an exception because CSV row {row_number} is invalid")
+            raise HTTPException(
+                status_code=422, detail=f"Row {row_number}: {error}"
+            ) from error
+
+        lesson_numbers[lesson_number.number] = lesson_number
+        teachers.setdefault(teacher.name, teacher)
+        cabinets.setdefault((cabinet.corpus, cabinet.name), cabinet)
+        for subclass in lesson_subclasses:
+            subclasses[subclass_key(subclass)] = subclass
+        lessons.append(lesson)
+
+    return incoming.Timetable(
+        school_id=school_id,
+        lesson_numbers=list(lesson_numbers.values()),
+        teachers=list(teachers.values()),
+        cabinets=list(cabinets.values()),
+        subclasses=list(subclasses.values()),
+        lessons=lessons,
+    )
+
+
+@router.post(
+    "/import", tags=[TIMETABLE, WEBSITE], response_model=outgoing.TimetableImport
+)
+async def import_timetable_json(
+    timetable: incoming.Timetable, session=Depends(get_session)
+):
+    return await import_timetable(session, timetable)
+
+
+@router.post(
+    "/import/csv", tags=[TIMETABLE, WEBSITE], response_model=outgoing.TimetableImport
+)
+async def import_timetable_csv(
+    school_id: ID, file: UploadFile = File(...), session=Depends(get_session)
+):
+    try:
+        content = (await file.read()).decode("utf-8-sig")
+    except UnicodeDecodeError:
+        logger.debug("Raised an exception because CSV is not UTF-8")
+        raise HTTPException(status_code=422, detail="CSV must be encoded in UTF-8")
+    return await import_timetable(session, parse_timetable_csv(school_id, content))
+
+
+@router.post("/sync", tags=[TIMETABLE, WEBSITE], response_model=outgoing.TimetableSync)
+async def sync_timetable_lessons(
+    timetable: incoming.TimetableSync, session=Depends(get_session)
+):
+    return await sync_timetable(session, timetable)
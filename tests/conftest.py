@@ -0,0 +1,61 @@
+import os
+import sys
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+import pytest
+
+# config.py reads these at import, the tests never connect with them
+for name, value in {
+    "DATABASE_USER": "skedule",
+    "DATABASE_PASSWORD": "skedule",
+    "DATABASE_HOST": "localhost",
+    "DATABASE_PORT": "3306",
+    "DATABASE_NAME": "skedule",
+    "JWT_SECRET": "secret",
+    "WEBSITE_HOST": "localhost",
+    "WEBSITE_PORT": "8080",
+}.items():
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def session_class():
+    """Sync session class of a single test. Listeners the test registers on it
+    go away with it, and the ones the app keeps on PrimarySession stay out of
+    the test."""
+    from sqlalchemy.orm import Session as BaseSession
+
+    class Session(BaseSession):
+        pass
+
+    return Session
+
+
+@pytest.fixture
+def open_database(tmp_path, session_class):
+    """Opens a SQLite file of the test with the tables created, yields its
+    session factory and disposes the engine on the way out"""
+    from config import make_engine
+    from models import database
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+
+    @asynccontextmanager
+    async def open_database(name: str = "api"):
+        engine = make_engine(f"sqlite+aiosqlite:///{tmp_path / name}.db")
+        try:
+            async with engine.begin() as connection:
+                await connection.run_sync(database.Base.metadata.create_all)
+            yield sessionmaker(
+                bind=engine,
+                class_=AsyncSession,
+                sync_session_class=session_class,
+                expire_on_commit=False,
+            )
+        finally:
+            await engine.dispose()
+
+    return open_database
@@ -0,0 +1,153 @@
+"""AnnouncementDispatcher stopped in the middle of a job, left behind by a
+crashed worker and failing to post, on a SQLite database with a stand-in
+transmitter"""
+
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from aiohttp import ServerDisconnectedError
+from extra.transmitter import TransmitterError
+from models import database
+from routers.webapi.announcements import utils
+from routers.webapi.announcements.dispatcher import AnnouncementDispatcher
+
+Status = database.JobStatusEnum
+ACCOUNTS = 10
+
+
+class StandIn:
+    """Transmitter taking chunks until `block_after` of them, then hanging"""
+
+    def __init__(self, block_after: int = 1000):
+        self.posted = []
+        self.block_after = block_after
+        self.blocked = asyncio.Event()
+
+    async def __call__(self, text, telegram_ids, silent=False):
+        if len(self.posted) >= self.block_after:
+            self.blocked.set()
+            await asyncio.sleep(3600)
+        self.posted += telegram_ids
+
+
+@pytest.fixture
+def run(open_database):
+    def run(scenario):
+        async def main():
+            async with open_database() as factory:
+                async with factory() as session:
+                    session.add_all(
+                        database.Account(telegram_id=1000 + index)
+                        for index in range(ACCOUNTS)
+                    )
+                    await session.commit()
+                dispatcher = AnnouncementDispatcher(2, 1, 10, 1, 0.01, 3600, 60)
+                dispatcher.session_factory = factory
+                try:
+                    await scenario(dispatcher, factory)
+                finally:
+                    await dispatcher.stop()
+
+        asyncio.run(main())
+
+    return run
+
+
+async def add_job(factory, **values) -> int:
+    async with factory() as session:
+        job = utils.new_job("text", False, ACCOUNTS, to_all=True)
+        for key, value in values.items():
+            setattr(job, key, value)
+        session.add(job)
+        await session.commit()
+        return job.id
+
+
+async def finished(factory, job_id: int) -> database.Announcement_job:
+    for _ in range(100):
+        async with factory() as session:
+            job = await session.get(database.Announcement_job, job_id)
+            if job.status in (Status.DONE, Status.FAILED):
+                return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"Job {job_id} is still {job.status}")
+
+
+def test_stopped_delivery_is_queued_again(run, monkeypatch):
+    async def scenario(dispatcher, factory):
+        # TRANSMITTER.parallel chunks of 2 make a batch
+        monkeypatch.setattr(utils.TRANSMITTER, "parallel", 1)
+        stand_in = StandIn(block_after=4)
+        monkeypatch.setattr(utils, "send_to_transmitter", stand_in)
+        job_id = await add_job(factory)
+        dispatcher.start()
+        dispatcher.enqueue(job_id)
+        await asyncio.wait_for(stand_in.blocked.wait(), 5)
+        await dispatcher.stop()
+
+        async with factory() as session:
+            job = await session.get(database.Announcement_job, job_id)
+            assert job.status == Status.QUEUED
+            assert job.sent == 4
+
+        stand_in.block_after = 1000
+        dispatcher.start()
+        dispatcher.enqueue(job_id)
+        job = await finished(factory, job_id)
+        assert job.status == Status.DONE
+        assert job.sent == ACCOUNTS
+        assert sorted(stand_in.posted) == [1000 + index for index in range(ACCOUNTS)]
+
+    run(scenario)
+
+
+def test_sweep_reclaims_abandoned_delivery(run, monkeypatch):
+    async def scenario(dispatcher, factory):
+        stand_in = StandIn()
+        monkeypatch.setattr(utils, "send_to_transmitter", stand_in)
+        long_ago = datetime.utcnow() - timedelta(hours=1)
+        # a crashed worker got through the first 4 accounts
+        abandoned = await add_job(
+            factory, status=Status.SENDING, sent=4, cursor=4, updated=long_ago
+        )
+        # still in progress on another worker
+        active = await add_job(factory, status=Status.SENDING)
+        dispatcher.start()
+
+        job = await finished(factory, abandoned)
+        assert job.sent == ACCOUNTS
+        assert sorted(stand_in.posted) == [1004 + index for index in range(6)]
+        async with factory() as session:
+            job = await session.get(database.Announcement_job, active)
+            assert job.status == Status.SENDING
+        assert dispatcher.stats()["reclaimed"] == 1
+
+    run(scenario)
+
+
+def test_only_chunks_that_surely_were_not_sent_are_posted_again(run, monkeypatch):
+    async def scenario(dispatcher, factory):
+        dispatcher.retries = 3
+        dispatcher.retry_seconds = 0
+        job = SimpleNamespace(id=1, text="text", silent=False)
+        for failures, posted, attempts in (
+            ([TransmitterError(503)], True, 2),
+            ([TransmitterError(400)], False, 1),
+            ([asyncio.TimeoutError()], False, 1),
+            ([ServerDisconnectedError()], False, 1),
+            ([TransmitterError(502)] * 3, False, 3),
+        ):
+            calls = []
+
+            async def flaky(text, telegram_ids, silent=False):
+                calls.append(telegram_ids)
+                if len(calls) <= len(failures):
+                    raise failures[len(calls) - 1]
+
+            monkeypatch.setattr(utils, "send_to_transmitter", flaky)
+            assert await dispatcher._post(job, [1000]) is posted
+            assert len(calls) == attempts
+
+    run(scenario)
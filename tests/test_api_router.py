@@ -0,0 +1,73 @@
+"""CachedRouter routes behind the auth of their router"""
+
+from types import SimpleNamespace
+
+import pytest
+from config import Access
+from extra.api_router import CachedRouter, cached
+from extra.response_cache import RESPONSE_CACHE, MemoryBackend
+from extra.school_versions import SCHOOL_VERSIONS
+from extra.service_auth import (
+    OAUTH2_SERVICE_SCHEME,
+    AllowLevels,
+    get_current_service,
+)
+from fastapi import APIRouter, Depends, FastAPI
+from starlette.testclient import TestClient
+
+ADMIN = {"Authorization": f"Bearer {Access.Admin.value}"}
+WEBSITE = {"Authorization": f"Bearer {Access.Website.value}"}
+
+
+def service(token: str = Depends(OAUTH2_SERVICE_SCHEME)):
+    # the token is the access level, no service rows to look up
+    return SimpleNamespace(access_level=int(token))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(RESPONSE_CACHE, "backend", MemoryBackend())
+    router = APIRouter(
+        dependencies=[Depends(AllowLevels(Access.Admin))], route_class=CachedRouter
+    )
+    app = FastAPI()
+    app.calls = 0
+
+    @router.get("/teachers")
+    @cached
+    async def get_teachers(school_id: int):
+        app.calls += 1
+        return {"data": []}
+
+    app.include_router(router)
+    app.dependency_overrides[get_current_service] = service
+    return TestClient(app)
+
+
+def test_warm_response_is_not_served_to_other_callers(client):
+    warm = client.get("/teachers?school_id=1", headers=ADMIN)
+    assert warm.headers["X-Cache"] == "MISS"
+    assert client.get("/teachers?school_id=1", headers=ADMIN).headers["X-Cache"] == (
+        "HIT"
+    )
+    assert client.get("/teachers?school_id=1").status_code == 401
+    assert client.get("/teachers?school_id=1", headers=WEBSITE).status_code == 401
+    assert client.app.calls == 1
+
+
+def test_versions_are_not_told_to_other_callers(client, monkeypatch):
+    looked_up = []
+
+    async def version(school_id: int) -> int:
+        looked_up.append(school_id)
+        return 3
+
+    monkeypatch.setattr(SCHOOL_VERSIONS, "get", version)
+    current = {"If-None-Match": '"1.3"'}
+    assert client.get("/teachers?school_id=1", headers=current).status_code == 401
+    assert looked_up == []
+    response = client.get("/teachers?school_id=1", headers={**ADMIN, **current})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == '"1.3"'
+    assert looked_up == [1]
+    assert client.app.calls == 0
@@ -0,0 +1,107 @@
+"""EntityCache on a SQLite database"""
+
+import asyncio
+
+import pytest
+from extra.entity_cache import EntityCache
+from models import database
+from sqlalchemy import update
+
+
+@pytest.fixture
+def run(open_database):
+    def run(scenario):
+        async def main():
+            async with open_database() as factory:
+                async with factory() as session:
+                    school = database.School(name="Test School Number One")
+                    session.add(school)
+                    await session.flush()
+                    session.add(
+                        database.Teacher(name="Ivanov Ivan", school_id=school.id)
+                    )
+                    await session.commit()
+                cache = EntityCache(16, 60, 60)
+                cache.session_factory = factory
+                await scenario(cache, factory)
+
+        asyncio.run(main())
+
+    return run
+
+
+async def cached(cache: EntityCache, factory, entity, uid: int):
+    async with factory() as session:
+        cache.put(await session.get(entity, uid))
+
+
+def test_hit_needs_no_query(run):
+    async def scenario(cache, factory):
+        await cached(cache, factory, database.Teacher, 1)
+        async with factory() as session:
+            teacher = await cache.get(session, database.Teacher, 1)
+            assert teacher.name == "Ivanov Ivan"
+            assert teacher in session
+        assert cache.stats()["hits"] == 1
+
+    run(scenario)
+
+
+def test_instance_of_the_session_wins(run):
+    async def scenario(cache, factory):
+        await cached(cache, factory, database.Teacher, 1)
+        async with factory() as session:
+            teacher = await session.get(database.Teacher, 1)
+            teacher.name = "Petrov Petr"
+            # a merge would copy the cached name over the pending change
+            assert await cache.get(session, database.Teacher, 1) is teacher
+            assert teacher.name == "Petrov Petr"
+
+    run(scenario)
+
+
+def test_scopes_of_other_workers_are_dropped(run):
+    async def scenario(cache, factory):
+        await cached(cache, factory, database.School, 1)
+        await cached(cache, factory, database.Teacher, 1)
+        cache.invalidate_scopes({2}, set())
+        assert cache.stats()["size"] == 2
+        cache.invalidate_scopes({1}, set())
+        assert cache.stats()["size"] == 0
+
+    run(scenario)
+
+
+def test_rows_of_replicas_and_of_old_generations_are_not_kept(run):
+    async def scenario(cache, factory):
+        async with factory() as session:
+            session.sync_session.info["replica"] = True
+            cache.put(await session.get(database.Teacher, 1))
+        generation = cache.generation
+        async with factory() as session:
+            teacher = await session.get(database.Teacher, 1)
+            # a commit of the worker dropped the row while it was read
+            cache.invalidate(database.Teacher, 1)
+            cache.put(teacher, generation)
+        assert cache.stats()["size"] == 0
+
+    run(scenario)
+
+
+def test_poll_drops_rows_of_schools_changed_elsewhere(run):
+    async def scenario(cache, factory):
+        await cache.poll()
+        await cached(cache, factory, database.Teacher, 1)
+        await cache.poll()
+        assert cache.stats()["size"] == 1
+        async with factory() as session:
+            await session.execute(
+                update(database.School).values(
+                    data_version=database.School.data_version + 1
+                )
+            )
+            await session.commit()
+        await cache.poll()
+        assert cache.stats()["size"] == 0
+
+    run(scenario)
@@ -0,0 +1,34 @@
+"""NgramIndex searches"""
+
+from extra import ngram_index
+from extra.ngram_index import NgramIndex
+
+NAMES = ["Ivanov Ivan", "Ivanova Maria", "Petrov Petr", "Sidorov Oleg"]
+
+
+def index() -> NgramIndex:
+    return NgramIndex(enumerate(NAMES))
+
+
+def test_prefixes_come_first():
+    assert index().search("ivanov", 3, 10)[:2] == [0, 1]
+
+
+def test_short_query_finds_substrings_only(monkeypatch):
+    compared = []
+    rank = ngram_index.rank
+    monkeypatch.setattr(
+        ngram_index,
+        "rank",
+        lambda name, query: compared.append(name) or rank(name, query),
+    )
+    assert index().search("p", 3, 10) == [2]
+    assert index().search("zz", 3, 10) == []
+    # earlier matches first, then shorter names
+    assert index().search("ov", 3, 10) == [0, 2, 1]
+    assert index().search("ol", 3, 10) == [3]
+    assert compared == []
+
+
+def test_typos_are_found_among_candidates():
+    assert index().search("sidorof oleg", 1, 10) == [3]
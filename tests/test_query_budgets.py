@@ -0,0 +1,246 @@
+"""Statements executed by the routes of the read paths, on a SQLite database
+filled through the API
+
+Budgets do not grow with the amount of rows, a lazy load sneaking back into a
+route executes a statement per lesson and blows them.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from config import get_read_session, get_session
+from extra.auth_api import get_harvest_user
+from extra.database_pool import PrimarySession
+from extra.entity_cache import ENTITY_CACHE
+from extra.query_counter import assert_query_budget
+from extra.school_versions import SCHOOL_VERSIONS
+from extra.service_auth import get_current_service
+from extra.stats_rollup import STATS_ROLLUP
+from extra.timetable_snapshot import TIMETABLE_SNAPSHOTS
+from models import database
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.testclient import TestClient
+
+DAYS = (1, 2, 3)
+NUMBERS = 6
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    import main
+
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path_factory.mktemp('budgets') / 'api.db'}"
+    )
+
+    async def create():
+        async with engine.begin() as connection:
+            await connection.run_sync(database.Base.metadata.create_all)
+
+    asyncio.run(create())
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    factory = sessionmaker(
+        bind=engine,
+        class_=AsyncSession,
+        sync_session_class=PrimarySession,
+        expire_on_commit=False,
+    )
+
+    async def session():
+        async with factory() as session:
+            yield session
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(SCHOOL_VERSIONS, "engine", engine)
+        patch.setattr(TIMETABLE_SNAPSHOTS, "session_factory", factory)
+        patch.setattr(STATS_ROLLUP, "session_factory", factory)
+        patch.setitem(main.app.dependency_overrides, get_session, session)
+        patch.setitem(main.app.dependency_overrides, get_read_session, session)
+        patch.setitem(
+            main.app.dependency_overrides,
+            get_current_service,
+            lambda: SimpleNamespace(access_level=5),
+        )
+        patch.setitem(
+            main.app.dependency_overrides, get_harvest_user, lambda: SimpleNamespace()
+        )
+        # entities and snapshots of the other tests' databases share the ids
+        ENTITY_CACHE.clear()
+        TIMETABLE_SNAPSHOTS.invalidate()
+        client = TestClient(main.app)
+        client.ids = fill(client)
+        # the background task of the app is not running here
+        asyncio.get_event_loop().run_until_complete(STATS_ROLLUP.flush())
+        yield client
+        ENTITY_CACHE.clear()
+        TIMETABLE_SNAPSHOTS.invalidate()
+    asyncio.get_event_loop().run_until_complete(engine.dispose())
+
+
+def created(response) -> int:
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def registered(response):
+    assert response.status_code == 200, response.text
+
+
+def fill(client: TestClient) -> SimpleNamespace:
+    """A school with a lesson for every subclass, day and lesson number"""
+    school = created(client.post("/api/school/new", json={"name": "Budget School"}))
+    corpus = created(
+        client.post(
+            "/api/corpus/new",
+            json={"name": "Main", "address": "Some street 1", "school_id": school},
+        )
+    )
+    cabinets = [
+        created(
+            client.post(
+                "/api/cabinet/new",
+                json={"name": f"C{i}", "floor": 1, "corpus_id": corpus, "tags": []},
+            )
+        )
+        for i in range(NUMBERS)
+    ]
+    numbers = [
+        created(
+            client.post(
+                "/api/lessontimetable/new",
+                json={
+                    "number": number,
+                    "time_start": f"{7 + number:02}:00",
+                    "time_end": f"{7 + number:02}:45",
+                    "school_id": school,
+                },
+            )
+        )
+        for number in range(1, NUMBERS + 1)
+    ]
+    teachers = [
+        created(
+            client.post(
+                "/api/teacher/new",
+                json={"name": name, "school_id": school, "tags": ["math"]},
+            )
+        )
+        for name in ("Ivanov Ivan", "Petrov Petr", "Sidorova Anna")
+    ]
+    subclasses = [
+        created(
+            client.post(
+                "/api/subclass/new",
+                json={
+                    "educational_level": level,
+                    "identificator": letter,
+                    "additional_identificator": "",
+                    "school_id": school,
+                },
+            )
+        )
+        for level in (5, 6)
+        for letter in "AB"
+    ]
+    for day in DAYS:
+        for index, subclass in enumerate(subclasses):
+            for number in range(NUMBERS):
+                created(
+                    client.post(
+                        "/api/lesson/new",
+                        json={
+                            "day_of_week": day,
+                            "subject": f"Subject {number}",
+                            "lesson_number_id": numbers[number],
+                            "teacher_id": teachers[(index + number) % len(teachers)],
+                            "subclasses": [subclass],
+                            "cabinet_id": cabinets[(index + number) % NUMBERS],
+                        },
+                    )
+                )
+    # the accounts get the statistics of the school counted into the rollup
+    # once it is flushed
+    for telegram_id, subclass in enumerate(subclasses, 1):
+        registered(
+            client.post(
+                "/api/registration/student",
+                json={"telegram_id": telegram_id, "subclass_id": subclass},
+            )
+        )
+    registered(
+        client.post(
+            "/api/registration/teacher",
+            json={"telegram_id": 100, "teacher_id": teachers[0]},
+        )
+    )
+    return SimpleNamespace(school=school, teachers=teachers, subclasses=subclasses)
+
+
+def lesson_getters(ids: SimpleNamespace):
+    for owner in (
+        {"teacher_id": ids.teachers[0]},
+        {"subclass_id": ids.subclasses[0]},
+    ):
+        owner = {"school_id": ids.school, **owner}
+        yield "/api/lesson/get/day", {**owner, "day_of_week": 1}
+        yield "/api/lesson/get/range", {**owner, "start_index": 1, "end_index": 3}
+        yield "/api/lesson/get/certain", {**owner, "day_of_week": 2, "lesson_number": 3}
+
+
+def get(client: TestClient, path: str, params=None):
+    response = client.get(path, params=params)
+    assert response.status_code == 200, response.text
+    return response
+
+
+@pytest.fixture
+def without_snapshots(monkeypatch):
+    monkeypatch.setattr(TIMETABLE_SNAPSHOTS, "ttl", 0)
+
+
+def test_lesson_getters_load_eagerly(client, without_snapshots):
+    for path, params in lesson_getters(client.ids):
+        assert_query_budget(get(client, path, params), 6)
+
+
+def test_lesson_lists_load_eagerly(client):
+    school = {"school_id": client.ids.school}
+    assert len(get(client, "/api/info/lessons/all", school).json()["data"]) == 72
+    assert_query_budget(get(client, "/api/info/lessons/all", school), 5)
+    assert_query_budget(get(client, "/api/info/lessontimetables/all", school), 5)
+
+
+def test_warm_snapshot_serves_lessons_without_statements(client):
+    getters = list(lesson_getters(client.ids))
+    for path, params in getters:
+        get(client, path, params)
+    for path, params in getters:
+        assert_query_budget(get(client, path, params), 0)
+
+
+@pytest.mark.parametrize(
+    "path",
+    [
+        "users",
+        "teachers",
+        "parents",
+        "students",
+        "administrations",
+        "parallel",
+        "childrencount",
+        "teacherparallel",
+        "parentchildren",
+        "parentswithchildren",
+    ],
+)
+def test_statistics_are_counted_by_the_database(client, path):
+    assert_query_budget(get(client, f"/api/stats/{path}"), 1)
+    assert_query_budget(get(client, f"/api/stats/{path}?by_school=true"), 3)
+
+
+@pytest.mark.parametrize("path", ["counts", "parallel", "childrencount"])
+def test_statistics_history_reads_the_rollup(client, path):
+    school = {"school_id": client.ids.school}
+    assert_query_budget(get(client, f"/api/stats/history/{path}", school), 4)
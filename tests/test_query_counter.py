@@ -0,0 +1,19 @@
+"""count_queries on an in-memory SQLite database"""
+
+import pytest
+from extra.query_counter import count_queries
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+
+def test_failed_statements_leave_nothing_behind():
+    engine = create_engine("sqlite://")
+    with engine.connect() as connection, count_queries() as stats:
+        for _ in range(3):
+            with pytest.raises(OperationalError):
+                connection.execute(text("SELECT * FROM missing"))
+        connection.execute(text("SELECT 1"))
+        assert "query_start" not in connection.info
+    # only statements that returned are counted
+    assert stats.count == 1
+    engine.dispose()
@@ -0,0 +1,133 @@
+"""ReplicaRouter against two SQLite files standing in for the primary and a
+replica. Nothing is replicated between them, so a school written to the
+primary is only seen by reads that went to the primary."""
+
+import asyncio
+
+import pytest
+from config import READ_SESSION_FACTORY, make_engine
+from extra.database_pool import ReplicaRouter
+from models import database
+from sqlalchemy import func, text, update
+from sqlalchemy.future import select
+
+PIN_SECONDS = 0.2
+
+
+@pytest.fixture
+def run(open_database, session_class, tmp_path):
+    def run(scenario, replicas=1):
+        async def main():
+            dead = make_engine(
+                f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}"
+            )
+            async with open_database("primary") as factory, open_database(
+                "replica"
+            ) as replica:
+                router = ReplicaRouter(
+                    factory.kw["bind"],
+                    [dead, replica.kw["bind"]][-replicas:],
+                    READ_SESSION_FACTORY,
+                    PIN_SECONDS,
+                    60,
+                )
+                router.pin_on_commit(session_class)
+                try:
+                    await scenario(router, factory)
+                finally:
+                    await dead.dispose()
+
+        asyncio.run(main())
+
+    return run
+
+
+async def reads_primary(router: ReplicaRouter, caller: str) -> bool:
+    session = await router.read_session(caller)
+    try:
+        schools = await session.scalar(select(func.count(database.School.id)))
+        assert (schools == 1) == (session.bind is router.primary)
+        return session.bind is router.primary
+    finally:
+        await session.close()
+
+
+async def write(factory, caller=None):
+    session = factory()
+    if caller is not None:
+        session.sync_session.info["caller"] = caller
+    session.add(database.School(name="Test School Number One"))
+    await session.commit()
+    await session.close()
+
+
+def test_reads_go_to_the_replica(run):
+    async def scenario(router, factory):
+        await write(factory)
+        assert not await reads_primary(router, "bot")
+
+    run(scenario)
+
+
+def test_writer_is_pinned_to_the_primary(run):
+    async def scenario(router, factory):
+        await write(factory, "website")
+        assert await reads_primary(router, "website")
+        # other callers do not wait for replication of someone else's write
+        assert not await reads_primary(router, "bot")
+        await asyncio.sleep(PIN_SECONDS * 1.5)
+        assert not await reads_primary(router, "website")
+
+    run(scenario)
+
+
+def test_commits_without_writes_or_caller_do_not_pin(run):
+    async def scenario(router, factory):
+        await write(factory)
+        session = factory()
+        session.sync_session.info["caller"] = "website"
+        await session.execute(text("SELECT 1"))
+        await session.commit()
+        await session.close()
+        assert not await reads_primary(router, "website")
+        assert router.stats()["pinned_callers"] == 0
+
+    run(scenario)
+
+
+def test_bulk_statements_pin_the_writer(run):
+    async def scenario(router, factory):
+        await write(factory)
+        session = factory()
+        session.sync_session.info["caller"] = "website"
+        # flushes nothing, like the timetable import and the role links
+        await session.execute(
+            update(database.School).values(name="Test School Number Two")
+        )
+        await session.commit()
+        await session.close()
+        assert await reads_primary(router, "website")
+
+    run(scenario)
+
+
+def test_unavailable_replica_falls_back(run):
+    async def scenario(router, factory):
+        await write(factory)
+        # the dead replica is skipped, then left out until retry_seconds pass
+        assert not await reads_primary(router, "bot")
+        assert not await reads_primary(router, "bot")
+        dead = router.stats()["replicas"][0]
+        assert dead["reads"] == 0 and dead["down_for"] > 0
+
+    run(scenario, replicas=2)
+
+
+def test_no_replica_left_reads_primary(run):
+    async def scenario(router, factory):
+        # only the dead one
+        router.replicas = router.replicas[:1]
+        await write(factory)
+        assert await reads_primary(router, "bot")
+
+    run(scenario, replicas=2)
@@ -0,0 +1,158 @@
+"""ResponseCache on the in-process MemoryBackend"""
+
+import asyncio
+from time import monotonic
+
+from extra.response_cache import MemoryBackend, ResponseCache, scope_tag
+from fastapi import Request, Response
+
+PATH = "/api/info/teachers/all"
+SCHOOL = scope_tag("school", 1)
+
+
+def request(query: str = "school_id=1", **headers: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": PATH,
+            "query_string": query.encode(),
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+class Handler:
+    """Route answering with the current `body`, `during` runs while it
+    computes the response"""
+
+    def __init__(self, body: bytes = b'{"data":[]}', etag: str = None):
+        self.body = body
+        self.etag = etag
+        self.calls = 0
+        self.during = None
+
+    async def __call__(self, request: Request) -> Response:
+        self.calls += 1
+        body = self.body
+        if self.during is not None:
+            await self.during()
+        response = Response(content=body, media_type="application/json")
+        if self.etag is not None:
+            response.headers["ETag"] = self.etag
+        return response
+
+
+def make_cache() -> ResponseCache:
+    return ResponseCache(MemoryBackend(), ttl=60, lock_seconds=1)
+
+
+async def served_from(cache: ResponseCache, handler, query: str = "school_id=1"):
+    return (await cache.serve(PATH, request(query), handler)).headers["X-Cache"]
+
+
+def test_second_request_is_a_hit():
+    async def main():
+        cache, handler = make_cache(), Handler(etag='"1.3"')
+        first = await cache.serve(PATH, request(), handler)
+        second = await cache.serve(PATH, request(), handler)
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert second.body == first.body
+        # the ETag is the one of the stored body
+        assert second.headers["ETag"] == '"1.3"'
+        assert handler.calls == 1
+        assert cache.stats()["hits"] == 1
+
+    asyncio.run(main())
+
+
+def test_invalidation_drops_only_its_tag():
+    async def main():
+        cache, handler = make_cache(), Handler()
+        await cache.serve(PATH, request(), handler)
+        await cache.serve(PATH, request("school_id=2"), handler)
+        await cache.backend.invalidate([SCHOOL])
+        assert await served_from(cache, handler) == "MISS"
+        assert await served_from(cache, handler, "school_id=2") == "HIT"
+
+    asyncio.run(main())
+
+
+def test_response_read_before_an_invalidation_is_not_served():
+    async def main():
+        cache, handler = make_cache(), Handler(body=b'{"data":["old"]}')
+
+        async def commit():
+            # a write commits and invalidates while the old rows are serialized
+            handler.body = b'{"data":["new"]}'
+            await cache.backend.invalidate([SCHOOL])
+
+        handler.during = commit
+        stale = await cache.serve(PATH, request(), handler)
+        assert stale.body == b'{"data":["old"]}'
+
+        handler.during = None
+        fresh = await cache.serve(PATH, request(), handler)
+        assert fresh.headers["X-Cache"] == "MISS"
+        assert fresh.body == b'{"data":["new"]}'
+        assert (await cache.serve(PATH, request(), handler)).body == fresh.body
+
+    asyncio.run(main())
+
+
+def test_concurrent_misses_compute_once():
+    async def main():
+        cache, handler = make_cache(), Handler()
+
+        async def slow():
+            await asyncio.sleep(0.1)
+
+        handler.during = slow
+        responses = await asyncio.gather(
+            *(cache.serve(PATH, request(), handler) for _ in range(5))
+        )
+        assert handler.calls == 1
+        assert sorted(response.headers["X-Cache"] for response in responses) == [
+            "HIT"
+        ] * 4 + ["MISS"]
+
+    asyncio.run(main())
+
+
+def test_errors_are_not_stored():
+    async def main():
+        cache = make_cache()
+
+        async def missing(request: Request) -> Response:
+            return Response(status_code=404)
+
+        await cache.serve(PATH, request(), missing)
+        assert await served_from(cache, Handler()) == "MISS"
+
+    asyncio.run(main())
+
+
+def test_concurrent_misses_of_an_error_do_not_wait_for_the_lock():
+    async def main():
+        cache = make_cache()
+        calls = []
+
+        async def missing(request: Request) -> Response:
+            calls.append(request)
+            await asyncio.sleep(0.1)
+            return Response(status_code=404)
+
+        start = monotonic()
+        responses = await asyncio.gather(
+            *(cache.serve(PATH, request(), missing) for _ in range(5))
+        )
+        assert [response.status_code for response in responses] == [404] * 5
+        assert len(calls) == 5
+        # the waiters compute once the first miss released the lock
+        assert monotonic() - start < cache.lock_seconds / 2
+
+    asyncio.run(main())
@@ -0,0 +1,49 @@
+"""StatsRollup recounting committed schools in the background"""
+
+import asyncio
+
+from extra.stats_rollup import StatsRollup, rollup
+from models import database
+from sqlalchemy import func
+from sqlalchemy.future import select
+
+DELAY = 0.1
+
+
+def test_commit_is_recounted_after_it_returns(open_database, session_class):
+    async def main():
+        async with open_database() as factory:
+            stats = StatsRollup(DELAY)
+            stats.session_factory = factory
+            stats.refresh_on_commit(session_class)
+            stats.start()
+
+            async def counted() -> int:
+                async with factory() as session:
+                    return await session.scalar(
+                        select(func.count()).select_from(rollup)
+                    )
+
+            try:
+                async with factory() as session:
+                    school = database.School(name="Test School Number One")
+                    teacher = database.Teacher(name="Ivanov Ivan", school=school)
+                    account = database.Account(telegram_id=1, premium_status=0)
+                    account.roles.append(
+                        database.Role(
+                            is_main_role=True,
+                            role_type=database.RoleEnum.TEACHER,
+                            teacher=teacher,
+                        )
+                    )
+                    session.add(account)
+                    await session.commit()
+                # the commit returned before any statement of the recount
+                assert await counted() == 0
+                await asyncio.sleep(DELAY * 3)
+                assert stats.refreshes == 1
+                assert await counted() > 0
+            finally:
+                await stats.stop()
+
+    asyncio.run(main())
@@ -0,0 +1,29 @@
+"""Timetable CSV parsing"""
+
+import pytest
+from fastapi import HTTPException
+from routers.webapi.timetable import CSV_COLUMNS, parse_timetable_csv
+
+HEADER = ",".join(CSV_COLUMNS)
+ROW = "1,1,08:00,08:45,Math,Ivanov Ivan,math;algebra,101,1,Main,10A;10B/1"
+
+
+def test_rows_are_parsed():
+    timetable = parse_timetable_csv(1, f"{HEADER}\n{ROW}\n")
+    assert len(timetable.lessons) == 1
+    assert timetable.teachers[0].tags == ["math", "algebra"]
+    assert len(timetable.subclasses) == 2
+
+
+@pytest.mark.parametrize(
+    "content",
+    [
+        f"{HEADER}\n1,1,08:00\n",
+        f"{HEADER}\n{ROW}\n\0\n",
+        "day_of_week\n1\n",
+    ],
+)
+def test_invalid_csv_is_unprocessable(content):
+    with pytest.raises(HTTPException) as raised:
+        parse_timetable_csv(1, content)
+    assert raised.value.status_code == 422
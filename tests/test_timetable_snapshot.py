@@ -0,0 +1,68 @@
+"""TimetableSnapshots with a SQLite primary and a replica that lags behind it"""
+
+import asyncio
+
+import pytest
+from extra.timetable_snapshot import TimetableSnapshots
+from models import database
+
+PIN_SECONDS = 0.2
+
+
+@pytest.fixture
+def run(open_database):
+    def run(scenario):
+        async def main():
+            async with open_database("primary") as primary, open_database(
+                "replica"
+            ) as replica:
+                # the replica has not got the second version of the school yet
+                for factory, version in ((primary, 2), (replica, 1)):
+                    async with factory() as session:
+                        session.add(
+                            database.School(
+                                name="Test School Number One", data_version=version
+                            )
+                        )
+                        await session.commit()
+                snapshots = TimetableSnapshots(PIN_SECONDS, PIN_SECONDS)
+                snapshots.session_factory = primary
+                await scenario(snapshots, replica)
+
+        asyncio.run(main())
+
+    return run
+
+
+async def version(snapshots: TimetableSnapshots, replica) -> int:
+    async with replica() as session:
+        return (await snapshots.get(session, 1)).version
+
+
+def test_snapshot_is_built_from_the_read_session(run):
+    async def scenario(snapshots, replica):
+        assert await version(snapshots, replica) == 1
+
+    run(scenario)
+
+
+def test_changed_school_is_built_from_the_primary(run):
+    async def scenario(snapshots, replica):
+        assert await version(snapshots, replica) == 1
+        snapshots.invalidate(1)
+        assert await version(snapshots, replica) == 2
+        assert snapshots.builds == 2
+
+        # expired together with the pin
+        await asyncio.sleep(PIN_SECONDS * 1.5)
+        assert await version(snapshots, replica) == 1
+
+    run(scenario)
+
+
+def test_changes_of_every_school_go_to_the_primary(run):
+    async def scenario(snapshots, replica):
+        snapshots.invalidate()
+        assert await version(snapshots, replica) == 2
+
+    run(scenario)
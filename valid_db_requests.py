@@ -1,17 +1,49 @@
 # pyright: reportUnknownMemberType=false
 
+from typing import Tuple
+
 from config import LOGGER_CONFIG
 from extra.custom_logger import CustomizeLogger
+from extra.eager_loading import load_options
+from extra.entity_cache import ENTITY_CACHE
 from fastapi import HTTPException
 from models import database
-from sqlalchemy.orm.session import Session
+from models.bot import item, telegram
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm.interfaces import LoaderOption
 
 logger = CustomizeLogger.make_logger(LOGGER_CONFIG)
 
+# Relationships can not be lazy loaded from async code, so everything a response
+# model walks through is loaded together with the queried objects
+
+TEACHER_OPTIONS = load_options(database.Teacher, item.Teacher)
+CABINET_OPTIONS = load_options(database.Cabinet, item.Cabinet)
+LESSON_OPTIONS = load_options(database.Lesson, item.Lesson)
+ACCOUNT_OPTIONS = load_options(database.Account, telegram.outgoing.Account)
+
+
+async def get_by_id(
+    session: AsyncSession, entity: type, uid: int, options: Tuple[LoaderOption, ...]
+):
+    """Row of `entity` with id `uid` or None, lookups without loader options are
+    served by ENTITY_CACHE"""
+    if options:
+        return await session.scalar(
+            select(entity).filter_by(id=uid).options(*options).limit(1)
+        )
+    generation = ENTITY_CACHE.generation
+    instance = await ENTITY_CACHE.get(session, entity, uid)
+    if instance is None:
+        instance = await session.scalar(select(entity).filter_by(id=uid).limit(1))
+        ENTITY_CACHE.put(instance, generation)
+    return instance
+
 
-def get_school_by_name(session: Session, name: str) -> database.School:
+async def get_school_by_name(session: AsyncSession, name: str) -> database.School:
     logger.debug(f"Searching school with name {name}")
-    school = session.query(database.School).filter_by(name=name).first()
+    school = await session.scalar(select(database.School).filter_by(name=name).limit(1))
     if school is None:
         logger.debug(
             f"Raised an exception because school with name {name} does not exist"
@@ -24,9 +56,11 @@ def get_school_by_name(session: Session, name: str) -> database.School:
     return school
 
 
-def get_school_by_id(session: Session, uid: int) -> database.School:
+async def get_school_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.School:
     logger.debug(f"Searching school with id {uid}")
-    school = session.query(database.School).filter_by(id=uid).first()
+    school = await get_by_id(session, database.School, uid, options)
     if school is None:
         logger.debug(
             f"Raised an exception because school with id {uid} does not exists"
@@ -39,9 +73,13 @@ def get_school_by_id(session: Session, uid: int) -> database.School:
     return school
 
 
-def get_tag_by_id(session: Session, uid: int) -> database.Tag:
+async def get_tag_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Tag:
     logger.debug(f"Searching tag with id {uid}")
-    tag = session.query(database.Tag).filter_by(id=uid).first()
+    tag = await session.scalar(
+        select(database.Tag).filter_by(id=uid).options(*options).limit(1)
+    )
     if tag is None:
         logger.debug(f"Raised an exception because tag with id {uid} does not exists")
         raise HTTPException(
@@ -52,9 +90,11 @@ def get_tag_by_id(session: Session, uid: int) -> database.Tag:
     return tag
 
 
-def get_corpus_by_id(session: Session, uid: int) -> database.Corpus:
+async def get_corpus_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Corpus:
     logger.debug(f"Searchin corpus with id {uid}")
-    corpus = session.query(database.Corpus).filter_by(id=uid).first()
+    corpus = await get_by_id(session, database.Corpus, uid, options)
     if corpus is None:
         logger.debug(
             f"Raised an exception because corpus with id {uid} does not exists"
@@ -67,9 +107,11 @@ def get_corpus_by_id(session: Session, uid: int) -> database.Corpus:
     return corpus
 
 
-def get_teacher_by_id(session: Session, uid: int) -> database.Teacher:
+async def get_teacher_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Teacher:
     logger.debug(f"Searching for teacher with id {uid}")
-    teacher = session.query(database.Teacher).filter_by(id=uid).first()
+    teacher = await get_by_id(session, database.Teacher, uid, options)
     if teacher is None:
         logger.debug("Raised an exception because teacher with id {id} does not exists")
         raise HTTPException(
@@ -80,14 +122,12 @@ def get_teacher_by_id(session: Session, uid: int) -> database.Teacher:
     return teacher
 
 
-def get_teacher_by_name(
-    session: Session, name: str, school_id: int
+async def get_teacher_by_name(
+    session: AsyncSession, name: str, school_id: int
 ) -> database.Teacher:
     logger.debug(f"Searching for teacher with name {name}")
-    teacher = (
-        session.query(database.Teacher)
-        .filter_by(name=name, school_id=school_id)
-        .first()
+    teacher = await session.scalar(
+        select(database.Teacher).filter_by(name=name, school_id=school_id).limit(1)
     )
     if teacher is None:
         logger.debug(
@@ -100,9 +140,11 @@ def get_teacher_by_name(
     return teacher
 
 
-def get_lesson_number_by_id(session: Session, uid: int) -> database.Lesson_number:
+async def get_lesson_number_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Lesson_number:
     logger.debug(f"Searching for lesson_number with id {uid}")
-    lesson_number = session.query(database.Lesson_number).filter_by(id=uid).first()
+    lesson_number = await get_by_id(session, database.Lesson_number, uid, options)
     if lesson_number is None:
         logger.debug(
             f"Raised an exception because lesson number with id {uid} does not exists"
@@ -115,9 +157,11 @@ def get_lesson_number_by_id(session: Session, uid: int) -> database.Lesson_numbe
     return lesson_number
 
 
-def get_subclass_by_id(session: Session, uid: int) -> database.Subclass:
+async def get_subclass_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Subclass:
     logger.debug(f"Searching for subclass with id {uid}")
-    subclass = session.query(database.Subclass).filter_by(id=uid).first()
+    subclass = await get_by_id(session, database.Subclass, uid, options)
     if subclass is None:
         logger.debug(
             f"Raised an exception because subclass with id {uid} does not exists"
@@ -129,8 +173,8 @@ def get_subclass_by_id(session: Session, uid: int) -> database.Subclass:
     return subclass
 
 
-def get_subclass_by_params(
-    session: Session,
+async def get_subclass_by_params(
+    session: AsyncSession,
     school_id: int,
     educational_level: int,
     identificator: str,
@@ -139,15 +183,15 @@ def get_subclass_by_params(
     logger.debug(
         f"Searching for subclass with params {educational_level=} {identificator=} {additional_identificator=} in school with {school_id=}"
     )
-    subclass = (
-        session.query(database.Subclass)
+    subclass = await session.scalar(
+        select(database.Subclass)
         .filter_by(
             school_id=school_id,
             educational_level=educational_level,
             identificator=identificator,
             additional_identificator=additional_identificator,
         )
-        .first()
+        .limit(1)
     )
     if subclass is None:
         logger.debug(
@@ -163,9 +207,11 @@ def get_subclass_by_params(
     return subclass
 
 
-def get_cabinet_by_id(session: Session, uid: int) -> database.Cabinet:
+async def get_cabinet_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Cabinet:
     logger.debug(f"Searching for cabinter with id {uid}")
-    cabinet = session.query(database.Cabinet).filter_by(id=uid).first()
+    cabinet = await get_by_id(session, database.Cabinet, uid, options)
     if cabinet is None:
         logger.debug(
             f"Raised an exception because cabinet with id {uid} does not exists"
@@ -177,9 +223,11 @@ def get_cabinet_by_id(session: Session, uid: int) -> database.Cabinet:
     return cabinet
 
 
-def check_unique_account_by_telegram_id(session: Session, telegram_id: int):
+async def check_unique_account_by_telegram_id(session: AsyncSession, telegram_id: int):
     logger.debug(f"Searching account with telegram id {telegram_id}")
-    account = session.query(database.Account).filter_by(telegram_id=telegram_id).first()
+    account = await session.scalar(
+        select(database.Account).filter_by(telegram_id=telegram_id).limit(1)
+    )
 
     if account is not None:
         logger.debug(
@@ -192,9 +240,13 @@ def check_unique_account_by_telegram_id(session: Session, telegram_id: int):
     logger.debug(f"Account with telegram id {telegram_id} does not exists")
 
 
-def get_lesson_by_id(session: Session, uid: int) -> database.Lesson:
+async def get_lesson_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Lesson:
     logger.debug(f"Searching lesson with id {uid}")
-    lesson = session.query(database.Lesson).filter_by(id=uid).first()
+    lesson = await session.scalar(
+        select(database.Lesson).filter_by(id=uid).options(*options).limit(1)
+    )
 
     if lesson is None:
         logger.debug(
@@ -207,9 +259,18 @@ def get_lesson_by_id(session: Session, uid: int) -> database.Lesson:
     return lesson
 
 
-def get_account_by_telegram_id(session: Session, telegram_id: int) -> database.Account:
+async def get_account_by_telegram_id(
+    session: AsyncSession, telegram_id: int
+) -> database.Account:
     logger.debug(f"Searching account with telegram id {telegram_id}")
-    account = session.query(database.Account).filter_by(telegram_id=telegram_id).first()
+    # populate_existing: handlers reload the account after commit to serialize it
+    account = await session.scalar(
+        select(database.Account)
+        .filter_by(telegram_id=telegram_id)
+        .options(*ACCOUNT_OPTIONS)
+        .execution_options(populate_existing=True)
+        .limit(1)
+    )
 
     if account is None:
         logger.debug(
@@ -224,9 +285,13 @@ def get_account_by_telegram_id(session: Session, telegram_id: int) -> database.A
     return account
 
 
-def get_role_by_id(session: Session, uid: int) -> database.Role:
+async def get_role_by_id(
+    session: AsyncSession, uid: int, *options: LoaderOption
+) -> database.Role:
     logger.debug(f"Searching role with id {uid}")
-    role = session.query(database.Role).filter_by(id=uid).first()
+    role = await session.scalar(
+        select(database.Role).filter_by(id=uid).options(*options).limit(1)
+    )
 
     if role is None:
         logger.debug(
@@ -241,9 +306,31 @@ def get_role_by_id(session: Session, uid: int) -> database.Role:
     return role
 
 
-def get_tag_by_label(session: Session, label: str) -> database.Tag:
+async def get_announcement_job_by_id(
+    session: AsyncSession, uid: int
+) -> database.Announcement_job:
+    logger.debug(f"Searching announcement job with id {uid}")
+    # progress changes all the time, never served by ENTITY_CACHE
+    job = await session.scalar(
+        select(database.Announcement_job).filter_by(id=uid).limit(1)
+    )
+
+    if job is None:
+        logger.debug(
+            f"Raised an exception because announcement job with id {uid} does not exists"
+        )
+        raise HTTPException(
+            status_code=404,
+            detail=f"Announcement job with id {uid} does not exist",
+        )
+    logger.debug(f"Successfully found announcement job with id {uid}")
+
+    return job
+
+
+async def get_tag_by_label(session: AsyncSession, label: str) -> database.Tag:
     logger.debug(f"Searching tag with label {label}")
-    tag = session.query(database.Tag).filter_by(label=label).first()
+    tag = await session.scalar(select(database.Tag).filter_by(label=label).limit(1))
 
     if tag is None:
         logger.debug(